@@ -0,0 +1,148 @@
+"""
+Compilation of many programs at once.
+
+`--compile` with several sources, or with a directory, writes an object file
+for every program into an output directory. Directories are searched for .raw
+files, and the tree below them is kept in the output. Programs are compiled
+across a pool of processes, and ones whose object file is newer than the
+source are skipped.
+
+`binarypp opt` rewrites a single program, compiled or not, without the code
+and markers it can do without.
+"""
+
+import os
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import binarypp.logging as logging
+import binarypp.objfile as objfile
+from binarypp.parser import is_object_file, parse_file
+from binarypp.vm import VirtualMachine
+
+SOURCE_EXTENSION = ".raw"
+OBJECT_EXTENSION = ".bin"
+
+
+def compile_file(source: str, output: str, flags: Namespace) -> None:
+    """
+    Compiles a program into an object file. The parsed program is loaded the
+    same way it would be run, and written out as it is.
+    """
+    vm = VirtualMachine(source, flags)
+    vm.load_stream(0, parse_file(source))
+    objfile.write(output, vm.frames[0])
+
+
+def optimize(source: str, output: str, exported: bool = False) -> Tuple[int, int]:
+    """
+    Loads a program again with every marker that is never jumped to removed,
+    along with the code only they made reachable, and writes it to an object
+    file. Modules are exported to keep the markers other programs jump to.
+    Returns the number of instructions before and after.
+    """
+    if is_object_file(source):
+        obj = objfile.ObjectFile(source)
+        if obj.modules():
+            logging.error(
+                "'{}' has modules linked into it. Optimize it before linking".format(
+                    source
+                )
+            )
+        stream = obj.instructions()
+    else:
+        # Sources are read the way the VM reads them
+        stream = parse_file(source)
+
+    vm = VirtualMachine(source, Namespace(step=None))
+    vm.load_stream(0, stream, exported)
+    image = objfile.encode(vm.frames[0])
+
+    with open(output, "wb") as file:
+        file.write(image)
+    return len(stream), len(vm.frames[0].stream)
+
+
+def targets(sources: List[str], output: str) -> List[Tuple[str, str]]:
+    """
+    Returns the source and object file of every program to compile.
+    """
+    pairs = []
+    for source in sources:
+        if not os.path.isdir(source):
+            name = os.path.splitext(os.path.basename(source))[0]
+            pairs.append((source, os.path.join(output, name + OBJECT_EXTENSION)))
+            continue
+
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                name, extension = os.path.splitext(filename)
+                if extension != SOURCE_EXTENSION:
+                    continue
+
+                relative = os.path.relpath(dirpath, source)
+                target = os.path.join(output, relative, name + OBJECT_EXTENSION)
+                pairs.append(
+                    (os.path.join(dirpath, filename), os.path.normpath(target))
+                )
+
+    return pairs
+
+
+def up_to_date(source: str, output: str) -> bool:
+    if not os.path.exists(output):
+        return False
+    return os.stat(output).st_mtime_ns >= os.stat(source).st_mtime_ns
+
+
+def build(
+    sources: List[str], output: str, flags: Namespace, jobs: Optional[int] = None
+) -> int:
+    """
+    Compiles the programs of the sources into the output directory with jobs
+    processes, by default one for each CPU. Returns the number of programs
+    that failed to compile.
+    """
+    programs = targets(sources, output)
+    pairs = [pair for pair in programs if not up_to_date(*pair)]
+    for _, target in pairs:
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+
+    if jobs == 1 or len(pairs) <= 1:
+        results = [job(source, target, flags) for source, target in pairs]
+    else:
+        with ProcessPoolExecutor(jobs) as pool:
+            futures = [pool.submit(job, *pair, flags) for pair in pairs]
+            results = [future.result() for future in futures]
+
+    failures = results.count(False)
+    logging.success(
+        "Compiled {} programs, {} were up to date".format(
+            len(pairs) - failures, len(programs) - len(pairs)
+        )
+    )
+    return failures
+
+
+def job(source: str, target: str, flags: Namespace) -> bool:
+    """
+    Compiles a program and reports whether it worked.
+    """
+    try:
+        compile_file(source, target, flags)
+        return True
+    except OSError as error:
+        logging.error("Could not compile '{}': {}".format(source, error), False)
+    except SystemExit:
+        # The parser printed the error before it exited
+        logging.error("Could not compile '{}'".format(source), False)
+    except (ValueError, IndexError) as error:
+        # Programs the parser can't make sense of, like empty ones
+        logging.error("Could not compile '{}': {!r}".format(source, error), False)
+
+    # A partly written object file must not look up to date
+    if os.path.exists(target):
+        os.unlink(target)
+    return False
@@ -1,20 +1,35 @@
 import argparse
 import os
 import sys
+from typing import TYPE_CHECKING, List, Optional
 
 import binarypp
 import binarypp.logging as logging
-import binarypp.parser
-import binarypp.utils as utils
-from binarypp.vm import VirtualMachine
+
+# Only what running a program needs is imported up front. The VM is imported
+# once a program runs, and the rest when the option using it is given.
+if TYPE_CHECKING:
+    from binarypp.types import Instruction
 
 
 def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(binarypp.__name__)
     parser.add_argument(
         "--compile",
         "-c",
-        help="Compiles the supplied file and writes to the target file.",
+        help="Compiles the supplied file and writes to the target file. With "
+        "several files or a directory, the target is a directory.",
+        nargs="+",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        help="Processes compiling several files. Defaults to one per CPU.",
+        type=int,
     )
     parser.add_argument(
         "--verbose",
@@ -29,6 +44,125 @@ def main() -> None:
         help="Runs the code step by step.",
         action="store_true",
     )
+    parser.add_argument(
+        "--ir",
+        help="Runs straight-line code through a register IR.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--dump-ir",
+        help="Prints the register IR of each frame. Implies --ir.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--lazy",
+        help="Parses the program as it runs instead of before. Ignores --ir.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--jit-threshold",
+        help="Runs of a loop before it is compiled by the JIT.",
+        type=int,
+        default=100,
+    )
+    parser.add_argument(
+        "--jit-dump",
+        help="Prints the code of each loop compiled by the JIT.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-jit",
+        help="Disables the JIT.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-prefetch",
+        help="Reads modules when they are imported instead of while the "
+        "program starts.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--int-width",
+        help="Makes integer arithmetic wrap around at this many bits.",
+        type=int,
+        choices=(8, 16, 32, 64),
+    )
+    parser.add_argument(
+        "--typed-stack",
+        help="Keeps integers on the stack in an array of 64-bit cells, which "
+        "takes less memory for deep stacks. Other values turn it into a list.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--max-stack",
+        help="Most values the stack may hold.",
+        type=int,
+    )
+    parser.add_argument(
+        "--max-memory",
+        help="Most memory cells each frame may use.",
+        type=int,
+    )
+    parser.add_argument(
+        "--max-instructions",
+        help="Most instructions the program may run. Disables the JIT.",
+        type=int,
+    )
+    parser.add_argument(
+        "--max-files",
+        help="Most files the program may open.",
+        type=int,
+    )
+    parser.add_argument(
+        "--open-files",
+        help="Most files kept open at once. Others are reopened when used.",
+        type=int,
+        default=64,
+    )
+    parser.add_argument(
+        "--stats",
+        help="Prints statistics of the run as JSON to stderr at exit.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--stats-file",
+        help="Writes the statistics to a file instead. Implies --stats.",
+    )
+    parser.add_argument(
+        "--trace",
+        help="Writes a record of every instruction run to a file, gzipped if it "
+        "ends in .gz. Read it with 'binarypp trace'. Disables the JIT.",
+    )
+    parser.add_argument(
+        "--repl",
+        help="Runs instructions as they are typed in, after the file if given.",
+        action="store_true",
+    )
+    inputs = parser.add_mutually_exclusive_group()
+    inputs.add_argument(
+        "--record",
+        help="Writes everything the program reads from stdin and files to a "
+        "file when it ends.",
+    )
+    inputs.add_argument(
+        "--replay",
+        help="Serves what the program reads from a file written by --record, "
+        "without reading stdin or opening files to read them.",
+    )
+    parser.add_argument(
+        "--serve",
+        help="Runs a daemon that runs programs for --client.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--client",
+        help="Runs the program on the daemon started with --serve.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--socket",
+        help="Socket of the daemon. Defaults to one in the temporary directory.",
+    )
     parser.add_argument(
         "--version",
         "-V",
@@ -37,12 +171,33 @@ def main() -> None:
     )
     parser.add_argument("FILE", help="Target file.", nargs="?")
     args = parser.parse_args()
+    args.ir = args.ir or args.dump_ir
+    args.stats = args.stats or args.stats_file is not None
 
     # Version flag takes priority
     if args.version:
         print("Binary++", binarypp.__version__)
         sys.exit(0)
 
+    if args.repl:
+        import binarypp.repl as repl
+
+        if args.FILE and not os.path.isfile(args.FILE):
+            logging.error("'{}' does not exist!".format(args.FILE))
+        repl.Repl(args, args.FILE).run()
+        return
+
+    if args.serve:
+        import binarypp.client as client
+        import binarypp.server as server
+
+        server.Server(args.socket or client.default_socket()).serve_forever()
+        return
+
+    # Like cp, the last of several files to compile is the target
+    if args.compile and not args.FILE and len(args.compile) > 1:
+        args.FILE = args.compile.pop()
+
     # Check if file argument is missing
     if not args.FILE:
         if args.compile:
@@ -50,6 +205,18 @@ def main() -> None:
         else:
             logging.error("No file was supplied :(")
 
+    if args.compile and (len(args.compile) > 1 or os.path.isdir(args.compile[0])):
+        for source in args.compile:
+            if not os.path.exists(source):
+                logging.error("'{}' does not exist!".format(source))
+
+        import binarypp.build as build
+
+        sys.exit(1 if build.build(args.compile, args.FILE, args, args.jobs) else 0)
+
+    if args.compile:
+        args.compile = args.compile[0]
+
     # Check if file does not exist
     target_file = args.compile if args.compile else args.FILE
     if not os.path.isfile(target_file):
@@ -63,6 +230,8 @@ def main() -> None:
             files.extend(filenames)
             break
 
+        import binarypp.utils as utils
+
         match = utils.fuzzy_search(os.path.basename(target_file), files)
 
         if match is not None:
@@ -86,23 +255,10 @@ def main() -> None:
             logging.error("'{}' does not exist! Are you in the right directory?")
 
     if args.compile:
-        with open(args.compile, "r", encoding="utf-8") as file:
-            code = file.read()
-
-        # Check for missing args
-        binarypp.parser.parse(code)
-
-        # Strip away the interpret flag if present
-        if code.startswith("00000000"):
-            code = code[8:]
-
-        compiled_code = utils.binary_to_chars(
-            list(filter(utils.is_binary, code.split()))
-        )
+        import binarypp.build as build
 
         try:
-            with open(args.FILE, "w+", encoding="latin1") as file:
-                file.write(compiled_code)
+            build.compile_file(args.compile, args.FILE, args)
 
             logging.success("Successfully compiled the program")
         except PermissionError:
@@ -111,9 +267,160 @@ def main() -> None:
                 "by running 'chmod +w {}'".format(args.FILE)
             )
 
+    elif args.client:
+        # The client leaves the VM to the daemon, and doesn't import it
+        import binarypp.client as client
+
+        sys.exit(client.request(args.socket or client.default_socket(), args))
+
     else:
-        with open(args.FILE, "r", encoding="latin1") as file:
-            code = file.read()
+        run(args)
+
+
+def run(args: argparse.Namespace, stream: Optional[List["Instruction"]] = None) -> None:
+    """
+    Runs the program of the arguments, or an already parsed stream of it.
+    """
+    from binarypp.vm import VirtualMachine
+
+    vm = VirtualMachine(args.FILE, args)
+    try:
+        if stream is None:
+            vm.load_file(0, args.FILE)
+        else:
+            vm.load_stream(0, stream)
+        vm.main_loop()
+    finally:
+        if args.stats:
+            write_stats(args.stats_file, vm.stats.to_json())
+
+
+def write_stats(path: Optional[str], stats: str) -> None:
+    """
+    Writes the statistics of a run to a file, or to stderr without one.
+    """
+    if path is None:
+        sys.stderr.write(stats + "\n")
+    else:
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(stats + "\n")
+
+
+def link(argv: List[str]) -> None:
+    """
+    Links a program and the modules it imports into one object file.
+    """
+    parser = argparse.ArgumentParser(f"{binarypp.__name__} link")
+    parser.add_argument(
+        "--output",
+        "-o",
+        help="Target file. Defaults to the program with a .bin extension.",
+    )
+    parser.add_argument("FILE", help="Program to link.")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.FILE):
+        logging.error(
+            "'{}' does not exist! Are you in the right directory?".format(args.FILE)
+        )
+
+    import binarypp.linker as linker
+
+    output = args.output or os.path.splitext(args.FILE)[0] + ".bin"
+    image = linker.link(args.FILE)
+
+    try:
+        with open(output, "wb") as file:
+            file.write(image)
+
+        logging.success("Successfully linked the program")
+    except PermissionError:
+        logging.error(
+            "Could not write to file. You might need to make it writable"
+            "by running 'chmod +w {}'".format(output)
+        )
+
+
+def dis(argv: List[str]) -> None:
+    """
+    Lists the instructions of a program, compiled or not.
+    """
+    parser = argparse.ArgumentParser(f"{binarypp.__name__} dis")
+    parser.add_argument("FILE", help="Program to list.")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.FILE):
+        logging.error(
+            "'{}' does not exist! Are you in the right directory?".format(args.FILE)
+        )
+
+    import binarypp.disassembler as disassembler
+
+    print(disassembler.listing(args.FILE))
+
+
+def opt(argv: List[str]) -> None:
+    """
+    Writes a program without the code and markers it can do without to an
+    object file.
+    """
+    parser = argparse.ArgumentParser(f"{binarypp.__name__} opt")
+    parser.add_argument(
+        "--output",
+        "-o",
+        help="Target file. Defaults to the program with a .bin extension.",
+    )
+    parser.add_argument(
+        "--module",
+        help="Keeps every marker, for programs that are imported by others.",
+        action="store_true",
+    )
+    parser.add_argument("FILE", help="Program to optimize, compiled or not.")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.FILE):
+        logging.error(
+            "'{}' does not exist! Are you in the right directory?".format(args.FILE)
+        )
+
+    import binarypp.build as build
+
+    output = args.output or os.path.splitext(args.FILE)[0] + ".bin"
+    try:
+        before, after = build.optimize(args.FILE, output, args.module)
+    except PermissionError:
+        logging.error(
+            "Could not write to file. You might need to make it writable"
+            "by running 'chmod +w {}'".format(output)
+        )
+
+    logging.success(
+        "Optimized the program from {} to {} instructions".format(before, after)
+    )
+
+
+def conform(argv: List[str]) -> None:
+    """
+    Checks that every way to run a program gives the same result.
+    """
+    import binarypp.conformance as conformance
+
+    conformance.main(argv)
+
+
+def trace(argv: List[str]) -> None:
+    """
+    Summarizes a trace written with --trace.
+    """
+    import binarypp.tracelog as tracelog
+
+    tracelog.main(argv)
+
 
-        vm = VirtualMachine(args.FILE, args)
-        vm.main_loop(binarypp.parser.parse(code))
+COMMANDS = {
+    "link": link,
+    "dis": dis,
+    "opt": opt,
+    "conform": conform,
+    "trace": trace,
+}
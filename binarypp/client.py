@@ -0,0 +1,100 @@
+"""
+Client of the daemon in binarypp.server.
+
+The client only needs the standard library, so it starts without importing
+the VM.
+"""
+
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+from argparse import Namespace
+
+import binarypp.logging as logging
+
+# Length of a request, which is JSON
+LENGTH = struct.Struct("<I")
+
+# Exit status of a request
+STATUS = struct.Struct("<i")
+
+# Flags that only matter to the client
+CLIENT_FLAGS = {"serve", "client", "socket"}
+
+
+def default_socket() -> str:
+    """
+    Returns the socket in a directory only this user can get into: the
+    runtime directory if there is one, or one in the temporary directory.
+    """
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime and os.path.isdir(runtime):
+        directory = os.path.join(runtime, "binarypp")
+    else:
+        directory = os.path.join(
+            tempfile.gettempdir(), "binarypp-{}".format(os.getuid())
+        )
+
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    stat = os.lstat(directory)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+        logging.error(
+            "{} must be a directory only you can use. Pick another socket with "
+            "--socket".format(directory)
+        )
+    return os.path.join(directory, "binarypp.sock")
+
+
+def check_owner(path: str) -> None:
+    """
+    Exits unless the socket belongs to this user, who would otherwise hand
+    their standard streams to another one.
+    """
+    try:
+        stat = os.lstat(path)
+    except OSError:
+        logging.error("No server is running at {}. Start one with --serve".format(path))
+    if stat.st_uid != os.getuid():
+        logging.error("{} belongs to another user".format(path))
+
+
+def request(path: str, flags: Namespace) -> int:
+    """
+    Runs a program on the daemon at a path, with the standard streams of this
+    process. Returns the exit status.
+    """
+    check_owner(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        logging.error("No server is running at {}. Start one with --serve".format(path))
+
+    data = json.dumps(
+        {
+            "file": flags.FILE,
+            "cwd": os.getcwd(),
+            "flags": {
+                name: value
+                for name, value in vars(flags).items()
+                if name not in CLIENT_FLAGS
+            },
+        }
+    ).encode()
+
+    sys.stdout.flush()
+    with sock:
+        socket.send_fds(sock, [LENGTH.pack(len(data)) + data], [0, 1, 2])
+
+        status = b""
+        while len(status) < STATUS.size:
+            chunk = sock.recv(STATUS.size - len(status))
+            if not chunk:
+                logging.error("The server stopped before the program ended")
+            status += chunk
+
+    (code,) = STATUS.unpack(status)
+    return int(code)
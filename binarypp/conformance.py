@@ -0,0 +1,567 @@
+"""
+Differential testing of the ways to run a program.
+
+The VM can run a program in several ways: the interpreter on its own, with
+the JIT, with the register IR, parsed lazily, with a typed stack, or compiled
+to an object file first, optimized or not. `binarypp conform` runs the same
+programs each way and checks that they print the same output and end with
+the same stack, memory and error as the interpreter does.
+
+The programs are the files given and random ones, made by a grammar over the
+instruction classes of binarypp.vm.opcodes. Random programs always end:
+jumps only skip forward over whole statements, and loops count down a cell
+that the rest of the program doesn't use. A random program that runs
+differently is shrunk to the statements it needs to, and printed the way
+they would be typed into the REPL. At the end, the time each way took is
+compared to the interpreter.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import binarypp
+import binarypp.build as build
+import binarypp.logging as logging
+import binarypp.vm.vm as machine
+from binarypp.types import Instruction
+from binarypp.vm.opcodes import *
+from binarypp.vm.opmap import OP_MAP
+
+
+def compiled(source: str, output: str) -> None:
+    build.compile_file(source, output, Namespace(step=None))
+
+
+def optimized(source: str, output: str) -> None:
+    build.optimize(source, output)
+
+
+# Name, flags and how the program is compiled before it runs, if it is
+Engine = Tuple[str, Dict[str, Any], Optional[Callable[[str, str], None]]]
+
+# The JIT compiles loops after two runs, so that short programs use it too
+ENGINES: List[Engine] = [
+    ("interpreter", {"no_jit": True}, None),
+    ("jit", {"jit_threshold": 2}, None),
+    ("ir", {"ir": True, "no_jit": True}, None),
+    ("ir+jit", {"ir": True, "jit_threshold": 2}, None),
+    ("lazy", {"lazy": True, "no_jit": True}, None),
+    ("typed-stack", {"typed_stack": True, "no_jit": True}, None),
+    ("object", {"no_jit": True}, compiled),
+    ("optimized", {"jit_threshold": 2}, optimized),
+]
+
+REFERENCE = "interpreter"
+
+
+class Outcome:
+    def __init__(
+        self, output: str, stack: List[Any], memory: List[Any], error: Optional[str]
+    ):
+        self.output: str = output
+        self.stack: List[Any] = stack
+        self.memory: List[Any] = memory
+        self.error: Optional[str] = error
+
+    def differences(self, other: "Outcome") -> List[str]:
+        """
+        Returns what ended up different in another run. After an error, only
+        the output and the error are compared: the IR and the JIT keep values
+        out of the stack and memory while they run, so both can be left in a
+        different state when an instruction fails.
+        """
+        names = ["output", "error"]
+        if self.error is None:
+            names[1:1] = ["stack", "memory"]
+
+        differences = []
+        for name in names:
+            mine, theirs = getattr(self, name), getattr(other, name)
+            if name in ("stack", "memory"):
+                mine, theirs = normalize(mine), normalize(theirs)
+            if repr(mine) != repr(theirs):
+                differences.append("{}: {!r} != {!r}".format(name, mine, theirs))
+        return differences
+
+
+def normalize(values: List[Any]) -> List[Any]:
+    """
+    Typed stacks and memory keep booleans as 0 and 1, and memory grows
+    when it is read, so neither counts as a difference.
+    """
+    values = [int(value) if type(value) is bool else value for value in values]
+    while values and values[-1] == 0 and type(values[-1]) is int:
+        values.pop()
+    return values
+
+
+def run(
+    path: str, engine: Engine, directory: str, text: str = ""
+) -> Tuple[Outcome, float]:
+    """
+    Runs a program one way with text as its input. Programs that are compiled
+    first are written to the directory. Returns how the program ended and how
+    long it took, leaving out compiling it.
+    """
+    name, flags, prepare = engine
+    output = io.StringIO()
+    errors = io.StringIO()
+    error = None
+
+    saved = machine.stdin, machine.stdout
+    machine.stdin, machine.stdout = io.StringIO(text), output
+    vm = machine.VirtualMachine(path, Namespace(step=None, **flags))
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stderr(errors):
+            if prepare is not None:
+                base = os.path.splitext(os.path.basename(path))[0]
+                target = os.path.join(directory, "{}.{}.bin".format(base, name))
+                prepare(path, target)
+                path = target
+                start = time.perf_counter()
+
+            vm.load_file(0, path)
+            vm.main_loop()
+    except SystemExit:
+        error = errors.getvalue().strip()
+    except Exception as exception:
+        # Operands aren't checked, so a program can make Python raise
+        error = type(exception).__name__
+    finally:
+        elapsed = time.perf_counter() - start
+        machine.stdin, machine.stdout = saved
+
+    memory = list(vm.frames[0].memory.memory)
+    return Outcome(output.getvalue(), list(vm.stack.stack), memory, error), elapsed
+
+
+#
+# Random programs
+#
+
+# Memory cells used by random statements. Loops count down the cells after.
+CELLS = 8
+
+# Instructions that only touch the stack, with the values they pop and push
+EFFECTS = {
+    POP_STACK: (1, 0),
+    DUP_TOP: (1, 2),
+    BINARY_NOT: (1, 1),
+    ROT_TWO: (2, 2),
+    ROT_THREE: (3, 3),
+    PUSH_STACK: (0, 1),
+    LOAD_MEMORY: (0, 1),
+    STORE_MEMORY: (1, 0),
+    PUSH_LONG_STACK: (0, 1),
+}
+for opcode in NO_ARG:
+    name = OP_MAP[opcode]
+    if name.startswith("BINARY_") and opcode not in EFFECTS:
+        EFFECTS[opcode] = (2, 1)
+    elif name.endswith(("EQUAL_TO", "THAN")):
+        EFFECTS[opcode] = (2, 1)
+
+# Instructions that make numbers grow fast only get a small second operand,
+# as do divisions most of the time. Loops don't raise to a power, and a
+# program does at most a few times.
+OPERANDS = {
+    BINARY_POWER: (0, 3),
+    BINARY_MULTIPLY: (0, 255),
+    BINARY_LEFT_SHIFT: (0, 8),
+    BINARY_TRUE_DIVIDE: (1, 255),
+    BINARY_FLOOR_DIVIDE: (1, 255),
+    BINARY_MODULO: (1, 255),
+}
+GROWING = {BINARY_POWER, BINARY_MULTIPLY, BINARY_LEFT_SHIFT}
+POWERS = 2
+
+# Most instructions made by a random program
+MAX_SIZE = 400
+
+
+class Skip:
+    def __init__(self, opcode: int, over: int):
+        """
+        IF_RUN_NEXT or SKIP_NEXT over a number of the statements after it.
+        """
+        self.opcode: int = opcode
+        self.over: int = over
+
+
+class Loop:
+    def __init__(self, marker: int, iterations: int, body: List["Statement"]):
+        self.marker: int = marker
+        self.iterations: int = iterations
+        self.body: List[Statement] = body
+
+    def flatten(self) -> List[Instruction]:
+        counter = CELLS + self.marker
+        code = [
+            Instruction(PUSH_STACK, [self.iterations]),
+            Instruction(STORE_MEMORY, [counter]),
+            Instruction(MAKE_MARKER, [self.marker]),
+        ]
+        code += flatten(self.body)
+        code += [
+            Instruction(LOAD_MEMORY, [counter]),
+            Instruction(PUSH_STACK, [1]),
+            Instruction(BINARY_SUBTRACT),
+            Instruction(DUP_TOP),
+            Instruction(STORE_MEMORY, [counter]),
+            Instruction(IF_RUN_NEXT, [1]),
+            Instruction(GOTO_MARKER, [self.marker]),
+        ]
+        return code
+
+
+Statement = Union[List[Instruction], Skip, Loop]
+
+
+def flatten(statements: List[Statement]) -> List[Instruction]:
+    code: List[Instruction] = []
+    for index, statement in enumerate(statements):
+        if isinstance(statement, Skip):
+            start = index + 1
+            end = start + statement.over
+            skipped = flatten(statements[start:end])
+            code.append(Instruction(statement.opcode, [len(skipped)]))
+        elif isinstance(statement, Loop):
+            code += statement.flatten()
+        else:
+            code += statement
+    return code
+
+
+def statement(rng: random.Random, depth: int, loop: bool) -> Tuple[Statement, int]:
+    """
+    Returns a random statement that fits a stack of the given depth, and the
+    depth after it. Statements in a loop don't grow values without bounds.
+    """
+    kind = rng.choice(
+        ["simple"] * 8 + ["forward", "region", "write", "skip", "operand"] * 2
+    )
+
+    if kind == "forward":
+        # The address comes from the stack
+        address = Instruction(PUSH_STACK, [rng.randint(1, CELLS)])
+        if depth and rng.random() < 0.5:
+            code = [address, Instruction(FORWARD_ARGS), Instruction(STORE_MEMORY)]
+            return code, depth - 1
+        code = [address, Instruction(FORWARD_ARGS), Instruction(LOAD_MEMORY)]
+        return code, depth + 1
+
+    if kind == "region":
+        # Regions stay within the cells of random statements
+        count = rng.randint(0, 4)
+
+        def start() -> int:
+            return rng.randint(1, CELLS - count + 1)
+
+        opcode = rng.choice([MEMORY_COPY, MEMORY_FILL, MEMORY_COMPARE, WRITE_REGION_TO])
+        if opcode == WRITE_REGION_TO:
+            operands = [start(), count]
+        elif opcode == MEMORY_FILL:
+            operands = [start(), count, rng.randint(0, 255)]
+        else:
+            operands = [start(), start(), count]
+
+        code = [Instruction(PUSH_STACK, [operand]) for operand in operands]
+        code.append(Instruction(opcode, [0] if opcode == WRITE_REGION_TO else []))
+        return code, depth + (opcode == MEMORY_COMPARE)
+
+    if kind == "write" and (not depth or rng.random() < 0.2):
+        # Strings are only written, since arithmetic on them fails
+        text = [rng.randint(32, 126) for _ in range(rng.randint(1, 4))]
+        code = [Instruction(PUSH_STRING_STACK, text), Instruction(WRITE_TO, [0])]
+        return code, depth
+
+    if kind == "write":
+        # Printable most of the time, but any value can be written
+        if rng.random() < 0.2:
+            return [Instruction(WRITE_TO, [0])], depth - 1
+        code = [
+            Instruction(PUSH_STACK, [64]),
+            Instruction(BINARY_MODULO),
+            Instruction(PUSH_STACK, [48]),
+            Instruction(BINARY_ADD),
+            Instruction(WRITE_TO, [0]),
+        ]
+        return code, depth - 1
+
+    if kind == "skip" and depth:
+        opcode = rng.choice([IF_RUN_NEXT, SKIP_NEXT])
+        return Skip(opcode, rng.randint(0, 2)), depth - (opcode == IF_RUN_NEXT)
+
+    if kind == "operand" and depth:
+        opcode = rng.choice([op for op in OPERANDS if op != BINARY_POWER or not loop])
+        operand = Instruction(PUSH_STACK, [rng.randint(*OPERANDS[opcode])])
+        return [operand, Instruction(opcode)], depth
+
+    opcodes = [
+        opcode
+        for opcode, (pops, _) in EFFECTS.items()
+        if pops <= depth and opcode not in GROWING
+    ]
+    opcode = rng.choice(opcodes)
+    pops, pushes = EFFECTS[opcode]
+
+    args: List[int] = []
+    if opcode == PUSH_STACK:
+        args = [rng.randint(0, 255)]
+    elif opcode in (LOAD_MEMORY, STORE_MEMORY):
+        args = [rng.randint(1, CELLS)]
+    elif opcode == PUSH_LONG_STACK:
+        args = [rng.randint(1, 255) for _ in range(rng.randint(1, 3))]
+    return [Instruction(opcode, args)], depth - pops + pushes
+
+
+def generate(rng: random.Random, size: int = 20) -> List[Statement]:
+    """
+    Returns a random program of about size statements.
+    """
+    statements: List[Statement] = []
+    depth = 0
+    markers = 0
+    powers = 0
+    while len(statements) < size:
+        if markers < 3 and rng.random() < 0.1:
+            markers += 1
+            body: List[Statement] = []
+            start = depth
+            for _ in range(rng.randint(1, 6)):
+                part, depth = statement(rng, depth, True)
+                body.append(part)
+
+            # Every run of the body has to find the stack it needs
+            body += [[Instruction(PUSH_STACK, [1])]] * max(0, start - depth)
+            depth = max(start, depth)
+            statements.append(Loop(markers, rng.randint(1, 20), body))
+        else:
+            part, after = statement(rng, depth, False)
+            if isinstance(part, list) and part[-1].opcode == BINARY_POWER:
+                if powers == POWERS:
+                    continue
+                powers += 1
+            depth = after
+            statements.append(part)
+
+    while len(flatten(statements)) > MAX_SIZE:
+        statements.pop()
+    return statements
+
+
+def encode(code: List[Instruction]) -> str:
+    """
+    Returns the source of a program, in text mode.
+    """
+    codes = [0]
+    for inst in code:
+        codes += [inst.opcode] + inst.opargs
+        if inst.opcode in MULTI_ARG:
+            codes.append(0)
+    return " ".join(f"{code:08b}" for code in codes)
+
+
+def mnemonics(code: List[Instruction]) -> List[str]:
+    """
+    Returns the lines that type a program into the REPL.
+    """
+    lines = []
+    for inst in code:
+        name = OP_MAP[inst.opcode]
+        if inst.opcode == PUSH_STRING_STACK:
+            lines.append("{} {!r}".format(name, "".join(map(chr, inst.opargs))))
+        else:
+            lines.append(" ".join([name] + [str(arg) for arg in inst.opargs]))
+    return lines
+
+
+def shrink(
+    statements: List[Statement], fails: Callable[[List[Statement]], bool]
+) -> List[Statement]:
+    """
+    Removes statements, including those in loops, for as long as the program
+    still fails.
+    """
+    index = 0
+    while index < len(statements):
+        following = index + 1
+        before = statements[:index]
+        after = statements[following:]
+        if fails(before + after):
+            statements = before + after
+            continue
+
+        current = statements[index]
+        if isinstance(current, Loop):
+
+            def fails_with(body: List[Statement], current: Loop = current) -> bool:
+                loop = Loop(current.marker, current.iterations, body)
+                return fails(before + [loop] + after)
+
+            body = shrink(current.body, fails_with)
+            statements = before + [Loop(current.marker, current.iterations, body)]
+            statements += after
+        index += 1
+    return statements
+
+
+class Harness:
+    def __init__(
+        self,
+        directory: str,
+        engines: List[Engine],
+        repeat: int = 1,
+    ):
+        """
+        Compares engines with the interpreter, keeping the programs it runs
+        in a directory.
+        """
+        self.directory: str = directory
+        self.reference = next(engine for engine in ENGINES if engine[0] == REFERENCE)
+        self.engines = [engine for engine in engines if engine[0] != REFERENCE]
+        self.repeat: int = repeat
+
+        self.programs: int = 0
+        self.mismatches: List[str] = []
+        self.times: Dict[str, float] = {REFERENCE: 0.0}
+        self.times.update((engine[0], 0.0) for engine in self.engines)
+
+    def timed(self, path: str, engine: Engine, text: str) -> Outcome:
+        """
+        Runs a program one way, as often as asked, adding the fastest run to
+        the time of the engine.
+        """
+        outcome, fastest = run(path, engine, self.directory, text)
+        for _ in range(self.repeat - 1):
+            fastest = min(fastest, run(path, engine, self.directory, text)[1])
+        self.times[engine[0]] += fastest
+        return outcome
+
+    def check(
+        self,
+        path: str,
+        text: str = "",
+        statements: Optional[List[Statement]] = None,
+        name: Optional[str] = None,
+    ) -> None:
+        """
+        Runs a program every way and records where it ran differently. Random
+        programs are given as their statements, so they can be shrunk.
+        """
+        self.programs += 1
+        expected = self.timed(path, self.reference, text)
+
+        for engine in self.engines:
+            differences = expected.differences(self.timed(path, engine, text))
+            if not differences:
+                continue
+
+            report = ["{} differs on {}:".format(engine[0], name or path)]
+            report += ["  " + line for line in differences]
+            if statements is not None:
+                smallest = shrink(statements, self.failing(engine, text))
+                report.append("  Shrunk to:")
+                report += ["    " + line for line in mnemonics(flatten(smallest))]
+            self.mismatches.append("\n".join(report))
+
+    def failing(self, engine: Engine, text: str) -> Callable[[List[Statement]], bool]:
+        path = os.path.join(self.directory, "shrinking.raw")
+
+        def fails(statements: List[Statement]) -> bool:
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(encode(flatten(statements)))
+            expected, _ = run(path, self.reference, self.directory, text)
+            actual, _ = run(path, engine, self.directory, text)
+            return bool(expected.differences(actual))
+
+        return fails
+
+    def check_random(self, rng: random.Random, number: int) -> None:
+        statements = generate(rng, rng.randint(5, 30))
+        path = os.path.join(self.directory, "random-{}.raw".format(number))
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(encode(flatten(statements)))
+        self.check(path, statements=statements, name=f"random program {number}")
+
+    def report(self) -> str:
+        lines = self.mismatches + [
+            "Ran {} programs {} ways: {} mismatches".format(
+                self.programs, len(self.engines) + 1, len(self.mismatches)
+            ),
+            "",
+            "{:<14}{:>12}{:>10}".format("Engine", "Time", "Speedup"),
+        ]
+
+        reference = self.times[REFERENCE]
+        for name, seconds in self.times.items():
+            speedup = reference / seconds if seconds else 0.0
+            lines.append("{:<14}{:>11.3f}s{:>9.2f}x".format(name, seconds, speedup))
+        return "\n".join(lines)
+
+
+def main(argv: List[str]) -> None:
+    """
+    Runs programs every way and compares how they ended.
+    """
+    names = [engine[0] for engine in ENGINES]
+    parser = argparse.ArgumentParser(f"{binarypp.__name__} conform")
+    parser.add_argument(
+        "--random",
+        "-n",
+        help="Random programs to run. Defaults to 100.",
+        type=int,
+        default=100,
+    )
+    parser.add_argument("--seed", help="Seed of the random programs.", type=int)
+    parser.add_argument(
+        "--input",
+        help="Text the programs given read as their input. Defaults to '8\\n'.",
+        default="8\n",
+    )
+    parser.add_argument(
+        "--repeat",
+        help="Runs of each program, of which the fastest is timed.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--engine",
+        help="Ways to compare with the interpreter. Defaults to all of them.",
+        choices=names,
+        action="append",
+    )
+    parser.add_argument("FILE", help="Programs to run.", nargs="*")
+    args = parser.parse_args(argv)
+
+    for path in args.FILE:
+        if not os.path.isfile(path):
+            logging.error(
+                "'{}' does not exist! Are you in the right directory?".format(path)
+            )
+
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    engines = [engine for engine in ENGINES if engine[0] in (args.engine or names)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        harness = Harness(directory, engines, args.repeat)
+        for path in args.FILE:
+            harness.check(path, args.input)
+
+        rng = random.Random(seed)
+        for number in range(args.random):
+            harness.check_random(rng, number)
+
+    print(harness.report())
+    if args.random:
+        print("\nRandom programs were made with --seed {}".format(seed))
+    sys.exit(1 if harness.mismatches else 0)
@@ -0,0 +1,104 @@
+"""
+Listings of loaded programs.
+
+`binarypp dis FILE` prints the program the VM would run: a source file after
+the loader rewrote it, or a compiled one as it was stored. Every instruction
+is listed with its position and name, string and long literals are decoded,
+and jumps show the position of the instruction they go to. Modules linked into
+an object file are listed after the program.
+"""
+
+from argparse import Namespace
+from typing import List, Optional
+
+from binarypp.types import Instruction, Marker, Pointer
+from binarypp.vm import VirtualMachine
+from binarypp.vm.opcodes import *
+from binarypp.vm.opmap import OP_MAP
+from binarypp.vm.vm import Frame
+
+
+def load(path: str) -> Frame:
+    """
+    Loads a program the way it would be run, without running it.
+    """
+    vm = VirtualMachine(path, Namespace(step=None))
+    vm.load_file(0, path)
+    frame = vm.frames[0]
+    if frame.source is not None:
+        frame.source.decode_all(frame.stream)
+    return frame
+
+
+def literal(inst: Instruction) -> str:
+    if inst.opcode == PUSH_STRING_STACK:
+        return repr("".join(map(chr, inst.opargs)))
+
+    long = 0
+    for arg in inst.opargs:
+        long = (long << 8) + arg
+    return str(long)
+
+
+def target(frame: Frame, inst: Instruction) -> Optional[str]:
+    """
+    Describes where a jump goes. Jumps store the position before the next
+    instruction to run.
+    """
+    opcode = inst.opcode
+    if opcode in (JUMP_ABSOLUTE, POP_JUMP_IF_FALSE):
+        return "-> {}".format(inst.opargs[0] + 1)
+    if opcode == JUMP_MARKER:
+        return "-> {} (marker {})".format(inst.opargs[0] + 1, inst.opargs[1])
+    if opcode == GOTO_MARKER and inst.opargs and inst.opargs[0] != 0:
+        marker = frame.markers.get(inst.opargs[0])
+        if marker is None:
+            return "-> missing marker"
+        return "-> {}".format(marker.inst + 1)
+    return None
+
+
+def disassemble(frame: Frame) -> List[str]:
+    """
+    Returns a line for every instruction of a frame.
+    """
+    lines = []
+    width = len(str(len(frame.stream)))
+    forwarded = False
+    for index, inst in enumerate(frame.stream):
+        name = OP_MAP.get(inst.opcode, bin(inst.opcode))
+        if inst.opcode in MULTI_ARG:
+            text = "{} {}".format(name, literal(inst))
+        else:
+            text = " ".join([name] + [str(arg) for arg in inst.opargs])
+
+        # Variants with a forwarded argument skip the instruction after them
+        comment = "skipped" if forwarded else target(frame, inst)
+        forwarded = inst.opcode in DYNAMIC_VARIANTS
+        if comment is not None:
+            text = "{:<32} ; {}".format(text, comment)
+        lines.append("{:>{}}  {}".format(index, width, text))
+    return lines
+
+
+def listing(path: str) -> str:
+    """
+    Returns the listing of a program and the modules linked into it.
+    """
+    frame = load(path)
+    lines = ["{}: {} instructions".format(path, len(frame.stream))]
+    lines += disassemble(frame)
+
+    if frame.source is not None:
+        for module_path, module in frame.source.modules():
+            stream = module.instructions()
+            lines += ["", "{}: {} instructions".format(module_path, len(stream))]
+
+            module_frame = Frame(module_path)
+            module_frame.stream = stream
+            module_frame.markers = {
+                addr: Marker(Pointer(0, position))
+                for addr, position in module.markers().items()
+            }
+            lines += disassemble(module_frame)
+    return "\n".join(lines)
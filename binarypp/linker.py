@@ -0,0 +1,259 @@
+"""
+Static linking of Binary++ programs.
+
+IMPORT_MODULE finds its module on disk and runs it in a new virtual machine
+each time it is run. The linker resolves the imports with a constant path
+ahead of time and stores the compiled modules in the object file of the
+program, so the program runs without looking up or parsing any other file.
+
+Modules keep a frame of their own, since each module has its own memory and
+marker table. Where a module can't change once it is imported, the linker
+also resolves
+
+    GOTO_MODULE        -> JUMP_MODULE to the position of the marker
+    PUSH_STACK_MODULE  -> PUSH_STACK of the value in the module's memory
+"""
+
+import contextlib
+import io
+import os.path
+from argparse import Namespace
+from typing import Any, Dict, List, Optional, Set
+
+import binarypp.logging as logging
+import binarypp.objfile as objfile
+from binarypp.types import Instruction
+from binarypp.vm import VirtualMachine
+from binarypp.vm.cfg import CFG
+from binarypp.vm.opcodes import *
+from binarypp.vm.vm import Frame
+
+PURE = {
+    POP_STACK, PUSH_STACK, PUSH_STRING_STACK, PUSH_LONG_STACK, LOAD_MEMORY,
+    STORE_MEMORY, DUP_TOP, MAKE_MARKER, BINARY_ADD, BINARY_SUBTRACT,
+    BINARY_MULTIPLY, BINARY_POWER, BINARY_TRUE_DIVIDE, BINARY_FLOOR_DIVIDE,
+    BINARY_MODULO, BINARY_AND, BINARY_OR, BINARY_XOR, BINARY_NOT,
+    BINARY_LEFT_SHIFT, BINARY_RIGHT_SHIFT, EQUALS_TO, NOT_EQUAL_TO, LESS_THAN,
+    LESS_EQUAL_THAN, GREATER_THAN, GREATER_EQUAL_THAN, FORWARD_ARGS, ROT_TWO,
+    ROT_THREE, JUMP_ABSOLUTE, POP_JUMP_IF_FALSE, LOAD_MEMORY_DYN,
+    STORE_MEMORY_DYN, PUSH_STACK_DYN, MEMORY_COPY, MEMORY_FILL, MEMORY_COMPARE,
+}  # fmt: skip
+
+
+class Module:
+    def __init__(self, path: str, frame: Frame, image: bytes):
+        self.path: str = path
+        self.frame: Frame = frame
+        self.image: bytes = image
+
+        # Memory after the module was initialized at link time
+        self.memory: Optional[List[Any]] = None
+
+    def marker(self, addr: int) -> Optional[int]:
+        """
+        Returns the position of a marker that can never be moved.
+        """
+        stream = self.frame.stream
+        if any(inst.opcode == MAKE_MARKER_DYN for inst in stream):
+            return None
+
+        positions = [
+            index
+            for index, inst in enumerate(stream)
+            if inst.opcode == MAKE_MARKER and inst.opargs == [addr]
+        ]
+        return positions[0] if len(positions) == 1 else None
+
+    def constant(self, addr: int) -> Optional[int]:
+        """
+        Returns the value at a memory address if it was set when the module was
+        initialized and no code of the module can change it afterwards.
+        """
+        if self.memory is None or addr == 0:
+            return None
+
+        stored = stored_addresses(self.frame)
+        if stored is None or addr in stored:
+            return None
+
+        value = self.memory[addr] if addr < len(self.memory) else 0
+        if type(value) is not int or not -(2**31) <= value < 2**31:
+            return None
+        return value
+
+
+class Linker:
+    def __init__(self) -> None:
+        self.flags: Namespace = Namespace(step=False)
+        self.modules: Dict[str, Module] = {}
+        self.linking: Set[str] = set()
+
+    def link(self, path: str, initialize: bool = False) -> Module:
+        """
+        Links the program at path and everything it imports with a constant
+        path. Modules are only initialized at link time if asked to.
+        """
+        key = os.path.normpath(path)
+        if key in self.modules:
+            return self.modules[key]
+        if key in self.linking:
+            logging.error(f"ImportError: '{path}' imports itself")
+        self.linking.add(key)
+
+        vm = VirtualMachine(path, self.flags)
+        vm.load_file(0, path)
+        frame = vm.frames[0]
+        if frame.source is not None:
+            if frame.source.modules():
+                logging.error(f"'{path}' is already linked")
+            frame.source.decode_all(frame.stream)
+
+        modules = self.link_imports(frame)
+        self.resolve_modules(frame, modules)
+
+        module = Module(path, frame, b"")
+        if initialize:
+            module.memory = initialize_module(frame)
+        module.image = objfile.encode(
+            frame, [(linked.path, linked.image) for linked in modules], module.memory
+        )
+
+        self.linking.remove(key)
+        self.modules[key] = module
+        return module
+
+    def link_imports(self, frame: Frame) -> List[Module]:
+        """
+        Replaces each IMPORT_MODULE with a constant path by IMPORT_LINKED and
+        returns the modules in the order they are numbered.
+        """
+        modules: List[Module] = []
+        for index, inst in enumerate(frame.stream[1:], 1):
+            previous = frame.stream[index - 1]
+            if inst.opcode != IMPORT_MODULE or not inst.opargs:
+                continue
+            if previous.opcode != PUSH_STRING_STACK:
+                continue
+
+            # Paths are resolved the same way IMPORT_MODULE does
+            module_path = os.path.join(
+                os.path.dirname(frame.file), "".join(map(chr, previous.opargs))
+            )
+            if not os.path.isfile(module_path):
+                logging.error(f"ImportError: '{module_path}' is not a file")
+
+            module = self.link(module_path, initialize=True)
+            if module not in modules:
+                modules.append(module)
+
+            frame.stream[index] = Instruction(
+                IMPORT_LINKED, [inst.opargs[0], modules.index(module)]
+            )
+
+        return modules
+
+    def resolve_modules(self, frame: Frame, modules: List[Module]) -> None:
+        """
+        Resolves GOTO_MODULE and PUSH_STACK_MODULE for frames that only ever
+        hold one linked module.
+        """
+        bound: Dict[int, Set[int]] = {}
+        for inst in frame.stream:
+            if inst.opcode == IMPORT_LINKED:
+                bound.setdefault(inst.opargs[0], set()).add(inst.opargs[1])
+            elif inst.opcode == IMPORT_MODULE and inst.opargs:
+                bound.setdefault(inst.opargs[0], set()).add(-1)
+            elif inst.opcode == IMPORT_MODULE_DYN:
+                return
+
+        for index, inst in enumerate(frame.stream):
+            if inst.opcode not in (GOTO_MODULE, PUSH_STACK_MODULE):
+                continue
+
+            numbers = bound.get(inst.opargs[0], set())
+            if len(numbers) != 1 or -1 in numbers:
+                continue
+            module = modules[next(iter(numbers))]
+
+            if inst.opcode == GOTO_MODULE:
+                # The marker can't move, so the jump needs no address to be
+                # turned back into GOTO_MODULE
+                position = module.marker(inst.opargs[1])
+                if position is not None:
+                    frame.stream[index] = Instruction(
+                        JUMP_MODULE, [inst.opargs[0], position]
+                    )
+
+            else:
+                value = module.constant(inst.opargs[1])
+                if value is not None:
+                    frame.stream[index] = Instruction(PUSH_STACK, [value])
+
+
+def link(path: str) -> bytes:
+    """
+    Returns the object file of the program at path with its imports linked.
+    """
+    return Linker().link(path).image
+
+
+def stored_addresses(frame: Frame) -> Optional[Set[int]]:
+    """
+    Returns the memory addresses code reachable from the markers of a module
+    can store to, or None if any address may be.
+    """
+    graph = CFG(frame.stream)
+    if graph.dynamic:
+        return None
+
+    # Every entry point except the start of the stream runs after initializing
+    stored: Set[int] = set()
+    for index in graph.reachable(graph.entries[1:]):
+        inst = frame.stream[index]
+        if inst.opcode in (STORE_MEMORY_DYN, MEMORY_COPY, MEMORY_FILL):
+            return None
+        if inst.opcode == STORE_MEMORY:
+            stored.add(inst.opargs[0])
+
+    return stored
+
+
+def initialize_module(frame: Frame) -> Optional[List[Any]]:
+    """
+    Runs the code of a module to get its memory, the same way IMPORT_MODULE
+    would. Returns None if the code isn't certain to give the same memory when
+    the program runs.
+    """
+    graph = CFG(frame.stream)
+    pending = [0]
+    seen: Set[int] = set()
+    while pending:
+        index = pending.pop()
+        if index in seen or index >= len(frame.stream):
+            continue
+        seen.add(index)
+
+        # Only jumping forward guarantees that the code finishes
+        targets = graph.successors(index)
+        if frame.stream[index].opcode not in PURE or targets is None:
+            return None
+        if any(target <= index for target in targets):
+            return None
+        pending.extend(targets)
+
+    vm = VirtualMachine(frame.file, Namespace(step=False))
+    try:
+        with contextlib.redirect_stderr(io.StringIO()):
+            vm.main_loop(list(frame.stream))
+    except (Exception, SystemExit):
+        return None
+
+    # Markers made while running must be where the object file has them
+    markers = {addr: marker.inst for addr, marker in vm.frames[0].markers.items()}
+    if markers != {addr: marker.inst for addr, marker in frame.markers.items()}:
+        return None
+
+    memory = vm.frames[0].memory.memory
+    if not all(objfile.can_encode(value) for value in memory):
+        return None
+    return list(memory)
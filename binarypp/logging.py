@@ -1,58 +1,50 @@
 import os
 import sys
+from _thread import get_ident
+from typing import Set
 
 #
-# Provide alternative log message if the
-# NO_COLOR environment variable is set.
+# Symbols of the log messages. Plain ones are used instead if the
+# NO_COLOR environment variable is set, which is checked when a
+# message is logged rather than when the module is imported.
 #
-if os.getenv("NO_COLOR"):
+SYMBOLS = {"info": "\u001b[36mi\u001b[0m", "error": "❌", "success": "✅"}
+PLAIN_SYMBOLS = {"info": "INFO: ", "error": "✗", "success": "✓"}
 
-    def log_level_one(log_message: str, log_level: int) -> None:
-        if log_level:
-            print("INFO: ", log_message)
+# Threads whose errors are not printed, such as those reading modules ahead
+QUIET: Set[int] = set()
 
-    def log_level_two(log_message: str, log_level: int) -> None:
-        if log_level >= 2:
-            print("INFO: ", log_message)
 
-    def log_level_three(log_message: str, log_level: int) -> None:
-        if log_level >= 3:
-            print("INFO: ", log_message)
+def symbol(kind: str) -> str:
+    return (PLAIN_SYMBOLS if os.getenv("NO_COLOR") else SYMBOLS)[kind]
 
-    def error(log_message: str, terminate: bool = True, prompt: bool = False) -> None:
-        sys.stderr.write("✗ " + log_message + (" " if prompt else "\n"))
-        if terminate:
-            sys.exit(1)
 
-    def success(log_message: str) -> None:
-        print("✓", log_message)
+def log_level_one(log_message: str, log_level: int) -> None:
+    if log_level:
+        print(symbol("info"), log_message)
 
 
-#
-# If the NO_COLOR environment variable is set, then
-# provide color in the output.
-#
-else:
+def log_level_two(log_message: str, log_level: int) -> None:
+    if log_level >= 2:
+        print(symbol("info"), log_message)
+
 
-    def log_level_one(log_message: str, log_level: int) -> None:
-        if log_level:
-            print("\u001b[36mi\u001b[0m", log_message)
+def log_level_three(log_message: str, log_level: int) -> None:
+    if log_level >= 3:
+        print(symbol("info"), log_message)
 
-    def log_level_two(log_message: str, log_level: int) -> None:
-        if log_level >= 2:
-            print("\u001b[36mi\u001b[0m", log_message)
 
-    def log_level_three(log_message: str, log_level: int) -> None:
-        if log_level >= 3:
-            print("\u001b[36mi\u001b[0m", log_message)
+def error(log_message: str, terminate: bool = True, prompt: bool = False) -> None:
+    if get_ident() not in QUIET:
+        sys.stderr.write(
+            symbol("error") + " " + log_message + (" " if prompt else "\n")
+        )
+    if terminate:
+        sys.exit(1)
 
-    def error(log_message: str, terminate: bool = True, prompt: bool = False) -> None:
-        sys.stderr.write("❌ " + log_message + (" " if prompt else "\n"))
-        if terminate:
-            sys.exit(1)
 
-    def success(log_message: str) -> None:
-        print("✅", log_message)
+def success(log_message: str) -> None:
+    print(symbol("success"), log_message)
 
 
 LOGGING_LEVELS = (log_level_one, log_level_two, log_level_three)
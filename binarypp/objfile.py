@@ -0,0 +1,328 @@
+"""
+Compiled Binary++ programs.
+
+An object file holds a program after it went through the loader, so it runs
+without being parsed or scanned again. All numbers are little-endian.
+
+    header      magic, version and number of sections
+    sections    kind, offset, size and entry count of each section
+    CODE        one fixed-size record per instruction
+    CONSTANTS   arguments of PUSH_STRING_STACK and PUSH_LONG_STACK
+    MARKERS     marker positions and the jumps resolved to them
+    IMPORTS     IMPORT_MODULE instructions with a constant path
+    MODULES     object files of modules linked into the program
+    MEMORY      memory of a module that was initialized when linking
+
+The file is mapped into memory and instructions are decoded a page at a time,
+the first time one of them runs. Code that never runs is never read.
+"""
+
+import mmap
+import struct
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+import binarypp.logging as logging
+from binarypp.parser import OBJECT_MAGIC
+from binarypp.types import Instruction, String
+from binarypp.vm.opcodes import *
+
+if TYPE_CHECKING:
+    from binarypp.vm.vm import Frame
+
+MAGIC = OBJECT_MAGIC
+VERSION = 1
+
+CODE = 0
+CONSTANTS = 1
+MARKERS = 2
+IMPORTS = 3
+MODULES = 4
+MEMORY = 5
+
+MARKER_DEFINED = 0
+MARKER_JUMP = 1
+
+HEADER = struct.Struct("<4sHH")  # magic, version, section count
+SECTION = struct.Struct("<IIII")  # kind, offset, size, entries
+RECORD = struct.Struct("<HBxii")  # opcode, argument count, arguments
+CONSTANT = struct.Struct("<II")  # offset, size
+MARKER = struct.Struct("<Bxxxii")  # MARKER_DEFINED or MARKER_JUMP, address, position
+IMPORT = struct.Struct("<iii")  # position, frame, constant
+MODULE = struct.Struct("<III")  # offset, size, path constant
+VALUE = struct.Struct("<BI")  # type of a memory cell, size
+
+# Types of the values in a MEMORY section
+VALUE_INT = 0
+VALUE_BOOL = 1
+VALUE_FLOAT = 2
+VALUE_STRING = 3
+
+PAGE_SIZE = 1024
+
+# Stands in for instructions that have not been decoded yet
+PAGE_STUB = Instruction(DECODE_PAGE)
+
+
+def write(path: str, frame: "Frame") -> None:
+    """
+    Writes a loaded frame to an object file.
+    """
+    with open(path, "wb") as file:
+        file.write(encode(frame))
+
+
+def encode(
+    frame: "Frame",
+    modules: Sequence[Tuple[str, bytes]] = (),
+    memory: Optional[List[Any]] = None,
+) -> bytes:
+    """
+    Encodes a loaded frame as an object file. Linked modules are given as their
+    path and encoded object file. Memory is only stored for modules that were
+    initialized when linking.
+    """
+    constants: Dict[bytes, int] = {}
+
+    def constant(value: bytes) -> int:
+        return constants.setdefault(value, len(constants))
+
+    code = bytearray()
+    for inst in frame.stream:
+        if inst.opcode in MULTI_ARG:
+            code += RECORD.pack(inst.opcode, 1, constant(bytes(inst.opargs)), 0)
+        elif len(inst.opargs) <= 2:
+            args = inst.opargs + [0] * (2 - len(inst.opargs))
+            code += RECORD.pack(inst.opcode, len(inst.opargs), *args)
+        else:
+            logging.error(f"Can't compile {inst}, it has too many arguments")
+
+    markers = bytearray()
+    for addr, marker in frame.markers.items():
+        markers += MARKER.pack(MARKER_DEFINED, addr, marker.inst)
+    for addr, sites in frame.jump_sites.items():
+        for site_frame, index, _ in sites:
+            if site_frame is frame:
+                markers += MARKER.pack(MARKER_JUMP, addr, index)
+
+    imports = bytearray()
+    for index, inst in enumerate(frame.stream[1:], 1):
+        if inst.opcode != IMPORT_MODULE or not inst.opargs:
+            continue
+
+        previous = frame.stream[index - 1]
+        if previous.opcode == PUSH_STRING_STACK:
+            path_constant = constant(bytes(previous.opargs))
+            imports += IMPORT.pack(index, inst.opargs[0], path_constant)
+
+    images = bytearray()
+    table = bytearray()
+    for module_path, image in modules:
+        path_constant = constant(module_path.encode("utf-8"))
+        table += MODULE.pack(len(images), len(image), path_constant)
+        images += image
+    linked = table + images
+
+    pool = bytearray()
+    table = bytearray()
+    for value in constants:
+        table += CONSTANT.pack(len(pool), len(value))
+        pool += value
+
+    sections = [
+        (CODE, code, len(frame.stream)),
+        (CONSTANTS, table + pool, len(constants)),
+        (MARKERS, markers, len(markers) // MARKER.size),
+        (IMPORTS, imports, len(imports) // IMPORT.size),
+        (MODULES, linked, len(modules)),
+    ]
+    if memory is not None:
+        sections.append((MEMORY, encode_memory(memory), len(memory)))
+
+    header = HEADER.pack(MAGIC, VERSION, len(sections))
+    offset = HEADER.size + SECTION.size * len(sections)
+    body = bytearray()
+    for kind, data, entries in sections:
+        header += SECTION.pack(kind, offset + len(body), len(data), entries)
+        body += data
+
+    return bytes(header + body)
+
+
+def can_encode(value: Any) -> bool:
+    return type(value) in (int, bool, float, String)
+
+
+def encode_memory(memory: List[Any]) -> bytearray:
+    data = bytearray()
+    for value in memory:
+        if type(value) is int:
+            size = (value.bit_length() + 8) // 8
+            data += VALUE.pack(VALUE_INT, size)
+            data += value.to_bytes(size, "little", signed=True)
+        elif type(value) is bool:
+            data += VALUE.pack(VALUE_BOOL, 1) + bytes([value])
+        elif type(value) is float:
+            data += VALUE.pack(VALUE_FLOAT, 8) + struct.pack("<d", value)
+        elif type(value) is String:
+            data += VALUE.pack(VALUE_STRING, len(value.data))
+            data += struct.pack(f"<{len(value.data)}I", *value.data)
+        else:
+            logging.error(f"Can't store {value!r} in an object file")
+    return data
+
+
+class ObjectFile:
+    def __init__(self, path: str, data: Optional[mmap.mmap] = None, base: int = 0):
+        """
+        Maps the object file at path. Modules linked into a program are read
+        from the mapping of the program, starting at base.
+        """
+        self.path: str = path
+
+        if data is None:
+            with open(path, "rb") as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data: mmap.mmap = data
+
+        magic, version, count = HEADER.unpack_from(self.data, base)
+        if magic != MAGIC:
+            logging.error(f"'{path}' is not a compiled Binary++ program")
+        if version != VERSION:
+            logging.error(
+                f"'{path}' was compiled for object file version {version}, "
+                f"but this version of Binary++ reads version {VERSION}"
+            )
+
+        # Sections that are missing are treated as empty
+        self.sections: Dict[int, Tuple[int, int]] = {}
+        for index in range(count):
+            kind, offset, _, entries = SECTION.unpack_from(
+                self.data, base + HEADER.size + SECTION.size * index
+            )
+            self.sections[kind] = (base + offset, entries)
+
+        self.size: int = self.sections.get(CODE, (0, 0))[1]
+        self.constants: Dict[int, List[int]] = {}
+        self.linked: Optional[List[Tuple[str, ObjectFile]]] = None
+
+    def stream(self) -> List[Instruction]:
+        """
+        Returns a stream where every instruction decodes its page when run.
+        """
+        return [PAGE_STUB] * self.size
+
+    def decode(self, index: int) -> Instruction:
+        offset = self.sections[CODE][0] + RECORD.size * index
+        opcode, count, first, second = RECORD.unpack_from(self.data, offset)
+
+        if opcode in MULTI_ARG:
+            return Instruction(opcode, self.constant(first))
+        return Instruction(opcode, [first, second][:count])
+
+    def decode_page(self, stream: List[Instruction], index: int) -> None:
+        """
+        Decodes the page holding the instruction at index into the stream.
+        Instructions already replaced while running are kept.
+        """
+        start = index - index % PAGE_SIZE
+        for position in range(start, min(start + PAGE_SIZE, self.size)):
+            if stream[position] is PAGE_STUB:
+                stream[position] = self.decode(position)
+
+    def decode_all(self, stream: List[Instruction]) -> None:
+        for index in range(0, self.size, PAGE_SIZE):
+            self.decode_page(stream, index)
+
+    def instructions(self) -> List[Instruction]:
+        return [self.decode(index) for index in range(self.size)]
+
+    def constant(self, index: int) -> List[int]:
+        if index not in self.constants:
+            offset, entries = self.sections[CONSTANTS]
+            start, size = CONSTANT.unpack_from(
+                self.data, offset + CONSTANT.size * index
+            )
+            start += offset + CONSTANT.size * entries
+            end = start + size
+            self.constants[index] = list(self.data[start:end])
+        return list(self.constants[index])
+
+    def markers(self) -> Dict[int, int]:
+        """
+        Returns the position of each marker, keyed by address.
+        """
+        return {
+            addr: position
+            for kind, addr, position in self._marker_records()
+            if kind == MARKER_DEFINED
+        }
+
+    def jumps(self) -> List[Tuple[int, int]]:
+        """
+        Returns the address and position of each jump resolved to a marker.
+        """
+        return [
+            (addr, position)
+            for kind, addr, position in self._marker_records()
+            if kind == MARKER_JUMP
+        ]
+
+    def imports(self) -> List[Tuple[int, int, str]]:
+        """
+        Returns the position, frame and path of each import with a constant path.
+        """
+        offset, entries = self.sections.get(IMPORTS, (0, 0))
+        end = offset + IMPORT.size * entries
+        return [
+            (position, frame, "".join(map(chr, self.constant(path))))
+            for position, frame, path in IMPORT.iter_unpack(self.data[offset:end])
+        ]
+
+    def modules(self) -> List[Tuple[str, "ObjectFile"]]:
+        """
+        Returns the path and object file of each linked module.
+        """
+        if self.linked is None:
+            offset, entries = self.sections.get(MODULES, (0, 0))
+            start = offset + MODULE.size * entries
+            self.linked = []
+            for position, _, path in MODULE.iter_unpack(self.data[offset:start]):
+                module_path = bytes(self.constant(path)).decode("utf-8")
+                module = ObjectFile(module_path, self.data, start + position)
+                self.linked.append((module_path, module))
+        return self.linked
+
+    def memory(self) -> Optional[List[Any]]:
+        """
+        Returns the memory a linked module had after it was initialized, or None
+        if it still has to be initialized by running it.
+        """
+        if MEMORY not in self.sections:
+            return None
+
+        offset, entries = self.sections[MEMORY]
+        memory: List[Any] = []
+        for _ in range(entries):
+            kind, size = VALUE.unpack_from(self.data, offset)
+            offset += VALUE.size
+            end = offset + size
+
+            if kind == VALUE_INT:
+                value = self.data[offset:end]
+                memory.append(int.from_bytes(value, "little", signed=True))
+            elif kind == VALUE_BOOL:
+                memory.append(bool(self.data[offset]))
+            elif kind == VALUE_FLOAT:
+                memory.append(struct.unpack_from("<d", self.data, offset)[0])
+            else:
+                codes = struct.unpack_from(f"<{size}I", self.data, offset)
+                memory.append(String(list(codes)))
+                end = offset + size * 4
+
+            offset = end
+        return memory
+
+    def _marker_records(self) -> List[Tuple[int, int, int]]:
+        offset, entries = self.sections.get(MARKERS, (0, 0))
+        end = offset + MARKER.size * entries
+        return list(MARKER.iter_unpack(self.data[offset:end]))
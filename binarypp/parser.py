@@ -1,15 +1,18 @@
-from typing import List
+from typing import IO, Iterator, List
 
 import binarypp.logging as logging
 import binarypp.utils as utils
 from binarypp.types import Instruction
 from binarypp.vm.opcodes import *
 
+# Characters read from a program file at once when it is parsed lazily
+CHUNK_SIZE = 1 << 16
+
+# First bytes of a compiled program, which binarypp.objfile reads instead
+OBJECT_MAGIC = b"\x7fBPP"
 
-def parse(raw_code: str) -> List[Instruction]:
-    tokens: List[Instruction] = []
-    IP = 0
 
+def parse(raw_code: str) -> List[Instruction]:
     # Check if file is in interpret-mode
     code_split = raw_code.split()
     if code_split[0] == "00000000":
@@ -18,55 +21,114 @@ def parse(raw_code: str) -> List[Instruction]:
     else:
         code = [ord(c) for c in raw_code]
 
-    try:
-        while IP < len(code):
-            opcode = code[IP]
-
-            if opcode in NO_ARG:
-                tokens.append(Instruction(opcode))
-
-            elif opcode in ONE_ARG:
-                if IP > 0 and code[IP - 1] == FORWARD_ARGS:
-                    tokens.append(Instruction(opcode))
-                else:
-                    tokens.append(Instruction(opcode, [code[IP + 1]]))
-                    IP += 1
-
-            elif opcode in TWO_ARG:
-                if IP > 0 and code[IP - 1] == FORWARD_ARGS:
-                    tokens.append(Instruction(opcode))
-                else:
-                    tokens.append(Instruction(opcode, [code[IP + 1], code[IP + 2]]))
-                    IP += 2
-
-            elif opcode in MULTI_ARG:
-                if 0 not in code[IP:]:
-                    logging.error(
-                        f"You are missing a 00000000 to end instruction #{len(tokens)}"
-                    )
-
-                # Read all arguments until 00000000 is reached
-                args = []
-                IP += 1
-                while code[IP] != 0:
-                    args.append(code[IP])
-                    IP += 1
-
-                tokens.append(Instruction(opcode, args))
+    return list(tokenize(iter(code)))
+
+
+def is_object_file(path: str) -> bool:
+    with open(path, "rb") as file:
+        return file.read(len(OBJECT_MAGIC)) == OBJECT_MAGIC
+
+
+def parse_file(path: str) -> List[Instruction]:
+    """
+    Parses a program file. Files are read as latin1, so every byte of a
+    program written as raw characters stands for its own code.
+    """
+    with open(path, "r", encoding="latin1") as file:
+        return parse(file.read())
+
+
+def read_codes(file: IO[str]) -> Iterator[int]:
+    """
+    Yields the codes of a program file as it is read, the same ones parse
+    gets from the whole text.
+    """
+    # The first word tells whether the program is written in binary
+    text = file.read(CHUNK_SIZE)
+    more = text
+    while more and len(text.split(None, 1)) < 2:
+        more = file.read(CHUNK_SIZE)
+        text += more
+
+    if not text.split() or text.split(None, 1)[0] != "00000000":
+        while text:
+            yield from map(ord, text)
+            text = file.read(CHUNK_SIZE)
+        return
 
+    # A word cut off by the end of a chunk is finished by the next one. The
+    # first word only tells the format.
+    first = True
+    rest = ""
+    while text or rest:
+        words = (rest + text).split()
+        rest = words.pop() if text and words and not text[-1].isspace() else ""
+        for word in words:
+            if not utils.is_binary(word):
+                continue
+            if not first:
+                yield int(word, 2)
+            first = False
+        text = file.read(CHUNK_SIZE)
+
+
+def tokenize(code: Iterator[int], forwarded: bool = False) -> Iterator[Instruction]:
+    """
+    Yields the instructions of a program as its codes come in. Instructions
+    after FORWARD_ARGS take their argument from the stack, which is the case
+    for the first one if forwarded is set.
+    """
+    count = 0
+
+    for opcode in code:
+        if opcode in NO_ARG:
+            inst = Instruction(opcode)
+
+        elif opcode in ONE_ARG:
+            if forwarded:
+                inst = Instruction(opcode)
+            else:
+                a = next(code, None)
+                if a is None:
+                    missing_argument()
+                inst = Instruction(opcode, [a])
+
+        elif opcode in TWO_ARG:
+            if forwarded:
+                inst = Instruction(opcode)
+            else:
+                a = next(code, None)
+                b = next(code, None)
+                if b is None:
+                    missing_argument()
+                inst = Instruction(opcode, [a, b])
+
+        elif opcode in MULTI_ARG:
+            # Read all arguments until 00000000 is reached
+            args = []
+            for arg in code:
+                if arg == 0:
+                    break
+                args.append(arg)
             else:
-                # This formatting may not work on all terminals
-                logging.error(
-                    f"Uh oh! This instruction isn't defined! "
-                    f"{utils.to_binary_str(opcode)}\n"
-                    f"   Check instruction #{len(tokens)}"
-                )
+                logging.error(f"You are missing a 00000000 to end instruction #{count}")
+
+            inst = Instruction(opcode, args)
+
+        else:
+            # This formatting may not work on all terminals
+            logging.error(
+                f"Uh oh! This instruction isn't defined! "
+                f"{utils.to_binary_str(opcode)}\n"
+                f"   Check instruction #{count}"
+            )
 
-            IP += 1
+        yield inst
+        count += 1
+        forwarded = opcode == FORWARD_ARGS
 
-    except IndexError:
-        logging.error(
-            "We don't know where, but one of your instructions is missing an argument!"
-        )
 
-    return tokens
+def missing_argument() -> None:
+    logging.error(
+        "We don't know where, but one of your instructions is missing an argument!"
+    )
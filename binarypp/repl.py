@@ -0,0 +1,160 @@
+"""
+Interactive mode.
+
+The REPL is a frame loaded lazily from the lines typed in: whenever the VM
+runs out of instructions it asks for another line, so every line runs right
+away on the memory and stack the ones before it left. Markers are registered
+as their instructions come in, and a jump to one that wasn't typed yet waits
+for it.
+
+Lines are either binary, like a program in text mode, or one instruction
+written with its name, e.g. PUSH_STACK 48 or PUSH_STRING_STACK "Hi". Lines
+starting with a colon are commands.
+"""
+
+import ast
+import itertools
+import sys
+from argparse import Namespace
+from collections import deque
+from typing import Deque, Iterator, List, Optional
+
+import binarypp.logging as logging
+import binarypp.parser as parser
+import binarypp.utils as utils
+from binarypp.types import Instruction
+from binarypp.vm import VirtualMachine
+from binarypp.vm.opcodes import *
+from binarypp.vm.opmap import OP_MAP
+
+MNEMONICS = {
+    OP_MAP[opcode]: opcode for opcode in NO_ARG + ONE_ARG + TWO_ARG + MULTI_ARG
+}
+
+PROMPT = ">>> "
+
+
+def encode(line: str) -> List[int]:
+    """
+    Returns the codes of a line.
+    """
+    words = line.split()
+    if all(utils.is_binary(word) for word in words):
+        return [int(word, 2) for word in words]
+
+    name, _, rest = line.strip().partition(" ")
+    opcode = MNEMONICS.get(name.upper())
+    if opcode is None:
+        logging.error("Unknown instruction: {}".format(name))
+
+    codes = [opcode]
+    rest = rest.strip()
+    if opcode in MULTI_ARG and rest[:1] in ("'", '"'):
+        codes.extend(ord(char) for char in ast.literal_eval(rest))
+    else:
+        try:
+            codes.extend(int(arg, 0) for arg in rest.split())
+        except ValueError:
+            logging.error("Arguments are numbers, like 48, 0b110000 or 0x30")
+
+    if any(not 0 <= code <= 255 for code in codes[1:]):
+        logging.error("Arguments are bytes, from 0 to 255")
+
+    # Multiple arguments end at 00000000, which is left out when typing
+    if opcode in MULTI_ARG and codes[-1] != 0:
+        codes.append(0)
+    return codes
+
+
+class Repl:
+    def __init__(self, flags: Namespace, file: Optional[str] = None):
+        """
+        Sets up a REPL, which first runs a program file if one is given.
+        """
+        self.vm: VirtualMachine = VirtualMachine(file or "<repl>", flags)
+        self.running: bool = True
+        # Instructions of the current line that haven't been loaded yet
+        self.line: Deque[Instruction] = deque()
+
+        instructions: Iterator[Instruction] = self.instructions()
+        if file is not None:
+            with open(file, "r", encoding="latin1") as program:
+                code = parser.parse(program.read())
+            instructions = itertools.chain(code, instructions)
+        self.vm.load_lazily(0, instructions)
+
+    def instructions(self) -> Iterator[Instruction]:
+        """
+        Yields the instructions of the lines typed in, until the input ends.
+        """
+        forwarded = False
+        while self.running:
+            try:
+                line = input(PROMPT)
+            except EOFError:
+                print()
+                return
+            except KeyboardInterrupt:
+                print()
+                continue
+
+            if line.strip().startswith(":"):
+                self.command(line.strip()[1:])
+                continue
+            if not line.strip():
+                continue
+
+            # A line with a mistake is left out as a whole
+            try:
+                tokens = list(parser.tokenize(iter(encode(line)), forwarded))
+            except SystemExit:
+                continue
+
+            if tokens:
+                forwarded = tokens[-1].opcode == FORWARD_ARGS
+            self.line.extend(tokens)
+            while self.line:
+                yield self.line.popleft()
+
+    def command(self, name: str) -> None:
+        frame = self.vm.frames[0]
+        if name == "stack":
+            print(list(self.vm.stack.stack))
+        elif name == "memory":
+            print(list(frame.memory.memory))
+        elif name == "markers":
+            print(frame.markers)
+        elif name in ("quit", "q"):
+            self.running = False
+        else:
+            logging.error(
+                "Unknown command :{}. Try :stack, :memory, :markers or :quit".format(
+                    name
+                ),
+                False,
+            )
+
+    def run(self) -> None:
+        """
+        Runs the lines as they are typed in. Errors stop the line they are in,
+        and the REPL asks for the next one.
+        """
+        vm = self.vm
+        try:
+            while True:
+                try:
+                    vm.run()
+                    return
+                except (SystemExit, KeyboardInterrupt) as error:
+                    if isinstance(error, KeyboardInterrupt):
+                        print("KeyboardInterrupt", file=sys.stderr)
+
+                    # Whatever was left to run is dropped, along with the rest
+                    # of the line
+                    if vm.frames[0].pending is None:
+                        return
+                    vm.IP.frame = 0
+                    vm.IP.inst = vm.frames[0].stream_size
+                    self.line.clear()
+        finally:
+            vm.close()
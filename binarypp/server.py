@@ -0,0 +1,206 @@
+"""
+Daemon running programs for clients over a Unix domain socket.
+
+Starting Python and importing the VM takes longer than running most short
+programs. The daemon does it once, then forks a process for every request, so
+each program still runs in a VM and process of its own. The programs run
+most recently are kept parsed in the daemon, so only the first run of a
+program parses it. Requests that can't be run get an error status, and the
+daemon goes on serving.
+
+The client, in binarypp.client, sends the program path, its flags and working
+directory along with its standard streams, which the forked process takes over
+as its own. Input and output never pass through the daemon.
+"""
+
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import sys
+import traceback
+from argparse import Namespace
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+import binarypp.cli as cli
+import binarypp.logging as logging
+import binarypp.parser as parser
+from binarypp.client import LENGTH, STATUS
+from binarypp.types import Instruction
+
+# Parsed programs kept in the daemon at once
+CACHE_SIZE = 128
+
+# A program file as it was parsed: its modification time, size and program
+Cached = Tuple[int, int, List[Instruction]]
+
+
+class RequestError(Exception):
+    pass
+
+
+class Server:
+    def __init__(self, path: str, cache_size: int = CACHE_SIZE):
+        self.path: str = path
+
+        # Parsed programs by path, from least to most recently used. Only the
+        # version of a file that was run last is kept.
+        self.programs: "OrderedDict[str, Cached]" = OrderedDict()
+        self.cache_size: int = max(cache_size, 1)
+
+    def program(self, path: str) -> Optional[List[Instruction]]:
+        """
+        Returns a parsed program, or None if it is left to the request. Object
+        files are decoded lazily when they run, and programs that fail to parse
+        report the error to the client.
+        """
+        try:
+            if parser.is_object_file(path):
+                return None
+
+            stat = os.stat(path)
+            cached = self.programs.get(path)
+            if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                self.programs.move_to_end(path)
+                return cached[2]
+
+            with contextlib.redirect_stderr(io.StringIO()):
+                stream = parser.parse_file(path)
+        except (OSError, SystemExit, ValueError, IndexError):
+            return None
+
+        self.programs[path] = (stat.st_mtime_ns, stat.st_size, stream)
+        self.programs.move_to_end(path)
+        if len(self.programs) > self.cache_size:
+            self.programs.popitem(last=False)
+        return stream
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        # Requests report their status to the client, so nobody waits on them
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(self.path)
+            sock.listen()
+            logging.success("Serving on {}".format(self.path))
+
+            try:
+                while True:
+                    conn, _ = sock.accept()
+                    with conn:
+                        self.serve(sock, conn)
+            finally:
+                os.unlink(self.path)
+
+    def serve(self, sock: socket.socket, conn: socket.socket) -> None:
+        """
+        Handles a request. A request that can't be run is answered with an
+        error status, and the daemon goes on with the next one.
+        """
+        try:
+            self.handle(sock, conn)
+        except (RequestError, OSError, ValueError) as error:
+            logging.error("Bad request: {}".format(error), False)
+            with contextlib.suppress(OSError):
+                conn.sendall(STATUS.pack(1))
+
+    def handle(self, sock: socket.socket, conn: socket.socket) -> None:
+        request, fds = receive(conn)
+        try:
+            check(request, fds)
+        except RequestError:
+            for fd in fds:
+                os.close(fd)
+            raise
+
+        path = os.path.join(request["cwd"], request["file"])
+        program = self.program(path)
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        if os.fork() != 0:
+            for fd in fds:
+                os.close(fd)
+            return
+
+        # The request
+        status = 1
+        try:
+            sock.close()
+            for target, fd in enumerate(fds):
+                os.dup2(fd, target)
+                os.close(fd)
+            os.chdir(request["cwd"])
+
+            cli.run(Namespace(**request["flags"]), program)
+            status = 0
+        except SystemExit as error:
+            status = exit_status(error.code)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            # The client may be gone, but the process must never get back to
+            # the daemon's loop
+            try:
+                with contextlib.suppress(OSError, ValueError):
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                with contextlib.suppress(OSError):
+                    conn.sendall(STATUS.pack(status))
+            finally:
+                os._exit(0)
+
+
+def exit_status(code: Any) -> int:
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+
+    print(code, file=sys.stderr)
+    return 1
+
+
+def receive(conn: socket.socket) -> Tuple[Any, List[int]]:
+    data, fds, _, _ = socket.recv_fds(conn, 1 << 16, 3)
+    try:
+        while len(data) < LENGTH.size:
+            data += recv(conn, LENGTH.size - len(data))
+
+        (length,) = LENGTH.unpack_from(data)
+        start = LENGTH.size
+        data = data[start:]
+        while len(data) < length:
+            data += recv(conn, length - len(data))
+
+        return json.loads(data), fds
+    except (RequestError, ValueError):
+        for fd in fds:
+            os.close(fd)
+        raise
+
+
+def recv(conn: socket.socket, size: int) -> bytes:
+    chunk = conn.recv(size)
+    if not chunk:
+        raise RequestError("the client disconnected before the request ended")
+    return chunk
+
+
+def check(request: Any, fds: List[int]) -> None:
+    """
+    Checks that a request has what running it needs.
+    """
+    if len(fds) != 3:
+        raise RequestError("expected stdin, stdout and stderr")
+    if not isinstance(request, dict):
+        raise RequestError("expected an object")
+    for name, kind in (("cwd", str), ("file", str), ("flags", dict)):
+        if not isinstance(request.get(name), kind):
+            raise RequestError("missing or invalid '{}'".format(name))
@@ -0,0 +1,236 @@
+"""
+Execution traces.
+
+With --trace FILE, the VM writes a record for every instruction it runs:
+
+    frame, position, opcode, change of the stack depth, jump target
+
+The target is the position that ran next if the instruction jumped, or -1.
+Records are packed into a large buffer before they are written, and the file
+is compressed with gzip if its name ends in .gz. The JIT is off while
+tracing, so every instruction gets a record, but a block of the --ir gets
+one for all of it. Modules run untraced while they are imported.
+
+`binarypp trace FILE` reads a trace back and prints the instructions that ran
+most, the jumps taken most and how often each loop went around. Given a
+second trace, it prints where the two runs went different ways.
+"""
+
+import argparse
+import gzip
+import itertools
+import struct
+from collections import Counter
+from typing import IO, TYPE_CHECKING, Callable, Iterator, List, Optional, Tuple
+
+import binarypp
+import binarypp.logging as logging
+from binarypp.types import Instruction
+from binarypp.vm.opcodes import *
+from binarypp.vm.opmap import OP_MAP
+
+if TYPE_CHECKING:
+    from binarypp.vm.vm import VirtualMachine
+
+MAGIC = b"BPPT"
+VERSION = 1
+
+HEADER = struct.Struct("<4sH")  # magic, version
+RECORD = struct.Struct("<HIHhi")  # frame, position, opcode, stack delta, target
+
+# Bytes collected before they are written
+BUFFER_SIZE = 1 << 20
+
+Record = Tuple[int, int, int, int, int]
+
+
+def open_trace(path: str, mode: str) -> IO[bytes]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)  # type: ignore
+    return open(path, mode)
+
+
+class TraceWriter:
+    def __init__(self, path: str):
+        self.file: IO[bytes] = open_trace(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.buffer: bytearray = bytearray()
+
+        # Instruction whose record is written once the next one is fetched,
+        # as its frame, position, opcode, stack depth before it ran and the
+        # position that runs next unless it jumps
+        self.last: Optional[Tuple[int, int, int, int, int]] = None
+
+    def wrap(
+        self, vm: "VirtualMachine", fetch: Callable[[], Optional[Instruction]]
+    ) -> Callable[[], Optional[Instruction]]:
+        """
+        Returns a fetch function that records the instructions fetch returns.
+        """
+        # The stack may swap its array for a list, so it is looked up each time
+        stack = vm.stack
+        ip = vm.IP
+
+        def fetch_traced() -> Optional[Instruction]:
+            if self.last is not None:
+                self.record(ip.frame, ip.inst, len(stack.stack))
+
+            inst = fetch()
+            if inst is None:
+                return None
+
+            opcode = inst.opcode
+            following = ip.inst
+            if opcode == EXEC_BLOCK:
+                following = vm.frames[ip.frame].blocks[inst.opargs[0]].end - 1
+            elif opcode in DYNAMIC_VARIANTS:
+                following += 1
+            self.last = (ip.frame, ip.inst, opcode, len(stack.stack), following)
+            return inst
+
+        return fetch_traced
+
+    def record(self, frame: int, position: int, depth: int) -> None:
+        """
+        Writes the record of the last instruction, given where the instruction
+        pointer went and the stack depth after it.
+        """
+        assert self.last is not None
+        last_frame, last_position, opcode, last_depth, following = self.last
+        target = -1
+        if frame != last_frame or position != following:
+            target = position + 1
+
+        self.buffer += RECORD.pack(
+            last_frame, last_position, opcode, depth - last_depth, target
+        )
+        self.last = None
+        if len(self.buffer) >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        self.file.write(self.buffer)
+        self.buffer.clear()
+
+    def close(self, vm: "VirtualMachine") -> None:
+        if self.last is not None:
+            self.record(vm.IP.frame, self.last[4], len(vm.stack.stack))
+        self.flush()
+        self.file.close()
+
+
+def read(path: str) -> Iterator[Record]:
+    """
+    Yields the records of a trace.
+    """
+    with open_trace(path, "rb") as file:
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, VERSION):
+            logging.error("'{}' is not a trace".format(path))
+
+        # Whole records are read at once
+        size = BUFFER_SIZE - BUFFER_SIZE % RECORD.size
+        while True:
+            data = file.read(size)
+            if not data:
+                return
+            end = len(data) - len(data) % RECORD.size
+            yield from RECORD.iter_unpack(data[:end])
+
+
+def describe(record: Record) -> str:
+    frame, position, opcode, _, _ = record
+    return "{}:{} {}".format(frame, position, OP_MAP.get(opcode, opcode))
+
+
+class Summary:
+    def __init__(self) -> None:
+        self.records: int = 0
+        self.instructions: Counter[Tuple[int, int, int]] = Counter()
+        self.jumps: Counter[Tuple[int, int, int]] = Counter()
+
+    def add(self, record: Record) -> None:
+        frame, position, opcode, _, target = record
+        self.records += 1
+        self.instructions[frame, position, opcode] += 1
+        if target != -1:
+            self.jumps[frame, position, target] += 1
+
+    def loops(self) -> List[Tuple[Tuple[int, int, int], int]]:
+        """
+        Returns the backward jumps by how often they ran, which is how often
+        their loop went around.
+        """
+        return [
+            (jump, count)
+            for jump, count in self.jumps.most_common()
+            if jump[2] <= jump[1]
+        ]
+
+    def report(self, top: int) -> str:
+        lines = [f"Instructions: {self.records}", "", "Hottest instructions:"]
+        for (frame, position, opcode), count in self.instructions.most_common(top):
+            lines.append(
+                "  {:>12}  {}".format(count, describe((frame, position, opcode, 0, -1)))
+            )
+
+        lines += ["", "Hottest jumps:"]
+        for (frame, position, target), count in self.jumps.most_common(top):
+            lines.append("  {:>12}  {}:{} -> {}".format(count, frame, position, target))
+
+        lines += ["", "Loop iterations:"]
+        for (frame, position, target), count in self.loops()[:top]:
+            lines.append("  {:>12}  {}:{} -> {}".format(count, frame, target, position))
+        return "\n".join(lines)
+
+
+def divergence(first: Iterator[Record], second: Iterator[Record]) -> str:
+    """
+    Returns where two runs start to run different instructions.
+    """
+    for index, (a, b) in enumerate(itertools.zip_longest(first, second)):
+        if a is None or b is None:
+            ended = "first" if a is None else "second"
+            return f"The {ended} run ends after {index} instructions"
+        if a[:3] != b[:3]:
+            return "The runs diverge at instruction {}: {} and {}".format(
+                index, describe(a), describe(b)
+            )
+        if a[4] != b[4]:
+            return "The runs diverge after instruction {} {}: {} and {}".format(
+                index, describe(a), jump(a), jump(b)
+            )
+    return "The runs are the same"
+
+
+def jump(record: Record) -> str:
+    return "no jump" if record[4] == -1 else f"jump to {record[4]}"
+
+
+def main(argv: List[str]) -> None:
+    """
+    Summarizes a trace, or compares two.
+    """
+    parser = argparse.ArgumentParser(f"{binarypp.__name__} trace")
+    parser.add_argument(
+        "--top",
+        "-n",
+        help="Entries of each list. Defaults to 10.",
+        type=int,
+        default=10,
+    )
+    parser.add_argument(
+        "--diff",
+        help="Another trace to find where the runs diverge.",
+    )
+    parser.add_argument("FILE", help="Trace written with --trace.")
+    args = parser.parse_args(argv)
+
+    if args.diff:
+        print(divergence(read(args.FILE), read(args.diff)))
+        return
+
+    summary = Summary()
+    for record in read(args.FILE):
+        summary.add(record)
+    print(summary.report(args.top))
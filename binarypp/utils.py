@@ -22,45 +22,68 @@ def binary_to_chars(binary: List[str]) -> str:
 # ==================== #
 
 
-def levenshtein_distance(sample: str, test: str) -> int:
+def levenshtein_distance(sample: str, test: str, limit: Optional[int] = None) -> int:
+    """
+    Returns the edit distance between two strings, ignoring case. With a limit,
+    it stops as soon as the distance is known to be over it and returns
+    limit + 1.
+    """
     # Sources:
     # https://stackabuse.com/levenshtein-distance-and-text-similarity-in-python/
     # https://www.datacamp.com/community/tutorials/fuzzy-string-python
 
     sample, test = sample.lower(), test.lower()
-    rows = len(sample) + 1
-    cols = len(test) + 1
-    matrix = [[0] * cols for _ in range(rows)]
-
-    # Populate the matrix
-    for x in range(1, rows):
-        for y in range(1, cols):
-            matrix[x][0] = x
-            matrix[0][y] = y
-
-    # Calculate the cost
-    for x in range(1, rows):
-        for y in range(1, cols):
-            if sample[x - 1] == test[y - 1]:
-                matrix[x][y] = min(
-                    matrix[x - 1][y] + 1, matrix[x - 1][y - 1], matrix[x][y - 1] + 1
-                )
-            else:
-                matrix[x][y] = min(
-                    matrix[x - 1][y] + 1, matrix[x - 1][y - 1] + 1, matrix[x][y - 1] + 1
-                )
-
-    return matrix[rows - 1][cols - 1]
+    if limit is not None and abs(len(sample) - len(test)) > limit:
+        return limit + 1
+
+    # What both start or end with takes no edits
+    while sample and test and sample[-1] == test[-1]:
+        sample, test = sample[:-1], test[:-1]
+    while sample and test and sample[0] == test[0]:
+        sample, test = sample[1:], test[1:]
+
+    # Only the previous row of the matrix is needed for the next one. With a
+    # limit, only the cells at most limit away from the diagonal can be within
+    # it, and the rest count as over it.
+    over = len(sample) + len(test) + 1 if limit is None else limit + 1
+    width = over if limit is None else limit
+    previous = list(range(len(test) + 1))
+    for x, char in enumerate(sample, 1):
+        start = max(1, x - width)
+        end = min(len(test), x + width) + 1
+
+        current = [over] * (len(test) + 1)
+        current[0] = x
+        for y in range(start, end):
+            current[y] = min(
+                previous[y] + 1,
+                current[y - 1] + 1,
+                previous[y - 1] + (char != test[y - 1]),
+            )
+
+        # Distances never get smaller further down
+        first = start - 1
+        if limit is not None and min(current[first:end]) > limit:
+            return over
+        previous = current
+
+    return min(previous[-1], over)
 
 
 def fuzzy_search(query: str, tests: List[str]) -> Optional[str]:
-    distances = [(test, levenshtein_distance(query, test)) for test in tests]
-    distances.sort(key=lambda match: match[1])
-
-    if distances:
-        return min(
-            filter(lambda match: match[1] & distances[0][1], distances),
-            key=lambda m: m[1],
-        )[0]
-    else:
-        return None
+    """
+    Returns the first of the tests closest to the query. Each one is only
+    compared until it is known not to be closer than the best so far.
+    """
+    best: Optional[str] = None
+    best_distance = 0
+
+    for test in tests:
+        limit = None if best is None else best_distance - 1
+        distance = levenshtein_distance(query, test, limit)
+        if best is None or distance < best_distance:
+            best, best_distance = test, distance
+            if distance == 0:
+                break
+
+    return best
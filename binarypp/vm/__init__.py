@@ -1 +1,14 @@
-from .vm import VirtualMachine
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .vm import VirtualMachine
+
+
+def __getattr__(name: str) -> Any:
+    # The VM is only imported once it is used, so modules like the opcodes
+    # can be imported on their own
+    if name == "VirtualMachine":
+        from .vm import VirtualMachine
+
+        return VirtualMachine
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,238 @@
+"""
+Control flow analysis of loaded instruction streams.
+
+The graph splits a stream into basic blocks: runs of instructions that are
+only entered at the first one and only left after the last one. Instructions
+with a forwarded argument keep the instruction they skip over in their block.
+
+Positions a frame can be entered at from outside its own code are entry points.
+That is the start of the stream and, for frames other modules may jump into,
+every marker.
+"""
+
+import bisect
+from typing import Dict, List, Optional, Set
+
+from binarypp.types import Instruction
+from binarypp.vm.opcodes import *
+
+# Jumps whose target is only known while running
+RELATIVE = {
+    IF_RUN_NEXT,
+    SKIP_NEXT,
+    GO_BACK,
+    IF_RUN_NEXT_DYN,
+    SKIP_NEXT_DYN,
+    GO_BACK_DYN,
+}
+
+# Jumps that GOTO_MARKER 0 can return from
+GOTOS = {GOTO_MARKER, JUMP_MARKER, GOTO_MARKER_DYN, GOTO_MODULE, JUMP_MODULE}
+
+
+class Block:
+    def __init__(self, start: int, end: int):
+        self.start: int = start
+        self.end: int = end  # Position after the last instruction
+
+        # Starts of the blocks that run before and after this one
+        self.predecessors: List[int] = []
+        self.successors: List[int] = []
+
+    def __repr__(self) -> str:
+        return "Block({}, {})".format(self.start, self.end)
+
+
+class CFG:
+    def __init__(self, stream: List[Instruction], exported: bool = True):
+        """
+        Builds the graph of a loaded stream. Frames that aren't exported can
+        only be entered at the start, i.e. no other module jumps to a marker.
+        """
+        self.stream: List[Instruction] = stream
+
+        # Positions of the MAKE_MARKERs of each address
+        self.markers: Dict[int, List[int]] = {}
+        for index, inst in enumerate(stream):
+            if inst.opcode == MAKE_MARKER and inst.opargs:
+                self.markers.setdefault(inst.opargs[0], []).append(index)
+
+        opcodes = {inst.opcode for inst in stream}
+
+        # Whether a goto can be returned from through GOTO_MARKER 0, which
+        # makes the instruction after each goto reachable
+        self.returns: bool = GOTO_MARKER_DYN in opcodes or any(
+            inst.opcode == GOTO_MARKER and inst.opargs == [0] for inst in stream
+        )
+        self.returns |= GOTO_MODULE in opcodes or JUMP_MODULE in opcodes
+
+        # Whether some jump targets are only known while running
+        self.dynamic: bool = False
+
+        self.entries: List[int] = [0]
+        if exported or GOTO_MARKER_DYN in opcodes:
+            for positions in self.markers.values():
+                self.entries.extend(position + 1 for position in positions)
+        for index, inst in enumerate(stream):
+            if inst.opcode == MAKE_MARKER_DYN:
+                self.entries.append(index + 2)
+
+        self.blocks: Dict[int, Block] = {}
+        self.starts: List[int] = []
+        self.build_blocks()
+
+    def successors(self, index: int) -> Optional[List[int]]:
+        """
+        Returns the positions that can run after the instruction at index, or
+        None if they aren't known before running. Positions past the end of
+        the stream stop the program.
+        """
+        inst = self.stream[index]
+        opcode = inst.opcode
+
+        if opcode == JUMP_ABSOLUTE:
+            targets = [inst.opargs[0] + 1]
+        elif opcode == POP_JUMP_IF_FALSE:
+            targets = [index + 1, inst.opargs[0] + 1]
+        elif opcode in RELATIVE:
+            return None
+
+        elif opcode == GOTO_MARKER and inst.opargs == [0]:
+            return []
+        elif opcode == GOTO_MARKER and not inst.opargs:
+            # Skipped by GOTO_MARKER_DYN, which took its argument
+            targets = [index + 1]
+        elif opcode == GOTO_MARKER:
+            positions = self.markers.get(inst.opargs[0], [])
+            targets = [position + 1 for position in positions]
+        elif opcode == JUMP_MARKER:
+            targets = [inst.opargs[0] + 1]
+        elif opcode == GOTO_MARKER_DYN:
+            targets = [
+                position + 1
+                for positions in self.markers.values()
+                for position in positions
+            ]
+        elif opcode in (GOTO_MODULE, JUMP_MODULE):
+            targets = []
+
+        # Variants with a forwarded argument skip the instruction after them
+        elif opcode in DYNAMIC.values():
+            targets = [index + 2]
+        else:
+            targets = [index + 1]
+
+        if opcode in GOTOS and self.returns:
+            targets.append(index + 1 if opcode != GOTO_MARKER_DYN else index + 2)
+        if any(target < 0 for target in targets):
+            return None
+        return targets
+
+    def build_blocks(self) -> None:
+        leaders = set(self.entries)
+        for index in range(len(self.stream)):
+            targets = self.successors(index)
+            if targets is None:
+                self.dynamic = True
+            elif targets != [self.next(index)]:
+                leaders.update(targets)
+                leaders.add(self.next(index))
+
+        self.starts = sorted(
+            index for index in leaders if 0 <= index < len(self.stream)
+        )
+
+        for start, end in zip(self.starts, self.starts[1:] + [len(self.stream)]):
+            self.blocks[start] = Block(start, end)
+
+        for block in self.blocks.values():
+            targets = self.successors(self.last(block)) or []
+            for target in sorted(set(targets)):
+                if target in self.blocks:
+                    block.successors.append(target)
+                    self.blocks[target].predecessors.append(block.start)
+
+    def next(self, index: int) -> int:
+        """
+        Returns the position after an instruction, skipping the instruction
+        a forwarded argument variant runs in place of.
+        """
+        return index + 2 if self.stream[index].opcode in DYNAMIC.values() else index + 1
+
+    def last(self, block: Block) -> int:
+        """
+        Returns the position of the last instruction run in a block.
+        """
+        index = block.start
+        while self.next(index) < block.end:
+            index = self.next(index)
+        return index
+
+    def block_at(self, index: int) -> Block:
+        return self.blocks[self.starts[bisect.bisect_right(self.starts, index) - 1]]
+
+    def reachable(self, entries: Optional[List[int]] = None) -> Set[int]:
+        """
+        Returns the positions of the instructions that can run when starting at
+        the entry points, including the instructions skipped by a variant with
+        a forwarded argument.
+        """
+        pending = list(self.entries if entries is None else entries)
+        seen: Set[int] = set()
+
+        while pending:
+            index = pending.pop()
+            if index in seen or not 0 <= index < len(self.stream):
+                continue
+            seen.add(index)
+
+            if self.next(index) == index + 2:
+                seen.add(index + 1)
+            pending.extend(self.successors(index) or [])
+
+        return seen
+
+    def loop_headers(self) -> Set[int]:
+        """
+        Returns the starts of the blocks that a back edge jumps to.
+        """
+        headers: Set[int] = set()
+        visited: Set[int] = set()
+
+        for entry in self.entries:
+            if entry not in self.blocks or entry in visited:
+                continue
+
+            # Depth-first search keeping the blocks on the current path
+            path = {entry}
+            stack = [(entry, iter(self.blocks[entry].successors))]
+            visited.add(entry)
+            while stack:
+                start, successors = stack[-1]
+                target = next(successors, None)
+                if target is None:
+                    stack.pop()
+                    path.discard(start)
+                elif target in path:
+                    headers.add(target)
+                elif target not in visited:
+                    visited.add(target)
+                    path.add(target)
+                    stack.append((target, iter(self.blocks[target].successors)))
+
+        return headers
+
+    def used_markers(self) -> Optional[Set[int]]:
+        """
+        Returns the addresses of the markers that are jumped to, or None if any
+        marker can be.
+        """
+        used: Set[int] = set()
+        for inst in self.stream:
+            if inst.opcode == GOTO_MARKER_DYN:
+                return None
+            if inst.opcode == GOTO_MARKER and inst.opargs:
+                used.add(inst.opargs[0])
+            elif inst.opcode == JUMP_MARKER:
+                used.add(inst.opargs[1])
+        return used
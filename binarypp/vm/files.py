@@ -0,0 +1,136 @@
+"""
+Table of the files opened by a program.
+
+OPEN_FILE pushes the number of a handle in the table rather than the file
+itself. Only a limited number of files is kept open at once: when another one
+is needed, the least recently used file is closed, and it is opened again
+where it was left the next time its handle is used. Handles reading the same
+path in the same mode share one open file, each keeping its own position.
+
+Every file is flushed and closed when the program ends.
+"""
+
+from collections import OrderedDict
+from typing import IO, Any, Dict, Hashable, Optional, Set
+
+import binarypp.logging as logging
+
+CAPACITY = 64
+
+# Modes whose handles can share an open file
+SHARED_MODES = {"r", "rb"}
+
+# Modes to open a file with again without truncating it or failing because
+# it exists
+REOPEN_MODES = {
+    "w": "r+",
+    "w+": "r+",
+    "wb": "rb+",
+    "wb+": "rb+",
+    "x": "r+",
+    "x+": "r+",
+    "xb": "rb+",
+    "xb+": "rb+",
+}
+
+
+class Handle:
+    def __init__(self, path: str, mode: str, key: Hashable):
+        self.path: str = path
+        self.mode: str = mode
+        self.key: Hashable = key  # Key of the open file the handle uses
+        self.position: int = 0
+
+
+class FileTable:
+    def __init__(
+        self,
+        capacity: int = CAPACITY,
+        limit: Optional[int] = None,
+        deferred: bool = False,
+    ):
+        """
+        Keeps at most capacity files open at once. The limit is the number of
+        files a program may open. Deferred files are only opened once they
+        are used rather than by OPEN_FILE.
+        """
+        self.capacity: int = max(capacity, 1)
+        self.limit: Optional[int] = limit
+        self.deferred: bool = deferred
+        self.handles: Dict[int, Handle] = {}
+
+        # Open files by key, from least to most recently used, and the handle
+        # whose position each one is at
+        self.open_files: "OrderedDict[Hashable, IO[Any]]" = OrderedDict()
+        self.users: Dict[Hashable, int] = {}
+
+        # Keys of files that were opened before, and must not be truncated
+        self.opened: Set[Hashable] = set()
+
+    def open(self, path: str, mode: str) -> int:
+        """
+        Opens a file and returns the number of its handle.
+        """
+        if self.limit is not None and len(self.handles) >= self.limit:
+            logging.error(
+                "Resource limit exceeded: more than {} open files".format(self.limit)
+            )
+
+        number = len(self.handles) + 1
+        key: Hashable = (path, mode) if mode in SHARED_MODES else number
+        self.handles[number] = Handle(path, mode, key)
+
+        # Open right away, so errors show up at OPEN_FILE
+        if not self.deferred:
+            self.get(number)
+        return number
+
+    def get(self, number: Any) -> Optional[IO[Any]]:
+        """
+        Returns the file of a handle, at the handle's position, or None if
+        there is no such handle.
+        """
+        handle = self.handles.get(number) if isinstance(number, int) else None
+        if handle is None:
+            return None
+
+        key = handle.key
+        file = self.open_files.get(key)
+        if file is None:
+            mode = handle.mode
+            if key in self.opened:
+                mode = REOPEN_MODES.get(mode, mode)
+
+            file = open(handle.path, mode)
+            self.opened.add(key)
+            self.open_files[key] = file
+            if len(self.open_files) > self.capacity:
+                self.evict()
+        else:
+            self.open_files.move_to_end(key)
+
+        user = self.users.get(key)
+        if user != number:
+            if user is not None:
+                self.handles[user].position = file.tell()
+            if user is not None or handle.position:
+                file.seek(handle.position)
+            self.users[key] = number
+
+        return file
+
+    def evict(self) -> None:
+        """
+        Closes the least recently used file.
+        """
+        key, file = self.open_files.popitem(last=False)
+        user = self.users.pop(key, None)
+        if user is not None:
+            self.handles[user].position = file.tell()
+        file.close()
+
+    def close(self) -> None:
+        while self.open_files:
+            _, file = self.open_files.popitem()
+            file.close()
+        self.users.clear()
@@ -0,0 +1,129 @@
+"""
+Fixed-width integer arithmetic.
+
+In fixed-width mode integers behave like two's complement machine integers of
+the chosen width: the result of every arithmetic and bitwise instruction wraps
+around to that many bits, so numbers never grow past it. Programs that never
+overflow run the same as without it. Values that aren't integers,
+like strings or the result of a true division, are left as they are.
+
+The arithmetic instructions of a frame are replaced by WRAP_ARITHMETIC before
+it runs, which keeps the interpreter's own arithmetic free of any checks.
+"""
+
+import functools
+import operator
+from array import array
+from typing import Any, Callable, Dict, List
+
+import binarypp.vm.ir as ir
+from binarypp.types import Instruction
+from binarypp.vm.opcodes import *
+from binarypp.vm.opmap import OP_MAP
+
+WIDTHS = (8, 16, 32, 64)
+
+# Instructions whose integer results are wrapped. Comparisons give booleans.
+WRAPPED = {
+    BINARY_ADD,
+    BINARY_SUBTRACT,
+    BINARY_MULTIPLY,
+    BINARY_POWER,
+    BINARY_TRUE_DIVIDE,
+    BINARY_FLOOR_DIVIDE,
+    BINARY_MODULO,
+    BINARY_AND,
+    BINARY_OR,
+    BINARY_XOR,
+    BINARY_NOT,
+    BINARY_LEFT_SHIFT,
+    BINARY_RIGHT_SHIFT,
+}
+
+
+def typecode(width: int) -> str:
+    """
+    Returns the code of the smallest signed array type holding width bits.
+    """
+    for code in "bhilq":
+        if array(code).itemsize * 8 >= width:
+            return code
+    raise ValueError(f"No array type holds {width} bits")
+
+
+def wrapping(function: Callable[..., Any], width: int) -> Callable[..., Any]:
+    mask = (1 << width) - 1
+    half = 1 << (width - 1)
+
+    def wrapped(*args: Any) -> Any:
+        result = function(*args)
+        if result.__class__ is int:
+            return ((result + half) & mask) - half
+        return result
+
+    return wrapped
+
+
+def power(width: int) -> Callable[[Any, Any], Any]:
+    modulus = 1 << width
+    half = 1 << (width - 1)
+
+    def wrapped(a: Any, b: Any) -> Any:
+        # Only the low bits are kept, so they are all that is computed
+        if a.__class__ is int and b.__class__ is int and b >= 0:
+            return ((pow(a, b, modulus) + half) % modulus) - half
+        return a**b
+
+    return wrapped
+
+
+def left_shift(width: int) -> Callable[[Any, Any], Any]:
+    shift = wrapping(operator.lshift, width)
+
+    def wrapped(a: Any, b: Any) -> Any:
+        if a.__class__ is int and b.__class__ is int and b >= width:
+            return 0
+        return shift(a, b)
+
+    return wrapped
+
+
+@functools.lru_cache(maxsize=None)
+def functions(width: int) -> Dict[int, Callable[..., Any]]:
+    """
+    Returns the wrapping function of each instruction for a width.
+    """
+    table: Dict[int, Callable[..., Any]] = {}
+    for opcode in WRAPPED:
+        if opcode == BINARY_POWER:
+            function = power(width)
+        elif opcode == BINARY_LEFT_SHIFT:
+            function = left_shift(width)
+        elif opcode == BINARY_NOT:
+            function = wrapping(operator.invert, width)
+        else:
+            function = wrapping(ir.BINARY_FUNCTIONS[opcode], width)
+
+        function.__name__ = f"{OP_MAP[opcode].lower()}_{width}"
+        table[opcode] = function
+    return table
+
+
+def wrapped(opcode: int, width: int) -> Instruction:
+    """
+    Returns the WRAP_ARITHMETIC standing in for an arithmetic instruction. Its
+    arguments are the opcode, the width and the wrapping function, which is
+    looked up once here rather than every time the instruction runs.
+    """
+    args: List[Any] = [opcode, width, functions(width)[opcode]]
+    return Instruction(WRAP_ARITHMETIC, args)
+
+
+def wrap_arithmetic(stream: List[Instruction], width: int) -> None:
+    """
+    Replaces the arithmetic instructions of a loaded stream with
+    WRAP_ARITHMETIC.
+    """
+    for index, inst in enumerate(stream):
+        if inst.opcode in WRAPPED:
+            stream[index] = wrapped(inst.opcode, width)
@@ -0,0 +1,373 @@
+"""
+Register IR for straight-line code.
+
+Runs of stack instructions inside a basic block are translated into operations
+on virtual registers. Every value is written to a register exactly once, and
+LOAD_MEMORY/STORE_MEMORY become reads and writes of memory cells. The stack
+is only touched where the run needs values pushed before it, and at its end,
+where the values it leaves behind are pushed.
+
+A run may end with JUMP_ABSOLUTE or POP_JUMP_IF_FALSE, in which case the
+condition is taken straight from its register.
+"""
+
+import operator
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from binarypp.types import Instruction, String
+from binarypp.vm.cfg import CFG
+from binarypp.vm.memory import Memory
+from binarypp.vm.opcodes import *
+from binarypp.vm.opmap import OP_MAP
+from binarypp.vm.stack import Stack
+
+# Operations are tuples that start with one of these
+POP = 0  # POP, dst
+PUSH = 1  # PUSH, src
+CONST = 2  # CONST, dst, value
+STRING = 3  # STRING, dst, codes
+LOAD = 4  # LOAD, dst, address
+STORE = 5  # STORE, address, src
+LOAD_INDIRECT = 6  # LOAD_INDIRECT, dst, address register
+STORE_INDIRECT = 7  # STORE_INDIRECT, address register, src
+BINARY = 8  # BINARY, dst, function, a, b
+UNARY = 9  # UNARY, dst, function, a
+
+Operation = Tuple[Any, ...]
+
+BINARY_FUNCTIONS: Dict[int, Callable[[Any, Any], Any]] = {
+    BINARY_ADD: operator.add,
+    BINARY_SUBTRACT: operator.sub,
+    BINARY_MULTIPLY: operator.mul,
+    BINARY_POWER: operator.pow,
+    BINARY_TRUE_DIVIDE: operator.truediv,
+    BINARY_FLOOR_DIVIDE: lambda a, b: int(a // b),
+    BINARY_MODULO: operator.mod,
+    BINARY_AND: operator.and_,
+    BINARY_OR: operator.or_,
+    BINARY_XOR: operator.xor,
+    BINARY_LEFT_SHIFT: operator.lshift,
+    BINARY_RIGHT_SHIFT: operator.rshift,
+    EQUALS_TO: operator.eq,
+    NOT_EQUAL_TO: operator.ne,
+    LESS_THAN: operator.lt,
+    LESS_EQUAL_THAN: operator.le,
+    GREATER_THAN: operator.gt,
+    GREATER_EQUAL_THAN: operator.ge,
+}
+
+# Names of the functions in dumps
+NAMES: Dict[Callable[..., Any], str] = {
+    function: OP_MAP[opcode].lower() for opcode, function in BINARY_FUNCTIONS.items()
+}
+NAMES[operator.invert] = "binary_not"
+
+TRANSLATABLE = set(BINARY_FUNCTIONS) | {
+    POP_STACK,
+    PUSH_STACK,
+    PUSH_STRING_STACK,
+    PUSH_LONG_STACK,
+    LOAD_MEMORY,
+    STORE_MEMORY,
+    DUP_TOP,
+    BINARY_NOT,
+    FORWARD_ARGS,
+    ROT_TWO,
+    ROT_THREE,
+    PUSH_STACK_DYN,
+    LOAD_MEMORY_DYN,
+    STORE_MEMORY_DYN,
+    JUMP_ABSOLUTE,
+    POP_JUMP_IF_FALSE,
+    WRAP_ARITHMETIC,
+}
+
+# Runs shorter than this are left to the interpreter
+MIN_LENGTH = 2
+
+
+class Block:
+    def __init__(self, start: int, end: int):
+        self.start: int = start
+        self.end: int = end  # Position after the last instruction
+        self.ops: List[Operation] = []
+        self.registers: int = 0
+
+        # Positions and instructions the block was translated from
+        self.instructions: List[Tuple[int, Instruction]] = []
+
+        # Where to continue, as the value the instruction pointer is set to.
+        # If there is a condition and it is false, the target is taken.
+        self.exit: int = end - 1
+        self.condition: Optional[int] = None
+        self.target: int = end - 1
+
+    def run(self, memory: Memory, stack: Stack) -> int:
+        """
+        Runs the block and returns the new value of the instruction pointer.
+        """
+        regs: List[Any] = [None] * self.registers
+
+        for op in self.ops:
+            kind = op[0]
+            if kind == BINARY:
+                regs[op[1]] = op[2](regs[op[3]], regs[op[4]])
+            elif kind == LOAD:
+                regs[op[1]] = memory[op[2]]
+            elif kind == STORE:
+                memory[op[1]] = regs[op[2]]
+            elif kind == CONST:
+                regs[op[1]] = op[2]
+            elif kind == POP:
+                regs[op[1]] = stack.pop()
+            elif kind == PUSH:
+                stack.push(regs[op[1]])
+            elif kind == STRING:
+                regs[op[1]] = String(op[2])
+            elif kind == UNARY:
+                regs[op[1]] = op[2](regs[op[3]])
+            elif kind == LOAD_INDIRECT:
+                regs[op[1]] = memory[regs[op[2]]]
+            elif kind == STORE_INDIRECT:
+                memory[regs[op[1]]] = regs[op[2]]
+
+        if self.condition is not None and not regs[self.condition]:
+            return self.target
+        return self.exit
+
+
+class Translator:
+    """
+    Translates a run of instructions by keeping a stack of the registers that
+    hold the values the instructions would have pushed.
+    """
+
+    def __init__(self, block: Block):
+        self.block: Block = block
+        self.stack: List[int] = []
+
+        # Registers holding the value of memory cells, for loads after a store
+        self.cells: Dict[int, int] = {}
+
+    def register(self) -> int:
+        self.block.registers += 1
+        return self.block.registers - 1
+
+    def emit(self, *op: Any) -> None:
+        self.block.ops.append(op)
+
+    def push(self, reg: int) -> None:
+        self.stack.append(reg)
+
+    def pop(self) -> int:
+        if self.stack:
+            return self.stack.pop()
+
+        # The value was pushed before the run started
+        reg = self.register()
+        self.emit(POP, reg)
+        return reg
+
+    def define(self, kind: int, *args: Any) -> int:
+        reg = self.register()
+        self.emit(kind, reg, *args)
+        self.push(reg)
+        return reg
+
+    def translate(self, inst: Instruction, index: int) -> None:
+        opcode = inst.opcode
+        args = inst.opargs
+
+        if opcode in BINARY_FUNCTIONS:
+            b = self.pop()
+            a = self.pop()
+            self.define(BINARY, BINARY_FUNCTIONS[opcode], a, b)
+
+        elif opcode == PUSH_STACK:
+            self.define(CONST, args[0])
+
+        elif opcode == LOAD_MEMORY:
+            if args[0] in self.cells:
+                self.push(self.cells[args[0]])
+            else:
+                reg = self.define(LOAD, args[0])
+                # Loading address 0 is an error every time
+                if args[0] != 0:
+                    self.cells[args[0]] = reg
+
+        elif opcode == STORE_MEMORY:
+            reg = self.pop()
+            self.emit(STORE, args[0], reg)
+            if args[0] != 0:
+                self.cells[args[0]] = reg
+
+        elif opcode == DUP_TOP:
+            reg = self.pop()
+            self.push(reg)
+            self.push(reg)
+
+        elif opcode == POP_STACK:
+            self.pop()
+
+        elif opcode == PUSH_STRING_STACK:
+            self.define(STRING, args)
+
+        elif opcode == PUSH_LONG_STACK:
+            long = args[0]
+            for arg in args[1:]:
+                long <<= 8
+                long += arg
+            self.define(CONST, long)
+
+        elif opcode == BINARY_NOT:
+            self.define(UNARY, operator.invert, self.pop())
+
+        elif opcode == WRAP_ARITHMETIC:
+            function = args[2]
+            if args[0] == BINARY_NOT:
+                self.define(UNARY, function, self.pop())
+            else:
+                b = self.pop()
+                a = self.pop()
+                self.define(BINARY, function, a, b)
+
+        elif opcode == ROT_TWO:
+            a = self.pop()
+            b = self.pop()
+            self.push(a)
+            self.push(b)
+
+        elif opcode == ROT_THREE:
+            a = self.pop()
+            b = self.pop()
+            c = self.pop()
+            self.push(a)
+            self.push(c)
+            self.push(b)
+
+        elif opcode == PUSH_STACK_DYN:
+            self.push(self.pop())
+
+        elif opcode == LOAD_MEMORY_DYN:
+            self.define(LOAD_INDIRECT, self.pop())
+
+        elif opcode == STORE_MEMORY_DYN:
+            addr = self.pop()
+            self.emit(STORE_INDIRECT, addr, self.pop())
+            # Any cell may have changed
+            self.cells.clear()
+
+        elif opcode == JUMP_ABSOLUTE:
+            self.block.exit = args[0]
+
+        elif opcode == POP_JUMP_IF_FALSE:
+            self.block.condition = self.pop()
+            self.block.exit = index
+            self.block.target = args[0]
+
+    def finish(self) -> None:
+        # Leave the values on the stack the way the instructions would have
+        for reg in self.stack:
+            self.emit(PUSH, reg)
+
+
+def translate(graph: CFG, start: int, end: int) -> Optional[Block]:
+    """
+    Translates the run of instructions from start, up to the end of its basic
+    block. Returns None if the run is too short to be worth it.
+    """
+    stream = graph.stream
+    index = start
+    length = 0
+    while index < end:
+        opcode = stream[index].opcode
+        if opcode not in TRANSLATABLE:
+            break
+
+        # Backward jumps are left to the interpreter, which counts them to
+        # find hot loops
+        if opcode == JUMP_ABSOLUTE and stream[index].opargs[0] < index:
+            break
+
+        length += 1
+        index = graph.next(index)
+        if opcode in (JUMP_ABSOLUTE, POP_JUMP_IF_FALSE):
+            break
+
+    if length < MIN_LENGTH:
+        return None
+
+    block = Block(start, index)
+    translator = Translator(block)
+    position = start
+    while position < index:
+        block.instructions.append((position, stream[position]))
+        translator.translate(stream[position], position)
+        position = graph.next(position)
+    translator.finish()
+
+    return block
+
+
+def compile_stream(stream: List[Instruction]) -> List[Block]:
+    """
+    Translates every run of instructions in a loaded stream that is worth it.
+    Streams whose jumps can't all be resolved are left alone, since a run must
+    never be entered halfway.
+    """
+    graph = CFG(stream)
+    if graph.dynamic:
+        return []
+
+    blocks: List[Block] = []
+    for cfg_block in graph.blocks.values():
+        index = cfg_block.start
+        while index < cfg_block.end:
+            block = translate(graph, index, cfg_block.end)
+            if block is None:
+                index = graph.next(index)
+            else:
+                blocks.append(block)
+                index = block.end
+
+    return blocks
+
+
+def dump(blocks: List[Block]) -> str:
+    lines = []
+    for number, block in enumerate(blocks):
+        lines.append(f"block {number} [{block.start}, {block.end})")
+        for op in block.ops:
+            lines.append("    " + format_op(op))
+
+        if block.condition is not None:
+            lines.append(f"    if not r{block.condition} continue after {block.target}")
+        lines.append(f"    continue after {block.exit}")
+    return "\n".join(lines)
+
+
+def format_op(op: Operation) -> str:
+    kind = op[0]
+    if kind == POP:
+        return f"r{op[1]} = pop"
+    if kind == PUSH:
+        return f"push r{op[1]}"
+    if kind == CONST:
+        return f"r{op[1]} = {op[2]!r}"
+    if kind == STRING:
+        return f"r{op[1]} = {''.join(map(chr, op[2]))!r}"
+    if kind == LOAD:
+        return f"r{op[1]} = MEMORY[{op[2]}]"
+    if kind == STORE:
+        return f"MEMORY[{op[1]}] = r{op[2]}"
+    if kind == LOAD_INDIRECT:
+        return f"r{op[1]} = MEMORY[r{op[2]}]"
+    if kind == STORE_INDIRECT:
+        return f"MEMORY[r{op[1]}] = r{op[2]}"
+    if kind == BINARY:
+        return f"r{op[1]} = {name(op[2])} r{op[3]}, r{op[4]}"
+    return f"r{op[1]} = {name(op[2])} r{op[3]}"
+
+
+def name(function: Callable[..., Any]) -> str:
+    return NAMES.get(function, function.__name__)
@@ -0,0 +1,87 @@
+"""
+Tracing JIT for hot loops.
+
+The interpreter counts how often each backward jump runs. Once a jump reaches
+the threshold, the next iteration of its loop is recorded along with the
+direction every branch went. The trace is compiled into a single Python
+function that keeps running the loop for as long as the branches go the same
+way. When one doesn't, the function pushes the values the interpreter expects
+on the stack and returns the position to continue at.
+
+The backward jump is then replaced by ENTER_TRACE, so the trace runs the next
+time the loop comes around. Recording and compiling traces is left to
+binarypp.vm.traces, which is imported once the first loop gets hot.
+"""
+
+import sys
+from typing import TYPE_CHECKING, List
+
+from binarypp.types import Instruction
+from binarypp.vm.opcodes import *
+
+if TYPE_CHECKING:
+    from binarypp.vm.traces import Trace
+    from binarypp.vm.vm import Frame, VirtualMachine
+
+THRESHOLD = 100
+
+
+class JIT:
+    def __init__(self, threshold: int = THRESHOLD, dump: bool = False):
+        self.threshold: int = threshold
+        self.dump: bool = dump
+        self.traces: List["Trace"] = []
+
+    @property
+    def entries(self) -> int:
+        return sum(trace.entries for trace in self.traces)
+
+    @property
+    def exits(self) -> int:
+        return sum(sum(trace.exits.values()) for trace in self.traces)
+
+    def back_edge(self, vm: "VirtualMachine", frame: "Frame") -> None:
+        """
+        Counts a backward jump that is about to run, and starts recording its
+        loop once it is hot.
+        """
+        position = vm.IP.inst
+        count = frame.back_edges.get(position, 0) + 1
+        frame.back_edges[position] = count
+
+        if count >= self.threshold and vm.recorder is None:
+            import binarypp.vm.traces
+
+            target = frame.stream[position].opargs[0]
+            vm.recorder = binarypp.vm.traces.Recorder(vm.IP.frame, position, target)
+            vm.fetch = vm.recorder.wrap(vm, vm.fetch)
+            # Don't record the same loop again right away if it fails
+            frame.back_edges[position] = -self.threshold
+
+    def install(self, frame: "Frame", trace: "Trace") -> None:
+        trace.compile(frame.memory)
+        if self.dump:
+            print(trace.source, file=sys.stderr)
+
+        original = frame.stream[trace.back_edge]
+        frame.stream[trace.back_edge] = Instruction(ENTER_TRACE, [len(frame.traces)])
+        frame.traces.append(trace)
+        self.traces.append(trace)
+
+        # Moving a marker the trace jumps to puts the backward jump back
+        for _, inst in trace.instructions:
+            if inst.opcode != JUMP_MARKER:
+                continue
+
+            addr = inst.opargs[1]
+            if original.opcode == JUMP_MARKER and original.opargs[1] == addr:
+                frame.add_jump_site(
+                    addr, frame, trace.back_edge, Instruction(GOTO_MARKER, [addr])
+                )
+            else:
+                frame.add_jump_site(addr, frame, trace.back_edge, original)
+
+    def summary(self) -> str:
+        return "JIT: {} traces, {} entries, {} side exits".format(
+            len(self.traces), self.entries, self.exits
+        )
@@ -0,0 +1,98 @@
+"""
+Lazy loading of a program as it runs.
+
+With --lazy, a frame starts running before its program is parsed. The parser
+reads the file in chunks and instructions are added to the stream once the
+VM reaches them, along with the markers they make, so a program that ends
+early never reads the rest of its file. Jumping to a marker that hasn't been
+seen yet parses ahead until it shows up.
+
+Only the rewriting that needs no more than the next instruction is done, so
+relative jumps are run as written. Passes over the whole stream, like the
+register IR, are left out.
+"""
+
+from typing import IO, TYPE_CHECKING, Iterator, Optional
+
+import binarypp.vm.fixedwidth as fixedwidth
+from binarypp.types import Instruction, Marker, Pointer
+from binarypp.vm.opcodes import *
+
+if TYPE_CHECKING:
+    from binarypp.vm.vm import Frame
+
+
+class LazyStream:
+    def __init__(
+        self,
+        instructions: Iterator[Instruction],
+        frame_index: int,
+        width: Optional[int] = None,
+        file: Optional[IO[str]] = None,
+    ):
+        """
+        Loads a frame from instructions as they come in. The file they are
+        parsed from is closed once they run out.
+        """
+        self.instructions: Iterator[Instruction] = instructions
+        self.frame_index: int = frame_index
+        self.width: Optional[int] = width
+        self.file: Optional[IO[str]] = file
+
+        # Instruction that was read ahead of the one before it
+        self.following: Optional[Instruction] = None
+
+    def load(self, frame: "Frame") -> bool:
+        """
+        Adds the next instruction to the stream of a frame. Returns False once
+        the program has ended.
+        """
+        inst = self.following or next(self.instructions, None)
+        self.following = None
+        if inst is None:
+            self.close()
+            frame.pending = None
+            return False
+
+        # Forwarded arguments are merged like the loader does, which is the
+        # only time the next instruction is read ahead
+        if inst.opcode == FORWARD_ARGS:
+            self.following = next(self.instructions, None)
+            if self.following is not None and self.following.opcode in DYNAMIC:
+                inst = Instruction(DYNAMIC[self.following.opcode])
+
+        elif self.width and inst.opcode in fixedwidth.WRAPPED:
+            inst = fixedwidth.wrapped(inst.opcode, self.width)
+
+        elif inst.opcode == MAKE_MARKER and inst.opargs:
+            # Only the first occurrence of a marker is known ahead
+            if inst.opargs[0] not in frame.markers:
+                position = Pointer(self.frame_index, len(frame.stream))
+                frame.markers[inst.opargs[0]] = Marker(position)
+
+        frame.stream.append(inst)
+        frame.stream_size = len(frame.stream) - 1
+        return True
+
+    def load_until(self, frame: "Frame", index: int) -> bool:
+        """
+        Loads the stream of a frame up to an index. Returns whether the
+        program reaches it.
+        """
+        while len(frame.stream) <= index:
+            if not self.load(frame):
+                return False
+        return True
+
+    def find_marker(self, frame: "Frame", addr: int) -> Optional[Marker]:
+        """
+        Loads the stream of a frame until a marker shows up.
+        """
+        while addr not in frame.markers:
+            if not self.load(frame):
+                return None
+        return frame.markers[addr]
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
@@ -0,0 +1,160 @@
+"""
+Load-time passes over an instruction stream.
+
+The parser returns instructions exactly as they were written. Before a stream
+is run, the loader rewrites it into internal instructions that are cheaper to
+execute. The rewriting passes keep the position of each instruction, so indices
+seen by the program (markers, relative jumps) are unaffected. Dead code is only
+removed once every jump has a fixed target that can be moved along.
+"""
+
+import bisect
+from typing import Dict, List
+
+from binarypp.types import Instruction
+from binarypp.vm.cfg import CFG
+from binarypp.vm.opcodes import *
+
+
+def load(stream: List[Instruction], exported: bool = True) -> List[Instruction]:
+    """
+    Returns a rewritten copy of the stream. The original list is left untouched
+    so a parsed program can be loaded more than once.
+
+    Markers of an exported stream are kept, since other modules can jump to
+    them.
+    """
+    stream = list(stream)
+
+    merge_forwarded_args(stream)
+    resolve_branches(stream)
+    resolve_markers(stream)
+
+    return eliminate_dead_code(stream, exported)
+
+
+def merge_forwarded_args(stream: List[Instruction]) -> None:
+    """
+    Replaces FORWARD_ARGS with a variant of the next instruction that pops its
+    argument from the stack, e.g. FORWARD_ARGS LOAD_MEMORY -> LOAD_MEMORY_DYN.
+
+    The forwarded instruction keeps its place so that positions don't move.
+    The variant skips over it when run.
+    """
+    for index in range(len(stream) - 1):
+        if stream[index].opcode != FORWARD_ARGS:
+            continue
+
+        next_opcode = stream[index + 1].opcode
+        if next_opcode in DYNAMIC:
+            stream[index] = Instruction(DYNAMIC[next_opcode])
+
+
+def resolve_branches(stream: List[Instruction]) -> None:
+    """
+    Rewrites the relative jumps into jumps to a fixed position.
+
+    IF_RUN_NEXT n  -> POP_JUMP_IF_FALSE to the n-th next instruction
+    SKIP_NEXT n    -> JUMP_ABSOLUTE to the n-th next instruction
+    GO_BACK n      -> JUMP_ABSOLUTE to the n-th previous instruction
+
+    Jumps with a forwarded offset were already merged by merge_forwarded_args.
+    """
+    for index, inst in enumerate(stream):
+        if not inst.opargs:
+            continue
+
+        if inst.opcode == IF_RUN_NEXT:
+            stream[index] = Instruction(POP_JUMP_IF_FALSE, [index + inst.opargs[0]])
+
+        elif inst.opcode == SKIP_NEXT:
+            stream[index] = Instruction(JUMP_ABSOLUTE, [index + inst.opargs[0]])
+
+        elif inst.opcode == GO_BACK:
+            stream[index] = Instruction(JUMP_ABSOLUTE, [index - inst.opargs[0] - 1])
+
+
+def resolve_markers(stream: List[Instruction]) -> None:
+    """
+    Rewrites GOTO_MARKER into JUMP_MARKER wherever the marker is made by exactly
+    one MAKE_MARKER in the stream, since its position can then only ever be
+    that instruction.
+
+    A MAKE_MARKER with a forwarded address can still redefine any marker while
+    running. The VM guards against this when a marker is set and turns the
+    affected jumps back into GOTO_MARKER.
+    """
+    definitions: Dict[int, List[int]] = {}
+    for index, inst in enumerate(stream):
+        if inst.opcode == MAKE_MARKER and inst.opargs:
+            definitions.setdefault(inst.opargs[0], []).append(index)
+
+    for index, inst in enumerate(stream):
+        if inst.opcode != GOTO_MARKER or not inst.opargs:
+            continue
+
+        # GOTO_MARKER 0 returns to the last goto and has no fixed target
+        addr = inst.opargs[0]
+        if addr == 0 or len(definitions.get(addr, [])) != 1:
+            continue
+
+        stream[index] = Instruction(JUMP_MARKER, [definitions[addr][0], addr])
+
+
+def eliminate_dead_code(
+    stream: List[Instruction], exported: bool = True
+) -> List[Instruction]:
+    """
+    Removes instructions that can never run and, unless the stream is exported,
+    MAKE_MARKERs that are never jumped to. Jump targets are moved to the new
+    positions.
+
+    Streams with a relative jump whose offset is forwarded from the stack are
+    returned as they are, since the jump can't be moved along.
+    """
+    graph = CFG(stream, exported)
+    if graph.dynamic:
+        return stream
+
+    live = graph.reachable()
+    used = None if exported else graph.used_markers()
+
+    # MAKE_MARKER sets its marker when the stream is loaded, so it is needed
+    # even if it never runs
+    for index, inst in enumerate(stream):
+        if inst.opcode != MAKE_MARKER or not inst.opargs:
+            continue
+        if used is None or inst.opargs[0] in used:
+            live.add(index)
+        else:
+            live.discard(index)
+
+    if len(live) == len(stream):
+        return stream
+    kept = sorted(live)
+
+    def move(target: int) -> int:
+        # Targets are the position before the next instruction to run
+        return bisect.bisect_left(kept, target + 1) - 1
+
+    result = []
+    for index in kept:
+        inst = stream[index]
+        if inst.opcode in (JUMP_ABSOLUTE, POP_JUMP_IF_FALSE, JUMP_MARKER):
+            inst = Instruction(inst.opcode, [move(inst.opargs[0])] + inst.opargs[1:])
+        result.append(inst)
+    return result
+
+
+def max_static_address(stream: List[Instruction]) -> int:
+    """
+    Returns the highest memory address LOAD_MEMORY and STORE_MEMORY use as
+    their argument, or 0 if none do. Addresses forwarded from the stack can't
+    be known before the program runs.
+    """
+    addresses = [
+        inst.opargs[0]
+        for inst in stream
+        if inst.opcode in (LOAD_MEMORY, STORE_MEMORY) and inst.opargs
+    ]
+    return max(addresses, default=0)
@@ -1,18 +1,37 @@
-from typing import Any, List
+from array import array
+from typing import Any, MutableSequence, Optional, Sequence
 
 import binarypp.logging as logging
 
 
 class Memory:
-    def __init__(self) -> None:
-        self.memory: List[Any] = [0]
+    def __init__(
+        self, typecode: Optional[str] = None, limit: Optional[int] = None
+    ) -> None:
+        """
+        Memory with a typecode keeps its cells in an array of that type for as
+        long as only integers that fit it are stored, and in a list after.
+
+        The limit is the number of cells memory may grow to.
+        """
+        self.memory: MutableSequence[Any] = [0]
+        if typecode is not None:
+            self.memory = array(typecode, [0])
         self.size: int = 1
+        self.limit: Optional[int] = limit
 
     def __setitem__(self, index: int, value: Any) -> None:
         if index >= self.size:
             self._expand_memory_until(index)
 
-        self.memory[index] = value
+        # An array would turn booleans into 0 and 1
+        if value.__class__ is not int and self.memory.__class__ is array:
+            self.memory = list(self.memory)
+        try:
+            self.memory[index] = value
+        except (TypeError, OverflowError):
+            self.memory = list(self.memory)
+            self.memory[index] = value
 
     def __getitem__(self, index: int) -> Any:
         if index == 0:
@@ -23,7 +42,66 @@ class Memory:
 
         return self.memory[index]
 
+    def reserve(self, index: int) -> None:
+        """
+        Grows memory to include MEMORY[index] ahead of its use. Memory isn't
+        grown past its limit, so that using the cell is what fails.
+        """
+        if self.limit is not None and index >= self.limit:
+            return
+        if index >= self.size:
+            self._expand_memory_until(index)
+
+    def region(self, start: int, count: int) -> Sequence[Any]:
+        """
+        Returns a copy of the cells MEMORY[start] to MEMORY[start + count - 1].
+        """
+        self._check_region(start, count)
+        if start == 0 and count:
+            logging.error("Accessing reserved memory: MEMORY[0]")
+
+        end = start + count
+        return self.memory[start:end]
+
+    def set_region(self, start: int, values: Sequence[Any]) -> None:
+        self._check_region(start, len(values))
+        end = start + len(values)
+        if isinstance(self.memory, array) and not isinstance(values, array):
+            try:
+                if not all(value.__class__ is int for value in values):
+                    raise TypeError("Only integers are kept in an array")
+                values = array(self.memory.typecode, values)
+            except (TypeError, OverflowError):
+                self.memory = list(self.memory)
+        self.memory[start:end] = values
+
+    def copy(self, dst: int, src: int, count: int) -> None:
+        """
+        Copies count cells from src to dst. The regions may overlap.
+        """
+        self.set_region(dst, self.region(src, count))
+
+    def fill(self, start: int, count: int, value: Any) -> None:
+        # The region is checked against the limit before the cells are made
+        self._check_region(start, count)
+        self.set_region(start, [value] * count)
+
+    def _check_region(self, start: int, count: int) -> None:
+        if start < 0 or count < 0:
+            logging.error(
+                "Invalid memory region: {} cells at MEMORY[{}]".format(count, start)
+            )
+
+        if start + count > self.size:
+            self._expand_memory_until(start + count - 1)
+
     def _expand_memory_until(self, index: int) -> None:
+        if self.limit is not None and index >= self.limit:
+            logging.error(
+                "Resource limit exceeded: MEMORY[{}] is past the {} cells "
+                "available".format(index, self.limit)
+            )
+
         amount = index - self.size + 1
         self.memory.extend([0] * amount)
         self.size += amount
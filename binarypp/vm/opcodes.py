@@ -5,6 +5,7 @@ Prefixes:
 1100 - logic gates
 1110 - equality
 1010 - conditionals
+1011 - memory regions
 1001 - ?
 1111 - modules
 """
@@ -58,11 +59,70 @@ GO_BACK             = 0b10100010
 FORWARD_ARGS        = 0b10010000
 ROT_TWO             = 0b10010001
 ROT_THREE           = 0b10010010
+MEMORY_COPY         = 0b10110000
+MEMORY_FILL         = 0b10110001
+MEMORY_COMPARE      = 0b10110010
+WRITE_REGION_TO     = 0b10110011
 IMPORT_MODULE       = 0b11110000
 PUSH_STACK_MODULE   = 0b11110001
 GOTO_MODULE         = 0b11111000
 # fmt: on
 
+"""
+Internal instructions are produced by binarypp.vm.loader when a stream is
+loaded. They never appear in source files, so their opcodes sit above
+0b11111111 and can't collide with the instruction set above.
+
+Jump targets are stored the same way markers store their position: the
+instruction pointer is set to the target and execution resumes right after it.
+"""
+
+# fmt: off
+JUMP_MARKER         = 0b100000000
+JUMP_MODULE         = 0b100000001
+JUMP_ABSOLUTE       = 0b100000010
+POP_JUMP_IF_FALSE   = 0b100000011
+DECODE_PAGE         = 0b100000100
+IMPORT_LINKED       = 0b100000101
+EXEC_BLOCK          = 0b100000110
+ENTER_TRACE         = 0b100000111
+WRAP_ARITHMETIC     = 0b100001000
+
+# FORWARD_ARGS merged with the instruction after it
+PUSH_STACK_DYN      = 0b100010000
+LOAD_MEMORY_DYN     = 0b100010001
+STORE_MEMORY_DYN    = 0b100010010
+READ_FROM_DYN       = 0b100010011
+READ_CHAR_FROM_DYN  = 0b100010100
+WRITE_TO_DYN        = 0b100010101
+OPEN_FILE_DYN       = 0b100010110
+MAKE_MARKER_DYN     = 0b100010111
+GOTO_MARKER_DYN     = 0b100011000
+IF_RUN_NEXT_DYN     = 0b100011001
+SKIP_NEXT_DYN       = 0b100011010
+GO_BACK_DYN         = 0b100011011
+IMPORT_MODULE_DYN   = 0b100011100
+WRITE_REGION_TO_DYN = 0b100011101
+# fmt: on
+
+DYNAMIC = {
+    PUSH_STACK: PUSH_STACK_DYN,
+    LOAD_MEMORY: LOAD_MEMORY_DYN,
+    STORE_MEMORY: STORE_MEMORY_DYN,
+    READ_FROM: READ_FROM_DYN,
+    READ_CHAR_FROM: READ_CHAR_FROM_DYN,
+    WRITE_TO: WRITE_TO_DYN,
+    OPEN_FILE: OPEN_FILE_DYN,
+    MAKE_MARKER: MAKE_MARKER_DYN,
+    GOTO_MARKER: GOTO_MARKER_DYN,
+    IF_RUN_NEXT: IF_RUN_NEXT_DYN,
+    SKIP_NEXT: SKIP_NEXT_DYN,
+    GO_BACK: GO_BACK_DYN,
+    IMPORT_MODULE: IMPORT_MODULE_DYN,
+    WRITE_REGION_TO: WRITE_REGION_TO_DYN,
+}
+DYNAMIC_VARIANTS = frozenset(DYNAMIC.values())
+
 NO_ARG = (
     POP_STACK,
     DUP_TOP,
@@ -88,6 +148,9 @@ NO_ARG = (
     FORWARD_ARGS,
     ROT_TWO,
     ROT_THREE,
+    MEMORY_COPY,
+    MEMORY_FILL,
+    MEMORY_COMPARE,
 )
 ONE_ARG = (
     PUSH_STACK,
@@ -103,6 +166,7 @@ ONE_ARG = (
     SKIP_NEXT,
     GO_BACK,
     IMPORT_MODULE,
+    WRITE_REGION_TO,
 )
 TWO_ARG = (
     PUSH_STACK_MODULE,
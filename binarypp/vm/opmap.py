@@ -37,7 +37,34 @@ OP_MAP = {
     0b10010000: "FORWARD_ARGS",
     0b10010001: "ROT_TWO",
     0b10010010: "ROT_THREE",
+    0b10110000: "MEMORY_COPY",
+    0b10110001: "MEMORY_FILL",
+    0b10110010: "MEMORY_COMPARE",
+    0b10110011: "WRITE_REGION_TO",
     0b11110000: "IMPORT_MODULE",
     0b11110001: "PUSH_STACK_MODULE",
     0b11111000: "GOTO_MODULE",
+    0b100000000: "JUMP_MARKER",
+    0b100000001: "JUMP_MODULE",
+    0b100000010: "JUMP_ABSOLUTE",
+    0b100000011: "POP_JUMP_IF_FALSE",
+    0b100000100: "DECODE_PAGE",
+    0b100000101: "IMPORT_LINKED",
+    0b100000110: "EXEC_BLOCK",
+    0b100000111: "ENTER_TRACE",
+    0b100001000: "WRAP_ARITHMETIC",
+    0b100010000: "PUSH_STACK_DYN",
+    0b100010001: "LOAD_MEMORY_DYN",
+    0b100010010: "STORE_MEMORY_DYN",
+    0b100010011: "READ_FROM_DYN",
+    0b100010100: "READ_CHAR_FROM_DYN",
+    0b100010101: "WRITE_TO_DYN",
+    0b100010110: "OPEN_FILE_DYN",
+    0b100010111: "MAKE_MARKER_DYN",
+    0b100011000: "GOTO_MARKER_DYN",
+    0b100011001: "IF_RUN_NEXT_DYN",
+    0b100011010: "SKIP_NEXT_DYN",
+    0b100011011: "GO_BACK_DYN",
+    0b100011100: "IMPORT_MODULE_DYN",
+    0b100011101: "WRITE_REGION_TO_DYN",
 }
@@ -0,0 +1,127 @@
+"""
+Reading modules ahead of time.
+
+IMPORT_MODULE reads and parses its module when it runs. Where the path is
+pushed by the PUSH_STRING_STACK right before it, the path is known as soon
+as the program is loaded, so a pool of threads reads and parses the module
+while the program starts, along with the modules it imports in turn.
+IMPORT_MODULE then takes the parsed module, unless the file changed since.
+
+Errors are left for IMPORT_MODULE to report when it runs, as it would have
+without prefetching: modules that can't be read or parsed are read again
+then, and print nothing while they are prefetched.
+"""
+
+import os
+import threading
+from _thread import get_ident
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import binarypp.logging as logging
+import binarypp.objfile as objfile
+import binarypp.parser as parser
+from binarypp.types import Instruction
+from binarypp.vm.opcodes import *
+
+# Modified time and size of a file, which tell whether it changed
+Version = Tuple[int, int]
+
+# Threads reading modules at the same time
+WORKERS = 4
+
+
+def static_imports(stream: List[Instruction]) -> List[str]:
+    """
+    Returns the paths imported by IMPORT_MODULE right after the path is pushed.
+    """
+    paths = []
+    for index, inst in enumerate(stream[1:], 1):
+        if inst.opcode != IMPORT_MODULE or not inst.opargs:
+            continue
+
+        previous = stream[index - 1]
+        if previous.opcode == PUSH_STRING_STACK:
+            paths.append("".join(map(chr, previous.opargs)))
+    return paths
+
+
+def version(path: str) -> Version:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Prefetcher:
+    def __init__(self, workers: int = WORKERS):
+        self.pool: ThreadPoolExecutor = ThreadPoolExecutor(
+            workers, thread_name_prefix="prefetch"
+        )
+        self.lock: threading.Lock = threading.Lock()
+        self.modules: Dict[str, "Future[Optional[Tuple[Version, List[Instruction]]]]"]
+        self.modules = {}
+
+    def prefetch(self, file: str, paths: List[str]) -> None:
+        """
+        Starts reading the modules a program file imports.
+        """
+        for path in paths:
+            # Paths are resolved the same way IMPORT_MODULE does
+            module_path = os.path.join(os.getcwd(), os.path.dirname(file), path)
+            key = os.path.normpath(module_path)
+
+            with self.lock:
+                if key not in self.modules:
+                    self.modules[key] = self.pool.submit(self.read, key)
+
+    def read(self, path: str) -> Optional[Tuple[Version, List[Instruction]]]:
+        """
+        Parses a module and starts reading the modules it imports. Returns the
+        module with the version of the file it was parsed from, or None if it
+        is compiled or can't be parsed.
+        """
+        logging.QUIET.add(get_ident())
+        try:
+            read_version = version(path)
+            if parser.is_object_file(path):
+                obj = objfile.ObjectFile(path)
+                self.prefetch(path, [path for _, _, path in obj.imports()])
+                return None
+
+            stream = parser.parse_file(path)
+        except (Exception, SystemExit):
+            # Whatever went wrong happens again when the module is imported
+            return None
+        finally:
+            logging.QUIET.discard(get_ident())
+
+        self.prefetch(path, static_imports(stream))
+        return read_version, stream
+
+    def take(self, path: str) -> Optional[List[Instruction]]:
+        """
+        Returns a module that was prefetched, waiting for it to be parsed if
+        it is being read. Returns None if it wasn't, or if it changed since.
+        The loader rewrites the stream, so a module is only taken once.
+        """
+        with self.lock:
+            future = self.modules.pop(os.path.normpath(path), None)
+        if future is None:
+            return None
+
+        result = future.result()
+        if result is None:
+            return None
+
+        read_version, stream = result
+        try:
+            if version(path) != read_version:
+                return None
+        except OSError:
+            return None
+        return stream
+
+    def close(self) -> None:
+        """
+        Stops reading modules that no import needed in the end.
+        """
+        self.pool.shutdown(wait=False, cancel_futures=True)
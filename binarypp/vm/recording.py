@@ -0,0 +1,116 @@
+"""
+Recordings of the input of a run.
+
+With --record FILE, every character READ_FROM and READ_CHAR_FROM take from
+stdin or from a file is kept, and written to FILE when the program ends. With
+--replay FILE, the same reads are served from the recording instead, so a run
+can be repeated exactly and timed without waiting on a terminal or the disk.
+Files opened to be read aren't opened at all while replaying, and writes
+still go where they would.
+
+Input is kept by source: 0 for stdin, and the number of the handle OPEN_FILE
+pushed for files. Handles are numbered in the order they were opened, so they
+match between a recording and a replay of the same program.
+"""
+
+import io
+import struct
+from abc import ABC, abstractmethod
+from typing import IO, Any, Callable, Dict, List, Protocol
+
+import binarypp.logging as logging
+
+MAGIC = b"BPPI"
+VERSION = 1
+
+HEADER = struct.Struct("<4sH")  # magic, version
+SOURCE = struct.Struct("<II")  # source, bytes of its input in UTF-8
+
+
+class Readable(Protocol):
+    """
+    What READ_FROM and READ_CHAR_FROM read from: a file, or a stand-in.
+    """
+
+    def read(self, __size: int = -1) -> str:
+        ...
+
+
+class Input(ABC):
+    @abstractmethod
+    def source(self, number: int, file: Callable[[], IO[Any]]) -> Readable:
+        """
+        Returns what to read the input of a source from, given the file the
+        program would read it from.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class Recorded:
+    """
+    A file whose reads are kept in a list.
+    """
+
+    def __init__(self, file: IO[Any], chunks: List[str]):
+        self.file: IO[Any] = file
+        self.chunks: List[str] = chunks
+
+    def read(self, size: int = -1) -> str:
+        data: str = self.file.read(size)
+        self.chunks.append(data)
+        return data
+
+
+class Recorder(Input):
+    def __init__(self, path: str):
+        self.path: str = path
+        self.sources: Dict[int, List[str]] = {}
+
+    def source(self, number: int, file: Callable[[], IO[Any]]) -> Readable:
+        # Open files may be closed and reopened, so they are looked up each time
+        return Recorded(file(), self.sources.setdefault(number, []))
+
+    def close(self) -> None:
+        with open(self.path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION))
+            for number, chunks in self.sources.items():
+                data = "".join(chunks).encode("utf-8")
+                file.write(SOURCE.pack(number, len(data)))
+                file.write(data)
+
+
+class Replay(Input):
+    def __init__(self, path: str):
+        self.sources: Dict[int, IO[str]] = read(path)
+
+    def source(self, number: int, file: Callable[[], IO[Any]]) -> Readable:
+        # Sources the recorded run never read from are empty
+        if number not in self.sources:
+            self.sources[number] = io.StringIO()
+        return self.sources[number]
+
+
+def read(path: str) -> Dict[int, IO[str]]:
+    """
+    Returns the input of each source in a recording.
+    """
+    sources: Dict[int, IO[str]] = {}
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except OSError as error:
+        logging.error("Could not read the recording '{}': {}".format(path, error))
+
+    if len(data) < HEADER.size or HEADER.unpack_from(data) != (MAGIC, VERSION):
+        logging.error("'{}' is not a recording".format(path))
+
+    offset = HEADER.size
+    while offset + SOURCE.size <= len(data):
+        number, size = SOURCE.unpack_from(data, offset)
+        start = offset + SOURCE.size
+        end = start + size
+        sources[number] = io.StringIO(data[start:end].decode("utf-8"))
+        offset = end
+    return sources
@@ -1,19 +1,53 @@
-from typing import Any, List
+from array import array
+from typing import Any, MutableSequence, Optional
 
 import binarypp.logging as logging
 
 
 class Stack:
-    def __init__(self) -> None:
-        self.stack: List[Any] = []
+    def __init__(self, typecode: Optional[str] = None) -> None:
+        """
+        A stack with a typecode keeps its values in an array of that type for
+        as long as only integers that fit it are pushed, and in a list after.
+        """
+        self.stack: MutableSequence[Any] = []
+        if typecode is not None:
+            self.stack = array(typecode)
 
     def is_empty(self) -> bool:
         return len(self.stack) == 0
 
     def push(self, value: Any) -> None:
-        self.stack.append(value)
+        # An array would turn booleans into 0 and 1
+        if value.__class__ is not int and self.stack.__class__ is array:
+            self.stack = list(self.stack)
+        try:
+            self.stack.append(value)
+        except (TypeError, OverflowError):
+            self.stack = list(self.stack)
+            self.stack.append(value)
 
     def pop(self) -> Any:
         if self.is_empty():
             logging.error("Stack is empty")
         return self.stack.pop()
+
+
+class LimitedStack(Stack):
+    """
+    Stack that can't hold more than a number of values. It is only used when a
+    limit is set, so the default stack doesn't check anything.
+    """
+
+    def __init__(self, limit: int, typecode: Optional[str] = None) -> None:
+        super().__init__(typecode)
+        self.limit: int = limit
+
+    def push(self, value: Any) -> None:
+        if len(self.stack) >= self.limit:
+            logging.error(
+                "Resource limit exceeded: more than {} values on the stack".format(
+                    self.limit
+                )
+            )
+        super().push(value)
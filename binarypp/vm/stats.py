@@ -0,0 +1,66 @@
+"""
+Runtime statistics of a program.
+
+Counters of rare events, like imports and reads, are always kept. The ones
+that need a look at every instruction, like the number of instructions run
+and the stack depth, are only kept when the VM measures the program with
+--stats, which swaps in a fetch function that updates them.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Set
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.instructions: int = 0
+        self.max_stack_depth: int = 0
+        self.jumps: int = 0
+        self.imports: int = 0
+        self.bytes_read: int = 0
+        self.bytes_written: int = 0
+
+        # Seconds spent on each phase of running a program
+        self.times: Dict[str, float] = {"parse": 0.0, "markers": 0.0, "execution": 0.0}
+
+        # Memory cells used by each frame, which only ever grows
+        self.memory: Dict[str, int] = {}
+
+        # Phases being timed, so imported modules don't count twice
+        self.running: Set[str] = set()
+
+    @contextmanager
+    def timed(self, phase: str) -> Iterator[None]:
+        if phase in self.running:
+            yield
+            return
+
+        self.running.add(phase)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[phase] += time.perf_counter() - start
+            self.running.discard(phase)
+
+    def as_dict(self) -> Dict[str, Any]:
+        execution = self.times["execution"]
+        return {
+            "instructions": self.instructions,
+            "instructions_per_second": (
+                self.instructions / execution if execution else 0.0
+            ),
+            "max_stack_depth": self.max_stack_depth,
+            "peak_memory_cells": dict(self.memory),
+            "jumps": self.jumps,
+            "imports": self.imports,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "seconds": dict(self.times),
+        }
+
+    def to_json(self) -> str:
+        import json
+
+        return json.dumps(self.as_dict(), indent=2)
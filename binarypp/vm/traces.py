@@ -0,0 +1,320 @@
+"""
+Traces of hot loops, recorded and compiled for the JIT.
+
+A trace is one iteration of a loop as it ran, with the direction every branch
+went. It is translated to the register IR and from there into a Python
+function, which exits wherever a branch goes the other way. This module is
+only imported once a loop gets hot, so programs without one never load the IR.
+"""
+
+import operator
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+import binarypp.vm.ir as ir
+from binarypp.types import Instruction, String
+from binarypp.vm.memory import Memory
+from binarypp.vm.opcodes import *
+
+if TYPE_CHECKING:
+    from binarypp.vm.vm import Frame, VirtualMachine
+
+# Traces are given up on once they get longer than this
+MAX_LENGTH = 1000
+
+TRACEABLE = ir.TRANSLATABLE | {JUMP_MARKER, READ_FROM, READ_CHAR_FROM, WRITE_TO}
+
+# Operations on top of the ones of the IR
+GUARD = 10  # GUARD, condition, expected truth, exit, registers to push, index
+GOTO = 11  # GOTO, frame, position
+CALL = 12  # CALL, method, address
+
+CALLS = {READ_FROM: "read_from", READ_CHAR_FROM: "read_char_from", WRITE_TO: "write_to"}
+
+TEMPLATES: Dict[Callable[..., Any], str] = {
+    ir.BINARY_FUNCTIONS[opcode]: template
+    for opcode, template in {
+        BINARY_ADD: "{} + {}",
+        BINARY_SUBTRACT: "{} - {}",
+        BINARY_MULTIPLY: "{} * {}",
+        BINARY_POWER: "{} ** {}",
+        BINARY_TRUE_DIVIDE: "{} / {}",
+        BINARY_FLOOR_DIVIDE: "int({} // {})",
+        BINARY_MODULO: "{} % {}",
+        BINARY_AND: "{} & {}",
+        BINARY_OR: "{} | {}",
+        BINARY_XOR: "{} ^ {}",
+        BINARY_LEFT_SHIFT: "{} << {}",
+        BINARY_RIGHT_SHIFT: "{} >> {}",
+        EQUALS_TO: "{} == {}",
+        NOT_EQUAL_TO: "{} != {}",
+        LESS_THAN: "{} < {}",
+        LESS_EQUAL_THAN: "{} <= {}",
+        GREATER_THAN: "{} > {}",
+        GREATER_EQUAL_THAN: "{} >= {}",
+    }.items()
+}
+TEMPLATES[operator.invert] = "~{}"
+
+
+class Trace:
+    def __init__(self, frame: int, header: int, back_edge: int):
+        self.frame: int = frame
+        self.header: int = header
+        self.back_edge: int = back_edge
+        self.instructions: List[Tuple[int, Instruction]] = []
+
+        self.source: str = ""
+        self.function: Callable[..., Tuple[int, int, int]]
+        self.function = lambda *args: (back_edge, 0, 0)
+
+        # How often the trace was run, how many iterations of the loop it ran,
+        # and how often it was left at each position
+        self.entries: int = 0
+        self.iterations: int = 0
+        self.exits: Dict[int, int] = {}
+
+        # Jumps in an iteration, and the instructions and jumps of the last
+        # iteration by the guard it was left at, by index in the iteration.
+        # Runs are counted by guard to count what they ran exactly.
+        self.jumps: int = 0
+        self.stops: Dict[int, Tuple[int, int]] = {}
+        self.stopped: Dict[int, int] = {}
+
+    def run(self, vm: "VirtualMachine", frame: "Frame") -> int:
+        """
+        Runs the trace and returns the new value of the instruction pointer.
+        """
+        self.entries += 1
+        ip, iterations, stop = self.function(
+            vm, frame, frame.memory, vm.stack, vm.last_goto
+        )
+        self.iterations += iterations
+        self.exits[ip] = self.exits.get(ip, 0) + 1
+        self.stopped[stop] = self.stopped.get(stop, 0) + 1
+        return ip
+
+    def counts(self) -> Tuple[int, int]:
+        """
+        Returns the instructions and jumps the trace ran, as the interpreter
+        would have counted them. The interpreter already counted the
+        ENTER_TRACE each run starts at, which stands for the backward jump.
+        """
+        whole = self.iterations - self.entries
+        instructions = whole * len(self.instructions) - self.entries
+        jumps = whole * self.jumps
+        for stop, count in self.stopped.items():
+            instructions += count * self.stops[stop][0]
+            jumps += count * self.stops[stop][1]
+        return instructions, jumps
+
+    def compile(self, memory: Memory) -> None:
+        block = ir.Block(self.header, self.back_edge + 1)
+        translator = TraceTranslator(block)
+
+        # The trace is entered from the backward jump, so the loop starts
+        # with it
+        rotated = self.instructions[-1:] + self.instructions[:-1]
+        jumped = []
+        for index, (position, inst) in enumerate(rotated):
+            following = rotated[(index + 1) % len(rotated)][0]
+            # Dynamic variants take up the slot after them too
+            size = 2 if inst.opcode in DYNAMIC_VARIANTS else 1
+            jumped.append(following != position + size)
+            translator.translate_trace(inst, position, following, self.frame, index)
+        translator.finish()
+
+        self.jumps = sum(jumped)
+        for op in block.ops:
+            if op[0] == GUARD:
+                index = op[5]
+                exit_jumped = op[3] != rotated[index][0]
+                self.stops[index] = (index + 1, sum(jumped[:index]) + exit_jumped)
+
+        constants: Dict[str, Any] = {"String": String}
+        addresses = [op[2] for op in block.ops if op[0] == ir.LOAD]
+        addresses += [op[1] for op in block.ops if op[0] == ir.STORE]
+
+        lines = [
+            "def trace(vm, frame, memory, stack, last_goto):",
+            "    pop = stack.pop",
+            "    push = stack.push",
+        ]
+        # Cells the trace uses directly must exist, like loading them would do.
+        # Typed memory may turn into a list on any store, so it isn't used
+        # directly.
+        direct = isinstance(memory.memory, list)
+        if direct and max(addresses, default=0) > 0:
+            lines.append(f"    memory[{max(addresses)}]")
+        lines.append("    mem = memory.memory" if direct else "    mem = memory")
+        lines.append("    n = 0")
+        lines.append("    while True:")
+        lines.append("        n += 1")
+        for op in block.ops:
+            lines.extend("        " + line for line in generate(op, constants))
+
+        self.source = "\n".join(lines)
+        code = compile(self.source, f"<trace {self.header}-{self.back_edge}>", "exec")
+        exec(code, constants)
+        self.function = constants["trace"]
+
+
+class TraceTranslator(ir.Translator):
+    def sync(self) -> None:
+        """
+        Pushes the values held in registers, for instructions that need the
+        actual stack.
+        """
+        for reg in self.stack:
+            self.emit(ir.PUSH, reg)
+        self.stack = []
+
+    def translate_trace(
+        self, inst: Instruction, position: int, following: int, frame: int, index: int
+    ) -> None:
+        """
+        Translates the instruction at an index of a trace. The position that
+        ran after it tells which way a branch went.
+        """
+        opcode = inst.opcode
+        args = inst.opargs
+
+        if opcode == POP_JUMP_IF_FALSE:
+            condition = self.pop()
+            if args[0] == position:
+                return
+
+            # Exits continue where the branch would have gone otherwise
+            taken = following == args[0] + 1
+            target = position if taken else args[0]
+            self.emit(GUARD, condition, not taken, target, list(self.stack), index)
+
+        elif opcode == JUMP_ABSOLUTE:
+            pass
+
+        elif opcode == JUMP_MARKER:
+            self.emit(GOTO, frame, position)
+
+        elif opcode in CALLS:
+            self.sync()
+            self.emit(CALL, CALLS[opcode], args[0])
+            # Reading may store to any cell
+            self.cells.clear()
+
+        else:
+            self.translate(inst, position)
+
+
+def generate(op: ir.Operation, constants: Dict[str, Any]) -> List[str]:
+    """
+    Returns the lines of Python code running an operation.
+    """
+    kind = op[0]
+    if kind == ir.POP:
+        return [f"r{op[1]} = pop()"]
+    if kind == ir.PUSH:
+        return [f"push(r{op[1]})"]
+    if kind == ir.CONST:
+        return [f"r{op[1]} = {op[2]!r}"]
+    if kind == ir.STRING:
+        name = f"c{len(constants)}"
+        constants[name] = op[2]
+        return [f"r{op[1]} = String({name})"]
+    if kind == ir.LOAD:
+        # Loading address 0 is left to Memory, which reports the error
+        if op[2] == 0:
+            return [f"r{op[1]} = memory[0]"]
+        return [f"r{op[1]} = mem[{op[2]}]"]
+    if kind == ir.STORE:
+        return [f"mem[{op[1]}] = r{op[2]}"]
+    if kind == ir.LOAD_INDIRECT:
+        return [f"r{op[1]} = memory[r{op[2]}]"]
+    if kind == ir.STORE_INDIRECT:
+        return [f"memory[r{op[1]}] = r{op[2]}"]
+    if kind == ir.BINARY:
+        return [f"r{op[1]} = " + apply(op[2], constants, f"r{op[3]}", f"r{op[4]}")]
+    if kind == ir.UNARY:
+        return [f"r{op[1]} = " + apply(op[2], constants, f"r{op[3]}")]
+    if kind == GOTO:
+        return [f"last_goto.frame = {op[1]}", f"last_goto.inst = {op[2]}"]
+    if kind == CALL:
+        return [f"vm.{op[1]}(frame, {op[2]})"]
+
+    # GUARD
+    condition = f"not r{op[1]}" if op[2] else f"r{op[1]}"
+    lines = [f"if {condition}:"]
+    lines.extend(f"    push(r{reg})" for reg in op[4])
+    lines.append(f"    return {op[3]}, n, {op[5]}")
+    return lines
+
+
+def apply(function: Callable[..., Any], constants: Dict[str, Any], *args: str) -> str:
+    """
+    Returns the code applying a function to registers. Functions without an
+    operator, like the ones of fixed-width mode, are called.
+    """
+    if function in TEMPLATES:
+        return TEMPLATES[function].format(*args)
+
+    name = f"c{len(constants)}"
+    constants[name] = function
+    return "{}({})".format(name, ", ".join(args))
+
+
+class Recorder:
+    """
+    Records one iteration of a loop, from the instruction after the target of
+    its backward jump up to the jump itself.
+    """
+
+    def __init__(self, frame: int, back_edge: int, target: int):
+        self.trace: Trace = Trace(frame, target + 1, back_edge)
+        self.fetch: Callable[[], Optional[Instruction]] = lambda: None
+
+    def wrap(
+        self, vm: "VirtualMachine", fetch: Callable[[], Optional[Instruction]]
+    ) -> Callable[[], Optional[Instruction]]:
+        """
+        Returns a fetch function that records the instructions fetch returns,
+        until the recording stops.
+        """
+        self.fetch = fetch
+
+        def fetch_recorded() -> Optional[Instruction]:
+            inst = fetch()
+            if inst is not None and vm.recorder is self:
+                self.record(vm, inst)
+            return inst
+
+        return fetch_recorded
+
+    def record(self, vm: "VirtualMachine", inst: Instruction) -> None:
+        trace = self.trace
+        position = vm.IP.inst
+        frame = vm.frames[trace.frame]
+
+        if vm.IP.frame != trace.frame or inst.opcode not in TRACEABLE | {EXEC_BLOCK}:
+            self.stop(vm)
+            return
+
+        if position == trace.header and trace.instructions:
+            if trace.instructions[-1][0] == trace.back_edge:
+                vm.jit.install(frame, trace)
+            self.stop(vm)
+            return
+
+        if inst.opcode == EXEC_BLOCK:
+            trace.instructions.extend(frame.blocks[inst.opargs[0]].instructions)
+        else:
+            trace.instructions.append((position, inst))
+
+        # Inner loops get a trace of their own
+        backward = inst.opcode in (JUMP_ABSOLUTE, JUMP_MARKER)
+        backward = backward and inst.opargs[0] < position
+        if backward and position != trace.back_edge:
+            self.stop(vm)
+        elif len(trace.instructions) > MAX_LENGTH:
+            self.stop(vm)
+
+    def stop(self, vm: "VirtualMachine") -> None:
+        vm.recorder = None
+        vm.fetch = self.fetch
@@ -1,16 +1,40 @@
-import io
 import os.path
+import sys
 from argparse import Namespace
 from sys import stdin, stdout
-from typing import Any, List, Optional
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    cast,
+)
 
 import binarypp.logging as logging
 import binarypp.parser as parser
+import binarypp.vm.loader as loader
 from binarypp.types import Instruction, Marker, Pointer, String
+from binarypp.vm.files import CAPACITY, FileTable
 from binarypp.vm.memory import Memory
 from binarypp.vm.opcodes import *
 from binarypp.vm.opmap import OP_MAP
-from binarypp.vm.stack import Stack
+from binarypp.vm.stack import LimitedStack, Stack
+from binarypp.vm.stats import Stats
+
+if TYPE_CHECKING:
+    import binarypp.objfile as objfile
+    import binarypp.tracelog as tracelog
+    import binarypp.vm.ir as ir
+    import binarypp.vm.jit as jit
+    import binarypp.vm.lazy as lazy
+    import binarypp.vm.prefetch as prefetch
+    import binarypp.vm.recording as recording
+    import binarypp.vm.traces as traces
 
 # fmt: off
 MODES = ["r", "r+", "rb", "rb+",  # 0000 - 0011
@@ -21,55 +45,315 @@ MODES = ["r", "r+", "rb", "rb+",  # 0000 - 0011
 
 
 class VirtualMachine:
-    def __init__(self, file: str, flags: Namespace):
+    def __init__(
+        self, file: str, flags: Namespace, parent: Optional["VirtualMachine"] = None
+    ):
         self.flags: Namespace = flags
         self.IP: Pointer = Pointer(0, -1)  # Instruction Pointer
-        self.frames: List[Frame] = [Frame(file)]
-        self.stack: Stack = Stack()
+        self.frames: List[Frame] = [
+            Frame(
+                file,
+                getattr(flags, "int_width", None),
+                getattr(flags, "max_memory", None),
+            )
+        ]
+
+        # Resource limits are only checked where a resource grows, and the
+        # stack only checks its size if it is limited
+        max_stack = getattr(flags, "max_stack", None)
+        typecode = "q" if getattr(flags, "typed_stack", False) else None
+        self.stack: Stack = (
+            Stack(typecode) if max_stack is None else LimitedStack(max_stack, typecode)
+        )
+        self.max_instructions: Optional[int] = getattr(flags, "max_instructions", None)
+
+        # Fixed-width integers are written out as the unsigned value of their
+        # bits, so -56 is character 200 in 8 bits
+        width = getattr(flags, "int_width", None)
+        self.char_mask: int = (1 << width) - 1 if width else -1
+
+        # Modules share the file table and statistics of the program importing
+        # them, which closes the files once it is done
+        self.owns_files: bool = parent is None
+        replay = getattr(flags, "replay", None)
+        if parent is None:
+            self.files: FileTable = FileTable(
+                getattr(flags, "open_files", CAPACITY),
+                getattr(flags, "max_files", None),
+                deferred=replay is not None,
+            )
+            self.stats: Stats = Stats()
+        else:
+            self.files = parent.files
+            self.stats = parent.stats
+
+        # Input is recorded or replayed for the program and its modules alike
+        self.input: Optional["recording.Input"] = None
+        record = getattr(flags, "record", None)
+        if parent is not None:
+            self.input = parent.input
+        elif replay is not None or record is not None:
+            import binarypp.vm.recording
+
+            if replay is not None:
+                self.input = binarypp.vm.recording.Replay(replay)
+            else:
+                self.input = binarypp.vm.recording.Recorder(record)
+
+        # Modules are read ahead by the VM that found their imports first
+        self.prefetcher: Optional["prefetch.Prefetcher"] = None
+        self.owns_prefetcher: bool = False
+        if parent is not None:
+            self.prefetcher = parent.prefetcher
+
+        # Instructions are only counted if they are limited or measured
+        measured = getattr(flags, "stats", False)
+        self.measured: bool = measured or self.max_instructions is not None
+        # Value of the instruction pointer the next instruction is fetched at,
+        # unless a jump was taken
+        self.expected: Pointer = Pointer(0, -1)
 
         self.last_goto: Pointer = Pointer(0, 0)
 
+        # Only the program itself is traced, not the modules it imports
+        self.tracer: Optional["tracelog.TraceWriter"] = None
+        trace = getattr(flags, "trace", None)
+        if trace is not None and parent is None:
+            import binarypp.tracelog
+
+            self.tracer = binarypp.tracelog.TraceWriter(trace)
+
+        # Hot loops are compiled unless disabled. Step mode runs every
+        # instruction on its own, and compiled loops are neither counted
+        # against the instruction limit nor traced.
+        self.jit: Optional["jit.JIT"] = None
+        compiled = not getattr(flags, "no_jit", False) and not flags.step
+        if compiled and self.max_instructions is None and trace is None:
+            import binarypp.vm.jit
+
+            self.jit = binarypp.vm.jit.JIT(
+                getattr(flags, "jit_threshold", binarypp.vm.jit.THRESHOLD),
+                getattr(flags, "jit_dump", False),
+            )
+        self.recorder: Optional["traces.Recorder"] = None
+
+        # Function the main loop fetches instructions with. Recording a loop
+        # for the JIT swaps it for one that records them too.
+        self.fetch: Callable[[], Optional[Instruction]] = self.next_instruction
+
     def next_instruction(self) -> Optional[Instruction]:
         frame = self.frames[self.IP.frame]
         if self.IP.inst < frame.stream_size:
             self.IP.inst += 1
             return frame.stream[self.IP.inst]
+
+        # A lazily loaded frame may not have reached the instruction yet
+        if frame.pending is not None and frame.pending.load_until(
+            frame, self.IP.inst + 1
+        ):
+            self.IP.inst += 1
+            return frame.stream[self.IP.inst]
         return None
 
-    def main_loop(self, stream: List[Instruction]) -> None:
-        self.frames[0].stream = stream
-        self.frames[0].stream_size = len(stream) - 1
+    def next_measured_instruction(self) -> Optional[Instruction]:
+        """
+        Fetches the next instruction while counting instructions, jumps and
+        the stack depth. IR blocks count as the instructions they were
+        translated from.
+        """
+        stats = self.stats
+        ip = self.IP
+        expected = self.expected
+        if ip.inst != expected.inst or ip.frame != expected.frame:
+            stats.jumps += 1
+
+        inst = self.next_instruction()
+        if inst is None:
+            return None
+
+        expected.frame = ip.frame
+        expected.inst = ip.inst
+        if inst.opcode == EXEC_BLOCK:
+            block = self.frames[ip.frame].blocks[inst.opargs[0]]
+            stats.instructions += len(block.instructions)
+            expected.inst = block.end - 1
+        else:
+            stats.instructions += 1
+            if inst.opcode in DYNAMIC_VARIANTS:
+                expected.inst += 1
+
+        depth = len(self.stack.stack)
+        if depth > stats.max_stack_depth:
+            stats.max_stack_depth = depth
+
+        if self.max_instructions is not None:
+            if stats.instructions > self.max_instructions:
+                logging.error(
+                    "Resource limit exceeded: more than {} instructions run".format(
+                        self.max_instructions
+                    )
+                )
+        return inst
+
+    def load_stream(
+        self, frame_index: int, stream: List[Instruction], exported: bool = True
+    ) -> None:
+        frame = self.frames[frame_index]
+        with self.stats.timed("parse"):
+            frame.stream = loader.load(stream, exported)
+        frame.stream_size = len(frame.stream) - 1
+
+        with self.stats.timed("markers"):
+            self.initialize_markers(frame_index)
+
+        # Cells at constant addresses exist from the start, so LOAD_MEMORY
+        # and STORE_MEMORY can use them without growing memory
+        frame.memory.reserve(loader.max_static_address(frame.stream))
+
+    def prefetch_imports(self, frame_index: int) -> None:
+        """
+        Starts reading the modules a frame imports by a constant path.
+        """
+        frame = self.frames[frame_index]
+        if not any(inst.opcode == IMPORT_MODULE for inst in frame.stream):
+            return
+
+        import binarypp.vm.prefetch
+
+        paths = binarypp.vm.prefetch.static_imports(frame.stream)
+        if not paths:
+            return
+        if self.prefetcher is None:
+            self.prefetcher = binarypp.vm.prefetch.Prefetcher()
+            self.owns_prefetcher = True
+        self.prefetcher.prefetch(frame.file, paths)
+
+    def load_object(self, frame_index: int, obj: "objfile.ObjectFile") -> None:
+        """
+        Sets up a frame from a compiled program. The marker table comes from
+        the object file, so the stream doesn't need to be scanned.
+        """
+        frame = self.frames[frame_index]
+        frame.source = obj
+        frame.stream = obj.stream()
+        frame.stream_size = obj.size - 1
+
+        with self.stats.timed("markers"):
+            for addr, inst in obj.markers().items():
+                frame.markers[addr] = Marker(Pointer(frame_index, inst))
+
+            for addr, index in obj.jumps():
+                frame.add_jump_site(
+                    addr, frame, index, Instruction(GOTO_MARKER, [addr])
+                )
+
+    def load_file(self, frame_index: int, path: str) -> None:
+        if parser.is_object_file(path):
+            import binarypp.objfile
+
+            self.load_object(frame_index, binarypp.objfile.ObjectFile(path))
+        elif getattr(self.flags, "lazy", False):
+            file = open(path, "r", encoding="latin1")
+            self.load_lazily(
+                frame_index, parser.tokenize(parser.read_codes(file)), file
+            )
+        else:
+            with self.stats.timed("parse"):
+                stream = parser.parse_file(path)
+            self.load_stream(frame_index, stream)
+
+    def load_lazily(
+        self,
+        frame_index: int,
+        instructions: Iterator[Instruction],
+        file: Optional[IO[str]] = None,
+    ) -> None:
+        """
+        Sets up a frame to load instructions as it runs them.
+        """
+        import binarypp.vm.lazy
 
-        self.initialize_markers(0)
+        frame = self.frames[frame_index]
+        frame.pending = binarypp.vm.lazy.LazyStream(
+            instructions, frame_index, getattr(self.flags, "int_width", None), file
+        )
+        frame.stream = []
+        frame.stream_size = -1
+
+    def main_loop(self, stream: Optional[List[Instruction]] = None) -> None:
+        """
+        Runs the program in the first frame. The stream is loaded into it first
+        if one is given. The files the program opened are closed at the end,
+        even if it stops with an error.
+        """
+        try:
+            with self.stats.timed("execution"):
+                self.run(stream)
+        finally:
+            self.close()
+            self.collect_stats()
+
+    def close(self) -> None:
+        """
+        Closes what the VM opened while it ran: the program's files, the
+        trace, the input recording and the threads reading modules ahead.
+        """
+        if self.owns_files:
+            self.files.close()
+        for frame in self.frames:
+            if frame is not None and frame.pending is not None:
+                frame.pending.close()
+        if self.tracer is not None:
+            self.tracer.close(self)
+        if self.input is not None and self.owns_files:
+            self.input.close()
+        if self.prefetcher is not None and self.owns_prefetcher:
+            self.prefetcher.close()
+
+    def collect_stats(self) -> None:
+        """
+        Adds what can be counted once the program ended to the statistics.
+        """
+        for frame in self.frames:
+            if frame is not None:
+                self.stats.memory[frame.file] = frame.memory.size
+
+        # Loops compiled by the JIT count what they ran once they are done
+        if self.measured and self.jit is not None:
+            for trace in self.jit.traces:
+                instructions, jumps = trace.counts()
+                self.stats.instructions += instructions
+                self.stats.jumps += jumps
+
+    def run(self, stream: Optional[List[Instruction]] = None) -> None:
+        if stream is not None:
+            self.load_stream(0, stream)
+        # Only programs that run read their modules ahead, and close the
+        # threads doing it when they end
+        if not getattr(self.flags, "no_prefetch", False):
+            self.prefetch_imports(0)
+        self.wrap_arithmetic(0)
+        self.compile_blocks(0)
+
+        next_instruction = self.next_instruction
+        if self.measured:
+            next_instruction = self.next_measured_instruction
+        if self.tracer is not None:
+            next_instruction = self.tracer.wrap(self, next_instruction)
+        self.fetch = next_instruction
 
         while True:
-            inst = self.next_instruction()
+            inst = next_instruction()
             if inst is None:
                 break
 
             frame: Frame = self.frames[self.IP.frame]
 
-            if self.IP.inst > frame.target_IP:
-                frame.target_IP = -1
-
             opcode = inst.opcode
-            if frame.forwarded_args:
-                args = frame.forwarded_args
-                frame.forwarded_args = []
-            else:
-                args = inst.opargs
+            args = inst.opargs
 
             if self.flags.step:
-                print(
-                    "\nInst: {} {} ({}){}".format(
-                        OP_MAP[opcode],
-                        args,
-                        frame.forwarded_args,
-                        f" {frame.target_IP - self.IP.inst}"
-                        if frame.target_IP >= 0
-                        else "",
-                    )
-                )
+                print("\nInst: {} {}".format(OP_MAP[opcode], args))
 
             if opcode == POP_STACK:
                 """
@@ -122,8 +406,13 @@ class VirtualMachine:
                 LOAD_MEMORY 1
                 BINARY_ADD
                 """
-                # print("loaded:", self.memory[args[0]])
-                self.stack.push(frame.memory[args[0]])
+                # Cells reserved when the frame was loaded are read directly
+                memory = frame.memory
+                addr = args[0]
+                if 0 < addr < memory.size:
+                    self.stack.push(memory.memory[addr])
+                else:
+                    self.stack.push(memory[addr])
 
             elif opcode == STORE_MEMORY:
                 """
@@ -133,7 +422,14 @@ class VirtualMachine:
                 PUSH_STACK 5
                 STORE_MEMORY 1
                 """
-                frame.memory[args[0]] = self.stack.pop()
+                memory = frame.memory
+                addr = args[0]
+                value = self.stack.pop()
+                # Typed memory may turn into a list on any store
+                if addr < memory.size and type(memory.memory) is list:
+                    memory.memory[addr] = value
+                else:
+                    memory[addr] = value
 
             elif opcode == DUP_TOP:
                 """
@@ -146,121 +442,30 @@ class VirtualMachine:
                 self.stack.push(val)
                 self.stack.push(val)
 
-            # TODO: Include new READ_X_FROM instructions
             elif opcode == READ_FROM:
-                """
-                Reads values from a source until the terminator is reached (top stack).
-                Pushes text to stack. Terminator is consumed but excluded.
-                0 is stdin. Any other value is read from memory to determine source.
-
-                PUSH_STACK \10
-                READ_FROM 0 (stdin)
-                PUSH_STRING_STACK "file.txt"
-                OPEN_FILE 0
-                STORE_MEMORY 1
-                PUSH_STACK \32
-                READ_FROM 1
-                WRITE_TO 0 (stdin)
-                """
-                addr = args[0]
-                terminator = chr(self.stack.pop())
-
-                if addr == 0:
-                    string = ""
-                    while True:
-                        ch = stdin.read(1)
-                        if ch == terminator:
-                            break
-                        string += ch
-                    self.stack.push(String(string))
-
-                else:
-                    fstream = frame.memory[addr]
-                    if not isinstance(fstream, io.TextIOWrapper):
-                        logging.error("MEMORY[{}] is not a file".format(addr))
-
-                    string = ""
-                    while True:
-                        if (char := fstream.read(1)) == terminator or char != "":
-                            break
-                        string += char
-                    self.stack.push(string)
+                self.read_from(frame, args[0])
 
             elif opcode == READ_CHAR_FROM:
-                """
-                Reads one char from a source. Pushes the char to stack.
-                0 is stdin. Any other value is read from memory to determine source.
-
-                READ_CHAR_FROM 0 (stdin)
-                PUSH_STACK 48
-                BINARY_SUBTRACT
-                READ_CHAR_FROM 0 (stdin)
-                BINARY_ADD
-                WRITE_TO 0 (stdin)
-                """
-                addr = args[0]
-
-                if addr == 0:
-                    # self.stack.push(String(stdin.read(1)))
-                    self.stack.push(ord(stdin.read(1)))
-                else:
-                    fstream = frame.memory[addr]
-                    if not isinstance(stream, io.TextIOWrapper):
-                        logging.error("MEMORY[{}] is not a file".format(addr))
-
-                    self.stack.push(String(fstream.read(1)))
+                self.read_char_from(frame, args[0])
 
             elif opcode == WRITE_TO:
-                """
-                Writes the top-most stack to a source.
-                0 is stdout. Any other value is reads from memory to determine source.
-                """
-                addr = args[0]
-                if addr == 0:
-                    content = self.stack.pop()
-                    # print(content)
-                    if isinstance(content, int):
-                        stdout.write(chr(content))
-                    else:
-                        stdout.write(str(content))
-                    stdout.flush()
-                else:
-                    fstream = frame.memory[addr]
-                    if not isinstance(stream, io.TextIOWrapper):
-                        logging.error("MEMORY[{}] is not a file".format(addr))
-
-                    fstream.write(self.stack.pop())
-                    self.stack.push(string)
+                self.write_to(frame, args[0])
 
             elif opcode == OPEN_FILE:
-                """
-                Opens file from stack and pushes it to stack.
-
-                PUSH_STRING_STACK "file.txt"
-                OPEN_FILE
-                """
-                mode = args[0]
-                if 0b0000 <= mode <= 0b1111:
-                    file = self.stack.pop()
-                    # print(MODES[mode])
-                    self.stack.push(open(file, MODES[mode]))
-                else:
-                    logging.error(
-                        "Invalid file mode {}. Range: 0b0000-0b1111.".format(bin(mode))
-                    )
+                self.open_file(args[0])
 
             elif opcode == MAKE_MARKER:
                 """
                 Creates a marker at its current position in the code.
-                Stores the marker at the given position in memory.
+                Stores the marker at the given position in the marker table.
 
                 MAKE_MARKER 1
                 """
-                frame.memory[args[0]] = Marker(self.IP)
+                frame.set_marker(args[0], Marker(self.IP))
 
             elif opcode == GOTO_MARKER:
                 """
-                Goes to the marker at the given memory address.
+                Goes to the marker at the given address in the marker table.
 
                 MAKE_MARKER 1
                 PUSH_STACK "Hello, world!\n"
@@ -275,15 +480,30 @@ class VirtualMachine:
                     self.IP.inst = self.last_goto.inst
                     continue
 
-                target_marker = frame.memory[args[0]]
-                if not isinstance(target_marker, Marker):
-                    logging.error("Invalid marker at MEMORY[{}]".format(args[0]))
+                target_marker = frame.markers.get(args[0])
+                if target_marker is None and frame.pending is not None:
+                    target_marker = frame.pending.find_marker(frame, args[0])
+                if target_marker is None:
+                    logging.error("Invalid marker at MARKERS[{}]".format(args[0]))
 
                 self.last_goto.frame = self.IP.frame
                 self.last_goto.inst = self.IP.inst
                 self.IP.frame = target_marker.frame
                 self.IP.inst = target_marker.inst
 
+            elif opcode == JUMP_MARKER:
+                """
+                GOTO_MARKER with the marker's position resolved by the loader.
+                Arguments are the target position and the marker address.
+                """
+                if args[0] < self.IP.inst and self.jit is not None:
+                    self.jit.back_edge(self, frame)
+                    next_instruction = self.fetch
+
+                self.last_goto.frame = self.IP.frame
+                self.last_goto.inst = self.IP.inst
+                self.IP.inst = args[0]
+
             #
             # Arithmetic
             #
@@ -393,8 +613,24 @@ class VirtualMachine:
             # Conditionals
             #
 
+            elif opcode == POP_JUMP_IF_FALSE:
+                """
+                IF_RUN_NEXT with the target resolved by the loader.
+                """
+                if not self.stack.pop():
+                    self.IP.inst = args[0]
+
+            elif opcode == JUMP_ABSOLUTE:
+                """
+                SKIP_NEXT or GO_BACK with the target resolved by the loader.
+                """
+                if args[0] < self.IP.inst and self.jit is not None:
+                    self.jit.back_edge(self, frame)
+                    next_instruction = self.fetch
+
+                self.IP.inst = args[0]
+
             elif opcode == IF_RUN_NEXT:
-                frame.target_IP = self.IP.inst + args[0]
                 if not self.stack.pop():
                     self.IP.inst += args[0]
 
@@ -409,8 +645,16 @@ class VirtualMachine:
             #
 
             elif opcode == FORWARD_ARGS:
-                if frame.stream[self.IP.inst + 1].opcode in ONE_ARG:
-                    frame.forwarded_args = [self.stack.pop()]
+                """
+                Uses the top-most stack value as the argument of the next
+                instruction. The loader merges both instructions into one that
+                takes its argument from the stack, so a FORWARD_ARGS that is
+                still run here has nothing to forward to.
+
+                PUSH_STACK 1
+                FORWARD_ARGS
+                LOAD_MEMORY
+                """
 
             elif opcode == ROT_TWO:
                 """
@@ -447,50 +691,70 @@ class VirtualMachine:
                 self.stack.push(b)
 
             #
-            # Importing
+            # Memory regions
+            #
+            # Regions are given by their first address and their number of
+            # cells, and are read and written in one go.
             #
 
-            elif opcode == IMPORT_MODULE:
+            elif opcode == MEMORY_COPY:
                 """
-                Imports a module. Uses string in stack as filename
-                and argument as frame number.
+                Copies a region of memory, even if the regions overlap.
 
-                PUSH_STRING_STACK "module.bin\0"
-                IMPORT_MODULE 1
+                PUSH_STACK 10 ;; destination
+                PUSH_STACK 1  ;; source
+                PUSH_STACK 8  ;; cells
+                MEMORY_COPY
                 """
-                if self.flags.step:
-                    print("Importing module")
-                module_path = os.path.join(
-                    os.getcwd(), os.path.dirname(frame.file), str(self.stack.pop())
-                )
+                count = self.stack.pop()
+                src = self.stack.pop()
+                frame.memory.copy(self.stack.pop(), src, count)
 
-                # Check if file exists
-                if not os.path.isfile(module_path):
-                    logging.error(f"ImportError: '{module_path}' is not a file")
+            elif opcode == MEMORY_FILL:
+                """
+                Sets every cell of a region to a value.
 
-                # Import module
-                with open(module_path, "r", encoding="latin1") as file:
-                    module_code = parser.parse(file.read())
+                PUSH_STACK 1  ;; start
+                PUSH_STACK 8  ;; cells
+                PUSH_STACK 0  ;; value
+                MEMORY_FILL
+                """
+                value = self.stack.pop()
+                count = self.stack.pop()
+                frame.memory.fill(self.stack.pop(), count, value)
 
-                # Create a new frame
-                if args[0] >= len(self.frames):
-                    self.frames.extend([None] * (args[0] - len(self.frames) + 1))
+            elif opcode == MEMORY_COMPARE:
+                """
+                Pushes whether two regions hold the same values.
 
-                frame = Frame(module_path)
+                PUSH_STACK 1  ;; first region
+                PUSH_STACK 10 ;; second region
+                PUSH_STACK 8  ;; cells
+                MEMORY_COMPARE
+                """
+                count = self.stack.pop()
+                b = frame.memory.region(self.stack.pop(), count)
+                a = frame.memory.region(self.stack.pop(), count)
+                self.stack.push(a == b)
 
-                # Run the code to initialize the memory
-                vm = VirtualMachine("", self.flags)
-                vm.main_loop(module_code)
-                frame.stream = vm.frames[0].stream
-                frame.stream_size = vm.frames[0].stream_size
-                frame.memory = vm.frames[0].memory
+            elif opcode == WRITE_REGION_TO:
+                self.write_region_to(frame, args[0])
 
-                self.frames[args[0]] = frame
+            #
+            # Importing
+            #
 
-                self.initialize_markers(args[0])
+            elif opcode == IMPORT_MODULE:
+                self.import_module(frame, args[0])
 
-                if self.flags.step:
-                    print("Finished importing\n\nCont. IMPORT_MODULE")
+            elif opcode == IMPORT_LINKED:
+                """
+                IMPORT_MODULE with the module linked into the program.
+                Arguments are the frame number and the number of the module
+                in the object file.
+                """
+                self.stack.pop()
+                self.import_linked(frame, args[0], args[1])
 
             elif opcode == PUSH_STACK_MODULE:
                 """
@@ -502,13 +766,160 @@ class VirtualMachine:
                 """
                 Goes to a marker in a module.
                 """
+                module = self.frames[args[0]]
+                target_marker = module.markers.get(args[1])
+                if target_marker is None and module.pending is not None:
+                    target_marker = module.pending.find_marker(module, args[1])
+                if target_marker is None:
+                    logging.error(
+                        "Invalid marker at MARKERS[{}] in module {}".format(
+                            args[1], args[0]
+                        )
+                    )
+
+                # Resolve the jump so later runs skip the lookup. The module
+                # undoes this if the marker is redefined or the module reloaded.
+                frame.stream[self.IP.inst] = Instruction(
+                    JUMP_MODULE, [args[0], target_marker.inst, args[1]]
+                )
+                module.add_jump_site(args[1], frame, self.IP.inst, inst)
+
                 self.last_goto.frame = self.IP.frame
                 self.last_goto.inst = self.IP.inst
+                self.IP.frame = args[0]
+                self.IP.inst = target_marker.inst
 
-                target_marker = self.frames[args[0]].memory[args[1]]
+            elif opcode == JUMP_MODULE:
+                """
+                GOTO_MODULE with the marker's position resolved on its first run,
+                or by the linker. Arguments are the module, the target position
+                and, unless linked, the marker address.
+                """
+                self.last_goto.frame = self.IP.frame
+                self.last_goto.inst = self.IP.inst
                 self.IP.frame = args[0]
+                self.IP.inst = args[1]
+
+            #
+            # Forwarded arguments
+            #
+            # These replace a FORWARD_ARGS and take the argument of the
+            # instruction that follows it from the stack. The following
+            # instruction is then skipped, so positions seen by the program
+            # stay the same.
+            #
+
+            elif opcode == LOAD_MEMORY_DYN:
+                self.stack.push(frame.memory[self.stack.pop()])
+                self.IP.inst += 1
+
+            elif opcode == STORE_MEMORY_DYN:
+                addr = self.stack.pop()
+                frame.memory[addr] = self.stack.pop()
+                self.IP.inst += 1
+
+            elif opcode == GOTO_MARKER_DYN:
+                addr = self.stack.pop()
+                self.IP.inst += 1
+
+                if addr == 0:
+                    self.IP.frame = self.last_goto.frame
+                    self.IP.inst = self.last_goto.inst
+                    continue
+
+                target_marker = frame.markers.get(addr)
+                if target_marker is None and frame.pending is not None:
+                    target_marker = frame.pending.find_marker(frame, addr)
+                if target_marker is None:
+                    logging.error("Invalid marker at MARKERS[{}]".format(addr))
+
+                self.last_goto.frame = self.IP.frame
+                self.last_goto.inst = self.IP.inst
+                self.IP.frame = target_marker.frame
                 self.IP.inst = target_marker.inst
 
+            elif opcode == MAKE_MARKER_DYN:
+                addr = self.stack.pop()
+                self.IP.inst += 1
+                frame.set_marker(addr, Marker(self.IP))
+
+            elif opcode == PUSH_STACK_DYN:
+                self.stack.push(self.stack.pop())
+                self.IP.inst += 1
+
+            elif opcode == IF_RUN_NEXT_DYN:
+                offset = self.stack.pop()
+                self.IP.inst += 1
+                if not self.stack.pop():
+                    self.IP.inst += offset
+
+            elif opcode == SKIP_NEXT_DYN:
+                self.IP.inst += self.stack.pop() + 1
+
+            elif opcode == GO_BACK_DYN:
+                self.IP.inst -= self.stack.pop()
+
+            elif opcode == READ_FROM_DYN:
+                self.IP.inst += 1
+                self.read_from(frame, self.stack.pop())
+
+            elif opcode == READ_CHAR_FROM_DYN:
+                self.IP.inst += 1
+                self.read_char_from(frame, self.stack.pop())
+
+            elif opcode == WRITE_TO_DYN:
+                self.IP.inst += 1
+                self.write_to(frame, self.stack.pop())
+
+            elif opcode == OPEN_FILE_DYN:
+                self.IP.inst += 1
+                self.open_file(self.stack.pop())
+
+            elif opcode == IMPORT_MODULE_DYN:
+                self.IP.inst += 1
+                self.import_module(frame, self.stack.pop())
+
+            elif opcode == WRITE_REGION_TO_DYN:
+                self.IP.inst += 1
+                self.write_region_to(frame, self.stack.pop())
+
+            elif opcode == EXEC_BLOCK:
+                """
+                Runs a block of instructions that was translated to the
+                register IR.
+                """
+                self.IP.inst = frame.blocks[args[0]].run(frame.memory, self.stack)
+
+            elif opcode == WRAP_ARITHMETIC:
+                """
+                An arithmetic instruction in fixed-width mode. Arguments are
+                its opcode, the width and the function that wraps it.
+                """
+                function = cast(Callable[..., Any], args[2])
+                if args[0] == BINARY_NOT:
+                    self.stack.push(function(self.stack.pop()))
+                else:
+                    b = self.stack.pop()
+                    a = self.stack.pop()
+                    self.stack.push(function(a, b))
+
+            elif opcode == ENTER_TRACE:
+                """
+                Stands in for the backward jump of a loop that was compiled
+                by the JIT. Runs the loop until it leaves the trace.
+                """
+                self.IP.inst = frame.traces[args[0]].run(self, frame)
+                # The trace counts the jump it left with itself
+                self.expected.inst = self.IP.inst
+
+            elif opcode == DECODE_PAGE:
+                """
+                Stands in for an instruction of an object file that has not
+                been decoded yet. Decodes it and runs it.
+                """
+                frame.source.decode_page(frame.stream, self.IP.inst)
+                self.IP.inst -= 1
+
             else:
                 logging.error(
                     "Unknown instruction: {}".format(bin(opcode)[2:].rjust(2, "0"))
@@ -517,16 +928,278 @@ class VirtualMachine:
             if self.flags.step:
                 input(
                     "Mem: {}\nStk: {}".format(
-                        frame.memory.memory,
-                        self.stack.stack,
+                        list(frame.memory.memory),
+                        list(self.stack.stack),
                     )
                 )
 
+        if self.jit is not None and self.jit.traces:
+            logging.log_level_one(self.jit.summary(), getattr(self.flags, "verbose", 0))
+
+    def read_from(self, frame: "Frame", addr: int) -> None:
+        """
+        Reads values from a source until the terminator is reached (top stack).
+        Pushes text to stack. Terminator is consumed but excluded.
+        0 is stdin. Any other value is read from memory to determine source.
+
+        PUSH_STACK \10
+        READ_FROM 0 (stdin)
+        PUSH_STRING_STACK "file.txt"
+        OPEN_FILE 0
+        STORE_MEMORY 1
+        PUSH_STACK \32
+        READ_FROM 1
+        WRITE_TO 0 (stdin)
+        """
+        # TODO: Include new READ_X_FROM instructions
+        terminator = self.char(self.stack.pop())
+
+        if addr == 0:
+            source = stdin if self.input is None else self.input_at(frame, addr)
+            string = ""
+            # Input that ends, like a replay of a shorter run, ends the read
+            while True:
+                ch = source.read(1)
+                if ch == terminator or ch == "":
+                    break
+                string += ch
+            self.stats.bytes_read += len(string)
+            self.stack.push(String(string))
+
+        else:
+            fstream = self.input_at(frame, addr)
+
+            string = ""
+            while True:
+                if (char := fstream.read(1)) == terminator or char == "":
+                    break
+                string += char
+            self.stats.bytes_read += len(string)
+            self.stack.push(String(string))
+
+    def read_char_from(self, frame: "Frame", addr: int) -> None:
+        """
+        Reads one char from a source. Pushes the char to stack.
+        0 is stdin. Any other value is read from memory to determine source.
+
+        READ_CHAR_FROM 0 (stdin)
+        PUSH_STACK 48
+        BINARY_SUBTRACT
+        READ_CHAR_FROM 0 (stdin)
+        BINARY_ADD
+        WRITE_TO 0 (stdin)
+        """
+        self.stats.bytes_read += 1
+        if addr == 0:
+            source = stdin if self.input is None else self.input_at(frame, addr)
+            # self.stack.push(String(stdin.read(1)))
+            self.stack.push(ord(source.read(1)))
+        else:
+            fstream = self.input_at(frame, addr)
+
+            self.stack.push(String(fstream.read(1)))
+
+    def write_to(self, frame: "Frame", addr: int) -> None:
+        """
+        Writes the top-most stack to a source.
+        0 is stdout. Any other value is reads from memory to determine source.
+        """
+        if addr == 0:
+            content = self.stack.pop()
+            # print(content)
+            if isinstance(content, int):
+                self.stats.bytes_written += stdout.write(self.char(content))
+            else:
+                self.stats.bytes_written += stdout.write(str(content))
+            stdout.flush()
+        else:
+            fstream = self.file_at(frame, addr)
+
+            self.stats.bytes_written += fstream.write(str(self.stack.pop()))
+
+    def write_region_to(self, frame: "Frame", addr: int) -> None:
+        """
+        Writes a region of memory to a source in a single write, the same way
+        WRITE_TO would write each cell.
+
+        PUSH_STACK 1  ;; start
+        PUSH_STACK 8  ;; cells
+        WRITE_REGION_TO 0 (stdout)
+        """
+        count = self.stack.pop()
+        cells = frame.memory.region(self.stack.pop(), count)
+
+        if addr == 0:
+            self.stats.bytes_written += stdout.write(
+                "".join(self.char(c) if isinstance(c, int) else str(c) for c in cells)
+            )
+            stdout.flush()
+        else:
+            fstream = self.file_at(frame, addr)
+
+            self.stats.bytes_written += fstream.write("".join(map(str, cells)))
+
+    def char(self, value: int) -> str:
+        if value < 0:
+            value &= self.char_mask
+        return chr(value)
+
+    def input_at(self, frame: "Frame", addr: int) -> "recording.Readable":
+        """
+        Returns what READ_FROM and READ_CHAR_FROM read from at an address,
+        which is recorded or replayed with --record or --replay.
+        """
+        if self.input is None:
+            return self.file_at(frame, addr)
+        if addr == 0:
+            return self.input.source(0, lambda: stdin)
+
+        number = frame.memory[addr]
+        if not isinstance(number, int) or number not in self.files.handles:
+            logging.error("MEMORY[{}] is not a file".format(addr))
+        return self.input.source(number, lambda: self.file_at(frame, addr))
+
+    def file_at(self, frame: "Frame", addr: int) -> IO[Any]:
+        """
+        Returns the file of the handle stored at an address.
+        """
+        fstream = self.files.get(frame.memory[addr])
+        if fstream is None:
+            logging.error("MEMORY[{}] is not a file".format(addr))
+        return fstream
+
+    def open_file(self, mode: int) -> None:
+        """
+        Opens file from stack and pushes the number of its handle to stack.
+
+        PUSH_STRING_STACK "file.txt"
+        OPEN_FILE
+        """
+        if 0b0000 <= mode <= 0b1111:
+            file = self.stack.pop()
+            # print(MODES[mode])
+            self.stack.push(self.files.open(str(file), MODES[mode]))
+        else:
+            logging.error(
+                "Invalid file mode {}. Range: 0b0000-0b1111.".format(bin(mode))
+            )
+
+    def import_module(self, frame: "Frame", frame_index: int) -> None:
+        """
+        Imports a module. Uses string in stack as filename
+        and argument as frame number.
+
+        PUSH_STRING_STACK "module.bin\0"
+        IMPORT_MODULE 1
+        """
+        if self.flags.step:
+            print("Importing module")
+        module_path = os.path.join(
+            os.getcwd(), os.path.dirname(frame.file), str(self.stack.pop())
+        )
+
+        # Check if file exists
+        if not os.path.isfile(module_path):
+            logging.error(f"ImportError: '{module_path}' is not a file")
+
+        # Run the code to initialize the memory
+        self.stats.imports += 1
+        vm = VirtualMachine(module_path, self.flags, self)
+        stream = None
+        if self.prefetcher is not None:
+            stream = self.prefetcher.take(module_path)
+        if stream is not None:
+            vm.load_stream(0, stream)
+        else:
+            vm.load_file(0, module_path)
+        vm.main_loop()
+
+        self.install_module(frame_index, vm.frames[0])
+
+        if self.flags.step:
+            print("Finished importing\n\nCont. IMPORT_MODULE")
+
+    def import_linked(self, frame: "Frame", frame_index: int, number: int) -> None:
+        """
+        Imports a module from the object file of the frame. Modules that were
+        initialized when linking come with their memory and aren't run again.
+        """
+        module_path, obj = frame.source.modules()[number]
+
+        self.stats.imports += 1
+        vm = VirtualMachine(module_path, self.flags, self)
+        vm.load_object(0, obj)
+
+        memory = obj.memory()
+        if memory is None:
+            vm.main_loop()
+        else:
+            vm.frames[0].memory.memory = memory
+            vm.frames[0].memory.size = len(memory)
+            vm.wrap_arithmetic(0)
+            vm.compile_blocks(0)
+
+        self.install_module(frame_index, vm.frames[0])
+
+    def install_module(self, frame_index: int, module: "Frame") -> None:
+        # Create a new frame
+        if frame_index >= len(self.frames):
+            self.frames.extend([None] * (frame_index - len(self.frames) + 1))
+
+        # Jumps resolved into a module that is being replaced must go
+        # back to looking up the new module's markers
+        if self.frames[frame_index] is not None:
+            self.frames[frame_index].deoptimize_all()
+
+        for marker in module.markers.values():
+            marker.frame = frame_index
+
+        self.frames[frame_index] = module
+
+    def wrap_arithmetic(self, frame_index: int) -> None:
+        """
+        Makes the arithmetic of a frame wrap around in fixed-width mode.
+        """
+        width = getattr(self.flags, "int_width", None)
+        if not width:
+            return
+
+        import binarypp.vm.fixedwidth
+
+        frame = self.frames[frame_index]
+        if frame.source is not None:
+            frame.source.decode_all(frame.stream)
+        binarypp.vm.fixedwidth.wrap_arithmetic(frame.stream, width)
+
+    def compile_blocks(self, frame_index: int) -> None:
+        """
+        Translates the straight-line code of a frame to the register IR if
+        it is enabled. Step mode runs every instruction on its own.
+        """
+        if not getattr(self.flags, "ir", False) or self.flags.step:
+            return
+
+        frame = self.frames[frame_index]
+        if frame.blocks or frame.pending is not None:
+            return
+        if frame.source is not None:
+            frame.source.decode_all(frame.stream)
+
+        import binarypp.vm.ir
+
+        frame.blocks = binarypp.vm.ir.compile_stream(frame.stream)
+        for number, block in enumerate(frame.blocks):
+            frame.stream[block.start] = Instruction(EXEC_BLOCK, [number])
+
+        if getattr(self.flags, "dump_ir", False):
+            print(f"IR of {frame.file}", file=sys.stderr)
+            print(binarypp.vm.ir.dump(frame.blocks), file=sys.stderr)
+
     def initialize_markers(self, frame_index: int) -> None:
         """
         Scan the instructions in a stream and perform the following tasks:
-        1. Initialize markers into memory
-        2. Load modules
+        1. Initialize markers into the marker table
+        2. Record jumps that the loader resolved to a marker
         """
         start_frame = self.IP.frame
         start_inst = self.IP.inst
@@ -539,12 +1212,18 @@ class VirtualMachine:
             if inst is None:
                 break
 
-            if inst.opcode == MAKE_MARKER:
+            if inst.opcode == MAKE_MARKER and inst.opargs:
                 addr = inst.opargs[0]
                 # Only initialize the first occurance of a marker
-                if addr < frame.memory.size and isinstance(frame.memory[addr], Marker):
+                if addr in frame.markers:
                     continue
-                frame.memory[addr] = Marker(self.IP)
+                frame.markers[addr] = Marker(self.IP)
+
+            elif inst.opcode == JUMP_MARKER:
+                addr = inst.opargs[1]
+                frame.add_jump_site(
+                    addr, frame, self.IP.inst, Instruction(GOTO_MARKER, [addr])
+                )
 
             # elif inst.opcode == IMPORT_MODULE:
 
@@ -553,14 +1232,60 @@ class VirtualMachine:
 
 
 class Frame:
-    def __init__(self, file: str):
+    def __init__(
+        self, file: str, width: Optional[int] = None, max_memory: Optional[int] = None
+    ):
         self.file: str = file
 
-        self.memory: Memory = Memory()
+        # Fixed-width mode keeps memory in an array of the width
+        typecode = None
+        if width:
+            import binarypp.vm.fixedwidth
+
+            typecode = binarypp.vm.fixedwidth.typecode(width)
+        self.memory: Memory = Memory(typecode, max_memory)
+        self.markers: Dict[int, Marker] = {}
+
+        # Instructions jumping straight to one of this frame's markers, keyed
+        # by marker address. Each entry keeps the frame and position of the
+        # jump along with the instruction it replaced.
+        self.jump_sites: Dict[int, List[Tuple[Frame, int, Instruction]]] = {}
 
         self.stream: List[Instruction] = []
         self.stream_size: int = 0
 
-        self.forwarded_args: List[Any] = []
+        # Object file the stream is decoded from, if it was compiled
+        self.source: Optional["objfile.ObjectFile"] = None
+
+        # Rest of the program of a lazily loaded frame
+        self.pending: Optional["lazy.LazyStream"] = None
+
+        # Blocks translated to the register IR, run by EXEC_BLOCK
+        self.blocks: List["ir.Block"] = []
+
+        # Runs of each backward jump, and the loops compiled by the JIT
+        self.back_edges: Dict[int, int] = {}
+        self.traces: List["traces.Trace"] = []
+
+    def set_marker(self, addr: int, marker: Marker) -> None:
+        """
+        Stores a marker. Moving a marker that jumps were resolved to puts the
+        original instructions back so they look the marker up again.
+        """
+        if addr in self.jump_sites and marker.inst != self.markers[addr].inst:
+            self.deoptimize(addr)
+
+        self.markers[addr] = marker
+
+    def add_jump_site(
+        self, addr: int, frame: "Frame", index: int, original: Instruction
+    ) -> None:
+        self.jump_sites.setdefault(addr, []).append((frame, index, original))
+
+    def deoptimize(self, addr: int) -> None:
+        for frame, index, original in self.jump_sites.pop(addr, []):
+            frame.stream[index] = original
 
-        self.target_IP: int = -1
+    def deoptimize_all(self) -> None:
+        for addr in list(self.jump_sites):
+            self.deoptimize(addr)
@@ -0,0 +1,78 @@
+"""
+Fixtures shared by the tests
+"""
+
+import io
+from argparse import Namespace
+
+import pytest
+
+from binarypp.types import Instruction
+from binarypp.vm import VirtualMachine
+from binarypp.vm.opcodes import *
+
+
+def write_source(path, codes):
+    """
+    Writes a program in binary text mode.
+    """
+    path.write_text(" ".join(f"{code:08b}" for code in [0, *codes]))
+    return str(path)
+
+
+def count_to(limit, step=1):
+    # MEMORY[1] = MEMORY[1] + step while it is less than limit, leaving
+    # MEMORY[1] * 2 on the stack
+    return [
+        Instruction(MAKE_MARKER, [1]),
+        Instruction(LOAD_MEMORY, [1]),
+        Instruction(PUSH_STACK, [step]),
+        Instruction(BINARY_ADD),
+        Instruction(STORE_MEMORY, [1]),
+        Instruction(LOAD_MEMORY, [1]),
+        Instruction(PUSH_STACK, [limit]),
+        Instruction(LESS_THAN),
+        Instruction(IF_RUN_NEXT, [1]),
+        Instruction(GOTO_MARKER, [1]),
+        Instruction(LOAD_MEMORY, [1]),
+        Instruction(DUP_TOP),
+        Instruction(BINARY_ADD),
+    ]
+
+
+@pytest.fixture(name="write_source")
+def write_source_fixture():
+    return write_source
+
+
+@pytest.fixture(name="count_to")
+def count_to_fixture():
+    return count_to
+
+
+@pytest.fixture
+def run(monkeypatch):
+    """
+    Returns a function running a stream, or a program file, on a new VM with
+    stdin and stdout swapped for strings. What the program wrote is kept as
+    vm.output, even if it stopped with an error.
+    """
+
+    def run(program, stdin="", **flags):
+        output = io.StringIO()
+        monkeypatch.setattr("binarypp.vm.vm.stdin", io.StringIO(stdin))
+        monkeypatch.setattr("binarypp.vm.vm.stdout", output)
+
+        path = program if isinstance(program, str) else "test_file.bin"
+        vm = VirtualMachine(path, Namespace(step=None, **flags))
+        try:
+            if isinstance(program, str):
+                vm.load_file(0, program)
+                vm.main_loop()
+            else:
+                vm.main_loop(program)
+        finally:
+            vm.output = output.getvalue()
+        return vm
+
+    return run
@@ -0,0 +1,135 @@
+"""
+Test features in binarypp.build
+"""
+
+import os
+import shutil
+from argparse import Namespace
+
+import pytest
+
+import binarypp.build as build
+import binarypp.linker as linker
+import binarypp.objfile as objfile
+import binarypp.parser as parser
+from binarypp.vm.opcodes import *
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+def sources(tmp_path):
+    source = tmp_path / "src"
+    (source / "sub").mkdir(parents=True)
+    shutil.copy(os.path.join(EXAMPLES, "hello_world.raw"), source)
+    shutil.copy(os.path.join(EXAMPLES, "fibonacci.raw"), source / "sub")
+    (source / "notes.txt").write_text("Not a program")
+    return source
+
+
+def test_targets(tmp_path):
+    source = sources(tmp_path)
+    output = str(tmp_path / "out")
+
+    assert build.targets([str(source)], output) == [
+        (str(source / "hello_world.raw"), os.path.join(output, "hello_world.bin")),
+        (
+            str(source / "sub" / "fibonacci.raw"),
+            os.path.join(output, "sub", "fibonacci.bin"),
+        ),
+    ]
+
+
+def test_build(tmp_path, capsys):
+    source = sources(tmp_path)
+    output = tmp_path / "out"
+    flags = Namespace(step=None)
+
+    assert build.build([str(source)], str(output), flags, jobs=2) == 0
+    assert parser.is_object_file(str(output / "hello_world.bin"))
+    assert parser.is_object_file(str(output / "sub" / "fibonacci.bin"))
+    assert "Compiled 2 programs, 0 were up to date" in capsys.readouterr().out
+
+    # Only the changed program is compiled again
+    changed = source / "hello_world.raw"
+    mtime = os.stat(output / "hello_world.bin").st_mtime_ns + 10**9
+    os.utime(changed, ns=(mtime, mtime))
+    assert build.build([str(source)], str(output), flags, jobs=1) == 0
+    assert "Compiled 1 programs, 1 were up to date" in capsys.readouterr().out
+
+
+def test_failures(tmp_path, capfd):
+    source = sources(tmp_path)
+    (source / "bad.raw").write_text("10010100 00000000")
+    (source / "empty.raw").write_text("")
+    # Not UTF-8, but read as latin1 like the VM does
+    (source / "legacy.raw").write_bytes(bytes([PUSH_STACK, 0x81]))
+    output = tmp_path / "out"
+
+    assert build.build([str(source)], str(output), Namespace(step=None)) == 2
+    assert not (output / "bad.bin").exists()
+    assert not (output / "empty.bin").exists()
+    assert (output / "legacy.bin").exists()
+
+    # Workers write to the same stderr, and the build still ends with a summary
+    out, err = capfd.readouterr()
+    assert err.count("Could not compile") == 2
+    assert "Compiled 3 programs" in out
+
+
+@pytest.fixture
+def source(write_source, tmp_path):
+    codes = [
+        MAKE_MARKER, 1,
+        PUSH_STACK, 104,
+        WRITE_TO, 0,
+        GOTO_MARKER, 2,
+        MAKE_MARKER, 3,
+        PUSH_STACK, 120,
+        WRITE_TO, 0,
+        MAKE_MARKER, 2,
+        PUSH_STACK, 105,
+        WRITE_TO, 0,
+    ]  # fmt: skip
+    return write_source(tmp_path / "program.raw", codes)
+
+
+def test_optimize(run, source, tmp_path):
+    output = str(tmp_path / "program.bin")
+
+    assert build.optimize(source, output) == (10, 6)
+    assert objfile.ObjectFile(output).markers() == {2: 3}
+    assert run(output).output == "hi"
+
+    # Compiled programs can be optimized again, and modules keep their markers
+    assert build.optimize(output, output) == (6, 6)
+    assert build.optimize(source, output, exported=True) == (10, 10)
+    assert run(output).output == "hi"
+
+
+def test_optimize_raw_characters(run, tmp_path):
+    # Programs written as raw characters are read as latin1, like the VM does
+    source = tmp_path / "program.raw"
+    source.write_bytes(bytes([PUSH_STACK, 0x81, WRITE_TO, 0]))
+    output = str(tmp_path / "program.bin")
+
+    assert build.optimize(str(source), output) == (2, 2)
+    assert run(output).output == "\x81"
+
+
+def test_optimize_linked(tmp_path):
+    (tmp_path / "module.raw").write_text("00000000 00000100 00000001")
+    main = tmp_path / "main.raw"
+    main.write_text(
+        " ".join(
+            f"{code:08b}"
+            for code in [0, PUSH_STRING_STACK, *map(ord, "module.raw"), 0]
+            + [IMPORT_MODULE, 1]
+        )
+    )
+
+    output = str(tmp_path / "main.bin")
+    with open(output, "wb") as file:
+        file.write(linker.link(str(main)))
+
+    with pytest.raises(SystemExit):
+        build.optimize(output, output)
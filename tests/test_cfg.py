@@ -0,0 +1,82 @@
+"""
+Test features in binarypp.vm.cfg
+"""
+
+from binarypp.types import Instruction
+from binarypp.vm.cfg import CFG
+from binarypp.vm.opcodes import *
+
+LOOP = [
+    Instruction(PUSH_STACK, [0]),
+    Instruction(MAKE_MARKER, [1]),
+    Instruction(PUSH_STACK, [1]),
+    Instruction(BINARY_ADD),
+    Instruction(DUP_TOP),
+    Instruction(PUSH_STACK, [3]),
+    Instruction(LESS_THAN),
+    Instruction(POP_JUMP_IF_FALSE, [8]),
+    Instruction(JUMP_MARKER, [1, 1]),
+    Instruction(PUSH_STACK, [5]),
+]
+
+
+def test_blocks():
+    graph = CFG(LOOP, exported=False)
+
+    assert list(graph.blocks) == [0, 2, 8, 9]
+    assert graph.blocks[2].end == 8
+    assert graph.blocks[0].successors == [2]
+    assert graph.blocks[2].successors == [8, 9]
+    assert graph.blocks[8].successors == [2]
+    assert graph.blocks[9].successors == []
+    assert graph.blocks[2].predecessors == [0, 8]
+    assert graph.block_at(5) is graph.blocks[2]
+
+
+def test_loop_headers():
+    assert CFG(LOOP, exported=False).loop_headers() == {2}
+
+
+def test_reachable():
+    stream = [
+        Instruction(JUMP_ABSOLUTE, [1]),
+        Instruction(PUSH_STACK, [1]),
+        Instruction(PUSH_STACK, [2]),
+        Instruction(PUSH_STACK, [3]),
+        Instruction(LOAD_MEMORY_DYN),
+        Instruction(LOAD_MEMORY),
+    ]
+
+    # The instruction a forwarded argument variant skips belongs to it
+    assert CFG(stream).reachable() == {0, 2, 3, 4, 5}
+
+
+def test_goto_returns():
+    stream = [
+        Instruction(JUMP_MARKER, [2, 1]),
+        Instruction(PUSH_STACK, [1]),
+        Instruction(MAKE_MARKER, [1]),
+        Instruction(GOTO_MARKER, [0]),
+    ]
+    assert CFG(stream, exported=False).reachable() == {0, 1, 2, 3}
+
+    # Without GOTO_MARKER 0 nothing returns to the instruction after the goto
+    stream[3] = Instruction(POP_STACK)
+    assert CFG(stream, exported=False).reachable() == {0, 3}
+
+
+def test_dynamic():
+    assert CFG([Instruction(SKIP_NEXT_DYN), Instruction(SKIP_NEXT)]).dynamic
+    assert not CFG(LOOP).dynamic
+
+
+def test_forwarded_goto():
+    stream = [
+        Instruction(MAKE_MARKER, [1]),
+        Instruction(PUSH_STACK, [1]),
+        Instruction(GOTO_MARKER_DYN),
+        Instruction(GOTO_MARKER),
+        Instruction(POP_STACK),
+    ]
+    # The skipped GOTO_MARKER has no argument of its own
+    assert list(CFG(stream, exported=False).blocks) == [0, 1, 4]
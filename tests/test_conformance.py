@@ -0,0 +1,71 @@
+"""
+Test features in binarypp.conformance
+"""
+
+import os
+import random
+
+import binarypp.conformance as conformance
+from binarypp.parser import parse
+from binarypp.types import Instruction
+from binarypp.vm.opcodes import *
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+def test_flatten():
+    statements = [
+        conformance.Skip(IF_RUN_NEXT, 2),
+        [Instruction(DUP_TOP)],
+        conformance.Loop(1, 3, [[Instruction(PUSH_STACK, [1])]]),
+        [Instruction(POP_STACK)],
+    ]
+    code = conformance.flatten(statements)
+
+    # The skip goes over the whole loop
+    assert code[0].opargs == [1 + 3 + 1 + 7]
+    assert len(code) == 1 + 1 + 11 + 1
+
+    parsed = parse(conformance.encode(code))
+    assert [inst.opcode for inst in parsed] == [inst.opcode for inst in code]
+
+
+def test_engines_agree(tmp_path):
+    harness = conformance.Harness(str(tmp_path), conformance.ENGINES)
+    for name in sorted(os.listdir(EXAMPLES)):
+        harness.check(os.path.join(EXAMPLES, name), "8\n")
+
+    rng = random.Random(0)
+    for number in range(30):
+        harness.check_random(rng, number)
+
+    assert harness.programs == len(os.listdir(EXAMPLES)) + 30
+    assert harness.mismatches == []
+    assert set(harness.times) == {engine[0] for engine in conformance.ENGINES}
+
+
+def test_mismatch(tmp_path):
+    # Wrapping arithmetic is a different language, which the harness notices
+    wrapping = ("wrapping", {"int_width": 8, "no_jit": True}, None)
+    harness = conformance.Harness(str(tmp_path), [wrapping])
+
+    statements = [
+        [Instruction(PUSH_STACK, [7])],
+        [Instruction(STORE_MEMORY, [1])],
+        [Instruction(PUSH_STACK, [200])],
+        [Instruction(PUSH_STACK, [100])],
+        [Instruction(BINARY_ADD)],
+    ]
+    path = tmp_path / "program.raw"
+    path.write_text(conformance.encode(conformance.flatten(statements)))
+    harness.check(str(path), statements=statements, name="program")
+
+    assert harness.mismatches == [
+        "wrapping differs on program:\n"
+        "  stack: [300] != [44]\n"
+        "  Shrunk to:\n"
+        "    PUSH_STACK 7\n"
+        "    PUSH_STACK 200\n"
+        "    BINARY_ADD"
+    ]
+    assert "1 mismatches" in harness.report()
@@ -0,0 +1,61 @@
+"""
+Test features in binarypp.disassembler
+"""
+
+from argparse import Namespace
+
+import binarypp.disassembler as disassembler
+import binarypp.linker as linker
+from binarypp.types import Instruction
+from binarypp.vm import VirtualMachine
+from binarypp.vm.opcodes import *
+
+
+def test_disassemble():
+    vm = VirtualMachine("test_file.bin", Namespace(step=None))
+    vm.load_stream(
+        0,
+        [
+            Instruction(MAKE_MARKER, [1]),
+            Instruction(PUSH_STRING_STACK, [104, 105, 10]),
+            Instruction(PUSH_LONG_STACK, [5, 57]),
+            Instruction(FORWARD_ARGS),
+            Instruction(LOAD_MEMORY),
+            Instruction(IF_RUN_NEXT, [1]),
+            Instruction(GOTO_MARKER, [1]),
+            Instruction(GOTO_MARKER, [0]),
+        ],
+    )
+
+    assert [line.rstrip() for line in disassembler.disassemble(vm.frames[0])] == [
+        "0  MAKE_MARKER 1",
+        "1  PUSH_STRING_STACK 'hi\\n'",
+        "2  PUSH_LONG_STACK 1337",
+        "3  LOAD_MEMORY_DYN",
+        "4  LOAD_MEMORY                      ; skipped",
+        "5  POP_JUMP_IF_FALSE 6              ; -> 7",
+        "6  JUMP_MARKER 0 1                  ; -> 1 (marker 1)",
+        "7  GOTO_MARKER 0",
+    ]
+
+
+def test_listing(tmp_path):
+    (tmp_path / "module.raw").write_text("00000000 00001110 00000001 00001111 00000001")
+    main = tmp_path / "main.raw"
+    main.write_text(
+        " ".join(
+            f"{code:08b}"
+            for code in [0, PUSH_STRING_STACK, *map(ord, "module.raw"), 0]
+            + [IMPORT_MODULE, 1]
+        )
+    )
+    (tmp_path / "main.bin").write_bytes(linker.link(str(main)))
+
+    # Modules linked into the program are listed after it
+    lines = disassembler.listing(str(tmp_path / "main.bin")).splitlines()
+    assert lines[0] == "{}: 2 instructions".format(tmp_path / "main.bin")
+    assert lines[-3:] == [
+        "{}: 2 instructions".format(tmp_path / "module.raw"),
+        "0  MAKE_MARKER 1",
+        "1  JUMP_MARKER 0 1                  ; -> 1 (marker 1)",
+    ]
@@ -0,0 +1,45 @@
+"""
+Test features in binarypp.vm.files
+"""
+
+from binarypp.vm.files import FileTable
+
+
+def test_shared_reads(tmp_path):
+    path = str(tmp_path / "file.txt")
+    with open(path, "w") as file:
+        file.write("abcdef")
+
+    table = FileTable()
+    first = table.open(path, "r")
+    second = table.open(path, "r")
+    assert first != second
+    assert len(table.open_files) == 1
+
+    # Each handle reads from its own position
+    assert table.get(first).read(2) == "ab"
+    assert table.get(second).read(1) == "a"
+    assert table.get(first).read(2) == "cd"
+    assert table.get(second).read(1) == "b"
+
+
+def test_eviction(tmp_path):
+    table = FileTable(capacity=1)
+    first = table.open(str(tmp_path / "first.txt"), "w")
+    table.get(first).write("ab")
+    second = table.open(str(tmp_path / "second.txt"), "w")
+    table.get(second).write("x")
+
+    # The first file was closed, and is reopened where it was left
+    assert len(table.open_files) == 1
+    table.get(first).write("cd")
+    table.close()
+
+    assert (tmp_path / "first.txt").read_text() == "abcd"
+    assert (tmp_path / "second.txt").read_text() == "x"
+
+
+def test_missing_handle():
+    table = FileTable()
+    assert table.get(1) is None
+    assert table.get("file.txt") is None
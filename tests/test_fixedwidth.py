@@ -0,0 +1,116 @@
+"""
+Test features in binarypp.vm.fixedwidth
+"""
+
+from array import array
+
+import binarypp.vm.fixedwidth as fixedwidth
+from binarypp.types import Instruction
+from binarypp.vm.opcodes import *
+
+
+def test_functions():
+    functions = fixedwidth.functions(8)
+
+    assert functions[BINARY_ADD](100, 100) == -56
+    assert functions[BINARY_SUBTRACT](-128, 1) == 127
+    assert functions[BINARY_SUBTRACT](0, 1) == -1
+    assert functions[BINARY_NOT](0) == -1
+    assert functions[BINARY_POWER](3, 5) == -13
+    assert functions[BINARY_POWER](3, 10**6) == pow(3, 10**6, 256)
+    assert functions[BINARY_LEFT_SHIFT](1, 7) == -128
+    assert functions[BINARY_LEFT_SHIFT](1, 10**6) == 0
+    assert functions[BINARY_TRUE_DIVIDE](1, 2) == 0.5
+    assert functions[BINARY_ADD](0.5, 300) == 300.5
+
+
+def test_wrap_arithmetic():
+    stream = [Instruction(PUSH_STACK, [1]), Instruction(BINARY_ADD)]
+    fixedwidth.wrap_arithmetic(stream, 16)
+
+    # The wrapping function is looked up once, when the stream is rewritten
+    assert stream[0].opcode == PUSH_STACK
+    assert stream[1].opcode == WRAP_ARITHMETIC
+    assert stream[1].opargs == [BINARY_ADD, 16, fixedwidth.functions(16)[BINARY_ADD]]
+
+
+def test_typecode():
+    assert fixedwidth.typecode(8) == "b"
+    assert array(fixedwidth.typecode(64)).itemsize == 8
+
+
+def counter():
+    # MEMORY[1] = MEMORY[1] + 3 until it wraps around to 1, from 127 to -128
+    return [
+        Instruction(MAKE_MARKER, [1]),
+        Instruction(LOAD_MEMORY, [1]),
+        Instruction(PUSH_STACK, [3]),
+        Instruction(BINARY_ADD),
+        Instruction(DUP_TOP),
+        Instruction(STORE_MEMORY, [1]),
+        Instruction(PUSH_STACK, [1]),
+        Instruction(NOT_EQUAL_TO),
+        Instruction(IF_RUN_NEXT, [1]),
+        Instruction(GOTO_MARKER, [1]),
+        Instruction(PUSH_STACK, [0]),
+        Instruction(BINARY_NOT),
+    ]
+
+
+def test_run(run):
+    vm = run(counter(), int_width=8, no_jit=True)
+
+    assert vm.frames[0].memory[1] == 1
+    assert vm.frames[0].memory.memory.typecode == "b"
+    assert vm.stack.stack == [-1]
+
+
+def test_run_compiled(run):
+    vm = run(counter(), int_width=8, ir=True, jit_threshold=10)
+
+    assert len(vm.jit.traces) == 1
+    assert vm.frames[0].memory[1] == 1
+    assert vm.stack.stack == [-1]
+
+
+def test_write(run):
+    # 200 is -56 in 8 bits, and is written as the character it was
+    vm = run(
+        [
+            Instruction(PUSH_STACK, [200]),
+            Instruction(PUSH_STACK, [0]),
+            Instruction(BINARY_ADD),
+            Instruction(DUP_TOP),
+            Instruction(WRITE_TO, [0]),
+            Instruction(STORE_MEMORY, [1]),
+            Instruction(PUSH_STACK, [1]),
+            Instruction(PUSH_STACK, [1]),
+            Instruction(WRITE_REGION_TO, [0]),
+        ],
+        int_width=8,
+    )
+    assert vm.output == "\xc8\xc8"
+    assert vm.frames[0].memory[1] == -56
+
+
+def test_booleans(run, tmp_path):
+    # A comparison is stored and written to a file as a boolean
+    path = str(tmp_path / "out.txt")
+    vm = run(
+        [
+            Instruction(PUSH_STACK, [1]),
+            Instruction(PUSH_STACK, [1]),
+            Instruction(EQUALS_TO),
+            Instruction(STORE_MEMORY, [2]),
+            Instruction(PUSH_STRING_STACK, [ord(c) for c in path]),
+            Instruction(OPEN_FILE, [0b0100]),
+            Instruction(STORE_MEMORY, [1]),
+            Instruction(LOAD_MEMORY, [2]),
+            Instruction(WRITE_TO, [1]),
+            Instruction(LOAD_MEMORY, [2]),
+        ],
+        int_width=8,
+    )
+    assert vm.stack.stack == [True]
+    assert vm.stack.stack[0] is True
+    assert (tmp_path / "out.txt").read_text() == "True"
@@ -0,0 +1,95 @@
+"""
+Test features in binarypp.vm.ir
+"""
+
+from argparse import Namespace
+
+import binarypp.vm.ir as ir
+import binarypp.vm.loader as loader
+from binarypp.types import Instruction
+from binarypp.vm import VirtualMachine
+from binarypp.vm.memory import Memory
+from binarypp.vm.opcodes import *
+from binarypp.vm.stack import Stack
+
+# MEMORY[1] = MEMORY[1] + 1 until it is 5, leaving MEMORY[1] * 2 on the stack
+LOOP = [
+    Instruction(MAKE_MARKER, [1]),
+    Instruction(LOAD_MEMORY, [1]),
+    Instruction(PUSH_STACK, [1]),
+    Instruction(BINARY_ADD),
+    Instruction(STORE_MEMORY, [1]),
+    Instruction(LOAD_MEMORY, [1]),
+    Instruction(PUSH_STACK, [5]),
+    Instruction(LESS_THAN),
+    Instruction(IF_RUN_NEXT, [1]),
+    Instruction(GOTO_MARKER, [1]),
+    Instruction(LOAD_MEMORY, [1]),
+    Instruction(DUP_TOP),
+    Instruction(BINARY_ADD),
+]
+
+
+def test_translate():
+    blocks = ir.compile_stream(
+        [
+            Instruction(PUSH_STACK, [2]),
+            Instruction(ROT_TWO),
+            Instruction(BINARY_SUBTRACT),
+            Instruction(DUP_TOP),
+            Instruction(STORE_MEMORY, [1]),
+            Instruction(LOAD_MEMORY, [1]),
+        ]
+    )
+
+    assert len(blocks) == 1
+    # The loaded value is taken from the register that was stored
+    assert blocks[0].ops == [
+        (ir.CONST, 0, 2),
+        (ir.POP, 1),
+        (ir.BINARY, 2, ir.BINARY_FUNCTIONS[BINARY_SUBTRACT], 0, 1),
+        (ir.STORE, 1, 2),
+        (ir.PUSH, 2),
+        (ir.PUSH, 2),
+    ]
+
+    memory = Memory()
+    stack = Stack()
+    stack.push(7)
+    assert blocks[0].run(memory, stack) == 5
+    assert memory[1] == -5
+    assert stack.stack == [-5, -5]
+
+
+def test_branch():
+    blocks = ir.compile_stream(
+        [
+            Instruction(PUSH_STACK, [1]),
+            Instruction(PUSH_STACK, [0]),
+            Instruction(POP_JUMP_IF_FALSE, [4]),
+            Instruction(PUSH_STACK, [2]),
+            Instruction(PUSH_STACK, [3]),
+        ]
+    )
+
+    # The condition never goes through the stack
+    assert blocks[0].ops == [(ir.CONST, 0, 1), (ir.CONST, 1, 0), (ir.PUSH, 0)]
+    assert blocks[0].run(Memory(), Stack()) == 4
+
+
+def test_run_with_ir():
+    vm = VirtualMachine("test_file.bin", Namespace(step=None, ir=True))
+    vm.main_loop(LOOP)
+
+    assert any(inst.opcode == EXEC_BLOCK for inst in vm.frames[0].stream)
+    assert vm.frames[0].memory[1] == 5
+    assert vm.stack.stack == [10]
+
+
+def test_dump():
+    blocks = ir.compile_stream(loader.load(LOOP))
+    dump = ir.dump(blocks)
+
+    assert "block 0 [1, 9)" in dump
+    assert "r2 = binary_add r0, r1" in dump
+    assert "MEMORY[1] = r2" in dump
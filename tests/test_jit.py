@@ -0,0 +1,62 @@
+"""
+Test features in binarypp.vm.jit
+"""
+
+from argparse import Namespace
+
+from binarypp.types import Instruction, Marker, Pointer
+from binarypp.vm import VirtualMachine
+from binarypp.vm.opcodes import *
+
+
+def test_hot_loop(run, count_to):
+    vm = run(count_to(200), jit_threshold=10)
+
+    assert len(vm.jit.traces) == 1
+    assert any(inst.opcode == ENTER_TRACE for inst in vm.frames[0].stream)
+    assert vm.frames[0].memory[1] == 200
+    assert vm.stack.stack == [400]
+
+    # The loop is entered once and left once, when the condition fails
+    assert vm.jit.entries == 1
+    assert vm.jit.exits == 1
+
+
+def test_side_exit(run, count_to):
+    interpreted = run(count_to(250, step=7), no_jit=True)
+    compiled = run(count_to(250, step=7), jit_threshold=5)
+
+    # The exit resumes the loop where the interpreter would be
+    assert compiled.frames[0].memory.memory == interpreted.frames[0].memory.memory
+    assert compiled.stack.stack == interpreted.stack.stack == [504]
+    assert list(compiled.jit.traces[0].exits.values()) == [1]
+
+
+def test_below_threshold(run, count_to):
+    vm = run(count_to(5), jit_threshold=10)
+
+    assert vm.jit.traces == []
+    assert vm.stack.stack == [10]
+
+
+def test_no_jit(run, count_to):
+    assert run(count_to(5), no_jit=True).jit is None
+    assert VirtualMachine("test_file.bin", Namespace(step=True)).jit is None
+
+
+def test_with_ir(run, count_to):
+    vm = run(count_to(200), jit_threshold=10, ir=True)
+
+    assert len(vm.jit.traces) == 1
+    assert vm.stack.stack == [400]
+
+
+def test_moved_marker(run, count_to):
+    vm = run(count_to(200), jit_threshold=10)
+    frame = vm.frames[0]
+    back_edge = vm.jit.traces[0].back_edge
+
+    # Moving the marker puts back the jump, which looks the marker up again
+    frame.set_marker(1, Marker(Pointer(0, 5)))
+    assert frame.stream[back_edge].opcode == GOTO_MARKER
+    assert frame.stream[back_edge].opargs == [1]
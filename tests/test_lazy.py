@@ -0,0 +1,78 @@
+"""
+Test features in binarypp.vm.lazy
+"""
+
+import io
+from argparse import Namespace
+
+import pytest
+
+from binarypp.vm import VirtualMachine
+from binarypp.vm.opcodes import *
+
+
+def test_forward_marker(run, write_source, tmp_path):
+    path = write_source(
+        tmp_path / "program.raw",
+        [
+            PUSH_STACK, 97,
+            WRITE_TO, 0,
+            GOTO_MARKER, 1,
+            PUSH_STACK, 98,
+            WRITE_TO, 0,
+            MAKE_MARKER, 1,
+            PUSH_STACK, 99,
+            WRITE_TO, 0,
+        ],
+    )  # fmt: skip
+    vm = run(path, lazy=True)
+
+    assert vm.output == "ac"
+    assert vm.frames[0].pending is None
+    assert vm.frames[0].markers[1].inst == 5
+
+
+def test_runs_before_parsing(monkeypatch, write_source, tmp_path):
+    # The undefined instruction at the end is only parsed once it is reached
+    path = write_source(tmp_path / "program.raw", [PUSH_STACK, 97, WRITE_TO, 0, 255])
+
+    with pytest.raises(SystemExit):
+        vm = VirtualMachine(path, Namespace(step=None, lazy=True))
+        monkeypatch.setattr("binarypp.vm.vm.stdout", io.StringIO())
+        vm.load_file(0, path)
+        assert len(vm.frames[0].stream) == 0
+        vm.main_loop()
+
+    assert vm.frames[0].stream[1].opcode == WRITE_TO
+
+
+def test_forwarded_args(run, write_source, tmp_path):
+    path = write_source(
+        tmp_path / "program.raw",
+        [
+            MAKE_MARKER, 1,
+            LOAD_MEMORY, 1,
+            PUSH_STACK, 1,
+            BINARY_ADD,
+            DUP_TOP,
+            STORE_MEMORY, 1,
+            PUSH_STACK, 5,
+            LESS_THAN,
+            IF_RUN_NEXT, 3,
+            PUSH_STACK, 1,
+            FORWARD_ARGS,
+            GOTO_MARKER,
+            LOAD_MEMORY, 1,
+            PUSH_STACK, 48,
+            BINARY_ADD,
+            WRITE_TO, 0,
+        ],
+    )  # fmt: skip
+    vm = run(path, lazy=True, int_width=8)
+
+    assert vm.output == "5"
+    assert vm.frames[0].stream[10].opcode == GOTO_MARKER_DYN
+    assert vm.frames[0].stream[3].opcode == WRAP_ARITHMETIC
+
+    # The same as when it is loaded up front
+    assert run(path, int_width=8).output == "5"
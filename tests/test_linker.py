@@ -0,0 +1,75 @@
+"""
+Test features in binarypp.linker
+"""
+
+import pytest
+
+import binarypp.linker as linker
+import binarypp.objfile as objfile
+from binarypp.vm.opcodes import *
+
+
+def link_and_run(run, tmp_path):
+    image = linker.link(str(tmp_path / "main.raw"))
+    (tmp_path / "main.bin").write_bytes(image)
+
+    # Linked programs don't need their modules any more
+    (tmp_path / "module.raw").unlink()
+
+    return run(str(tmp_path / "main.bin"))
+
+
+@pytest.fixture
+def main_source(write_source, tmp_path):
+    write_source(
+        tmp_path / "main.raw",
+        [PUSH_STRING_STACK, *map(ord, "module.raw"), 0]
+        + [IMPORT_MODULE, 1]
+        + [GOTO_MODULE, 1, 1]
+        + [PUSH_STACK_MODULE, 1, 2],
+    )
+
+
+def test_link_resolves_modules(main_source, write_source, run, tmp_path):
+    write_source(
+        tmp_path / "module.raw",
+        [SKIP_NEXT, 3, MAKE_MARKER, 1, PUSH_STACK, 7, GOTO_MARKER, 0]
+        + [PUSH_STACK, 9, STORE_MEMORY, 2],
+    )
+
+    vm = link_and_run(run, tmp_path)
+    assert vm.stack.stack == [7, 9]
+
+    obj = objfile.ObjectFile(str(tmp_path / "main.bin"))
+    insts = obj.instructions()
+    assert insts[1].opcode == IMPORT_LINKED
+    assert insts[1].opargs == [1, 0]
+    assert insts[2].opcode == JUMP_MODULE
+    assert insts[2].opargs == [1, 1]
+    assert insts[3].opcode == PUSH_STACK
+    assert insts[3].opargs == [9]
+    assert obj.modules()[0][1].memory() == [0, 0, 9]
+
+
+def test_link_runs_impure_modules(main_source, write_source, run, tmp_path):
+    write_source(
+        tmp_path / "module.raw",
+        [SKIP_NEXT, 5, MAKE_MARKER, 1, PUSH_STACK, 7, STORE_MEMORY, 2]
+        + [PUSH_STACK, 7, GOTO_MARKER, 0]
+        + [PUSH_STACK, 65, WRITE_TO, 0, PUSH_STACK, 9, STORE_MEMORY, 2],
+    )
+
+    vm = link_and_run(run, tmp_path)
+    assert vm.stack.stack == [7, 7]
+    assert vm.output == "A"
+
+    # The module writes to stdout, so it is only initialized when run
+    obj = objfile.ObjectFile(str(tmp_path / "main.bin"))
+    assert obj.modules()[0][1].memory() is None
+    assert obj.instructions()[3].opcode == PUSH_STACK_MODULE
+
+
+def test_link_missing_module(main_source, tmp_path):
+
+    with pytest.raises(SystemExit):
+        linker.link(str(tmp_path / "main.raw"))
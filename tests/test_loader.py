@@ -0,0 +1,139 @@
+"""
+Test features in binarypp.vm.loader
+"""
+
+import binarypp.vm.loader as loader
+from binarypp.types import Instruction
+from binarypp.vm.opcodes import *
+
+
+def test_load_copies_stream():
+    stream = [Instruction(MAKE_MARKER, [1]), Instruction(GOTO_MARKER, [1])]
+    loaded = loader.load(stream)
+
+    assert loaded is not stream
+    assert stream[1].opcode == GOTO_MARKER
+
+
+def test_resolve_markers():
+    stream = [
+        Instruction(GOTO_MARKER, [1]),
+        Instruction(MAKE_MARKER, [1]),
+        Instruction(GOTO_MARKER, [0]),
+        Instruction(MAKE_MARKER, [2]),
+        Instruction(MAKE_MARKER, [2]),
+        Instruction(GOTO_MARKER, [2]),
+        Instruction(GOTO_MARKER, [3]),
+    ]
+    loader.resolve_markers(stream)
+
+    assert stream[0].opcode == JUMP_MARKER
+    assert stream[0].opargs == [1, 1]
+    # Returning to the last goto has no fixed target
+    assert stream[2].opcode == GOTO_MARKER
+    # Markers made more than once, or never, are looked up while running
+    assert stream[5].opcode == GOTO_MARKER
+    assert stream[6].opcode == GOTO_MARKER
+
+
+def test_resolve_branches():
+    stream = [
+        Instruction(PUSH_STACK, [0]),
+        Instruction(IF_RUN_NEXT, [2]),
+        Instruction(SKIP_NEXT, [1]),
+        Instruction(GO_BACK, [2]),
+        Instruction(IF_RUN_NEXT, []),
+    ]
+    loader.resolve_branches(stream)
+
+    assert stream[1].opcode == POP_JUMP_IF_FALSE
+    assert stream[1].opargs == [3]
+    assert stream[2].opcode == JUMP_ABSOLUTE
+    assert stream[2].opargs == [3]
+    assert stream[3].opcode == JUMP_ABSOLUTE
+    assert stream[3].opargs == [0]
+    # The offset is forwarded from the stack
+    assert stream[4].opcode == IF_RUN_NEXT
+
+
+def test_merge_forwarded_args():
+    stream = [
+        Instruction(FORWARD_ARGS),
+        Instruction(LOAD_MEMORY),
+        Instruction(FORWARD_ARGS),
+        Instruction(BINARY_ADD),
+        Instruction(FORWARD_ARGS),
+    ]
+    loader.merge_forwarded_args(stream)
+
+    assert stream[0].opcode == LOAD_MEMORY_DYN
+    # The forwarded instruction keeps its place
+    assert stream[1].opcode == LOAD_MEMORY
+    assert stream[2].opcode == FORWARD_ARGS
+    assert stream[4].opcode == FORWARD_ARGS
+
+
+def test_eliminate_dead_code():
+    stream = [
+        Instruction(MAKE_MARKER, [1]),
+        Instruction(JUMP_ABSOLUTE, [2]),
+        Instruction(PUSH_STACK, [1]),
+        Instruction(PUSH_STACK, [2]),
+        Instruction(MAKE_MARKER, [2]),
+        Instruction(POP_JUMP_IF_FALSE, [6]),
+        Instruction(JUMP_MARKER, [0, 1]),
+        Instruction(PUSH_STACK, [3]),
+    ]
+
+    # Markers can be jumped to by other modules
+    loaded = loader.eliminate_dead_code(stream)
+    assert [inst.opcode for inst in loaded] == [
+        MAKE_MARKER,
+        JUMP_ABSOLUTE,
+        PUSH_STACK,
+        MAKE_MARKER,
+        POP_JUMP_IF_FALSE,
+        JUMP_MARKER,
+        PUSH_STACK,
+    ]
+    assert loaded[1].opargs == [1]
+    assert loaded[4].opargs == [5]
+    assert loaded[5].opargs == [0, 1]
+
+    # Marker 2 is never jumped to
+    loaded = loader.eliminate_dead_code(stream, exported=False)
+    assert [inst.opcode for inst in loaded] == [
+        MAKE_MARKER,
+        JUMP_ABSOLUTE,
+        PUSH_STACK,
+        POP_JUMP_IF_FALSE,
+        JUMP_MARKER,
+        PUSH_STACK,
+    ]
+    assert loaded[1].opargs == [1]
+    assert loaded[3].opargs == [4]
+
+
+def test_eliminate_dead_code_dynamic():
+    stream = [
+        Instruction(PUSH_STACK, [1]),
+        Instruction(SKIP_NEXT_DYN),
+        Instruction(SKIP_NEXT),
+        Instruction(JUMP_ABSOLUTE, [4]),
+        Instruction(PUSH_STACK, [1]),
+    ]
+
+    # The offset of SKIP_NEXT_DYN is only known while running
+    assert loader.eliminate_dead_code(stream) is stream
+
+
+def test_max_static_address():
+    stream = [
+        Instruction(FORWARD_ARGS),
+        Instruction(STORE_MEMORY),
+        Instruction(STORE_MEMORY, [7]),
+        Instruction(LOAD_MEMORY, [3]),
+        Instruction(PUSH_STACK, [200]),
+    ]
+    assert loader.max_static_address(stream) == 7
+    assert loader.max_static_address(stream[:2]) == 0
@@ -2,6 +2,8 @@
 Test features in binarypp.vm.memory
 """
 
+import pytest
+
 from binarypp.vm.memory import Memory
 
 
@@ -23,3 +25,51 @@ class TestMemory:
     def test__expand_memory_util(self):
         self.memory._expand_memory_until(10)
         assert self.memory.memory == [0, 0, "Hello, world!", 0, 0, 0, 0, 0, 0, 0, 0]
+
+    def test_reserve(self):
+        memory = Memory(limit=8)
+        memory.reserve(5)
+        assert memory.memory == [0] * 6
+
+        # Memory isn't reserved past its limit
+        memory.reserve(8)
+        assert memory.size == 6
+
+    def test_regions(self):
+        memory = Memory()
+        memory.fill(1, 4, 7)
+        assert memory.memory == [0, 7, 7, 7, 7]
+
+        memory.set_region(3, [1, 2, 3])
+        assert memory.region(2, 4) == [7, 1, 2, 3]
+
+        # Overlapping copies see the cells as they were before
+        memory.copy(2, 1, 4)
+        assert memory.memory == [0, 7, 7, 7, 1, 2]
+
+    def test_fill_limit(self):
+        # Past the limit, filling fails before the cells are allocated
+        memory = Memory(limit=100)
+        with pytest.raises(SystemExit):
+            memory.fill(1, 1 << 60, 7)
+        assert memory.size == 1
+
+    def test_typed(self):
+        memory = Memory("b")
+        memory[3] = 127
+        memory.fill(1, 2, 7)
+        assert memory.memory.tolist() == [0, 7, 7, 127]
+
+        # Values that don't fit the type turn the cells into a list
+        memory[2] = "Hello, world!"
+        assert memory.memory == [0, 7, "Hello, world!", 127]
+
+    def test_typed_booleans(self):
+        memory = Memory("b")
+        memory[1] = True
+        assert memory[1] is True
+
+        memory = Memory("b")
+        memory.set_region(1, [7, False])
+        assert memory.region(1, 2) == [7, False]
+        assert memory[2] is False
@@ -0,0 +1,63 @@
+"""
+Test features in binarypp.objfile
+"""
+
+from argparse import Namespace
+
+import binarypp.objfile as objfile
+import binarypp.parser as parser
+from binarypp.types import Instruction
+from binarypp.vm import VirtualMachine
+from binarypp.vm.opcodes import *
+
+
+def compile_stream(path, stream):
+    vm = VirtualMachine(str(path), Namespace(step=None))
+    vm.load_stream(0, stream)
+    objfile.write(str(path), vm.frames[0])
+    return objfile.ObjectFile(str(path))
+
+
+def test_write_and_read(tmp_path):
+    obj = compile_stream(
+        tmp_path / "program.bin",
+        [
+            Instruction(MAKE_MARKER, [1]),
+            Instruction(PUSH_STRING_STACK, [104, 105]),
+            Instruction(PUSH_LONG_STACK, [5, 57]),
+            Instruction(PUSH_STRING_STACK, [109, 46, 98, 105, 110]),
+            Instruction(IMPORT_MODULE, [2]),
+            Instruction(GOTO_MARKER, [1]),
+        ],
+    )
+
+    assert parser.is_object_file(obj.path)
+    assert obj.size == 6
+    assert obj.markers() == {1: 0}
+    assert obj.jumps() == [(1, 5)]
+    assert obj.imports() == [(4, 2, "m.bin")]
+
+    insts = obj.instructions()
+    assert insts[1].opcode == PUSH_STRING_STACK
+    assert insts[1].opargs == [104, 105]
+    assert insts[2].opargs == [5, 57]
+    assert insts[5].opcode == JUMP_MARKER
+    assert insts[5].opargs == [0, 1]
+
+
+def test_decode_on_demand(tmp_path):
+    stream = [Instruction(PUSH_STACK, [1])]
+    stream += [Instruction(SKIP_NEXT, [objfile.PAGE_SIZE * 2 + 1])]
+    # The marker keeps the code it skips over from being removed as dead code
+    stream += [Instruction(MAKE_MARKER, [1])]
+    stream += [Instruction(PUSH_STACK, [2])] * objfile.PAGE_SIZE * 2
+    stream += [Instruction(PUSH_STACK, [3])]
+    compile_stream(tmp_path / "program.bin", stream)
+
+    vm = VirtualMachine(str(tmp_path / "program.bin"), Namespace(step=None))
+    vm.load_file(0, str(tmp_path / "program.bin"))
+    vm.main_loop()
+
+    assert vm.stack.stack == [1, 3]
+    # The page that was jumped over is never decoded
+    assert vm.frames[0].stream[objfile.PAGE_SIZE] is objfile.PAGE_STUB
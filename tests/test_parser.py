@@ -1,3 +1,5 @@
+import io
+
 import binarypp.parser as parser
 from binarypp.vm.opcodes import *
 
@@ -21,3 +23,30 @@ def test_parser():
     assert insts[0].opargs == [48]
     assert insts[1].opcode == WRITE_TO
     assert insts[1].opargs == [0]
+
+
+def test_parser_forward_args():
+    # FORWARD_ARGS, LOAD_MEMORY
+    insts = parser.parse("00000000 10010000 00000010")
+
+    assert insts[0].opcode == FORWARD_ARGS
+    assert insts[1].opcode == LOAD_MEMORY
+    assert insts[1].opargs == []
+
+    # PUSH_STACK 10010000, LOAD_MEMORY 1
+    insts = parser.parse("00000000 00000100 10010000 00000010 00000001")
+
+    assert insts[1].opcode == LOAD_MEMORY
+    assert insts[1].opargs == [1]
+
+
+def test_read_codes(monkeypatch):
+    # Words cut off by the end of a chunk are put back together
+    monkeypatch.setattr(parser, "CHUNK_SIZE", 5)
+
+    for raw_code in ("\n00000000 00000100 00110000\n00001010 00000000", "\x04\x30"):
+        codes = list(parser.read_codes(io.StringIO(raw_code)))
+        tokens = parser.tokenize(iter(codes))
+        assert [(inst.opcode, inst.opargs) for inst in tokens] == [
+            (inst.opcode, inst.opargs) for inst in parser.parse(raw_code)
+        ]
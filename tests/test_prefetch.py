@@ -0,0 +1,109 @@
+"""
+Test features in binarypp.vm.prefetch
+"""
+
+import os
+from argparse import Namespace
+
+import pytest
+
+import binarypp.vm.prefetch as prefetch
+from binarypp.types import Instruction
+from binarypp.vm import VirtualMachine
+from binarypp.vm.opcodes import *
+
+
+def importing(path, frame):
+    return [PUSH_STRING_STACK, *map(ord, path), 0, IMPORT_MODULE, frame]
+
+
+@pytest.fixture
+def modules(write_source, tmp_path):
+    # main imports lib/first.raw, which imports second.raw next to it
+    (tmp_path / "lib").mkdir()
+    write_source(
+        tmp_path / "main.raw",
+        importing("lib/first.raw", 1) + [PUSH_STACK_MODULE, 1, 1],
+    )
+    write_source(
+        tmp_path / "lib" / "first.raw",
+        importing("second.raw", 1)
+        + [PUSH_STACK_MODULE, 1, 1, PUSH_STACK, 1, BINARY_ADD, STORE_MEMORY, 1],
+    )
+    write_source(tmp_path / "lib" / "second.raw", [PUSH_STACK, 5, STORE_MEMORY, 1])
+    return tmp_path
+
+
+def test_static_imports():
+    stream = [
+        Instruction(PUSH_STRING_STACK, [ord(c) for c in "a.raw"]),
+        Instruction(IMPORT_MODULE, [1]),
+        Instruction(READ_FROM, [0]),
+        Instruction(IMPORT_MODULE, [2]),
+    ]
+    assert prefetch.static_imports(stream) == ["a.raw"]
+
+
+def test_prefetch(modules):
+    prefetcher = prefetch.Prefetcher()
+    prefetcher.prefetch(str(modules / "main.raw"), ["lib/first.raw"])
+
+    first = prefetcher.take(os.path.join(str(modules), "lib", "first.raw"))
+    assert first is not None
+    assert first[0].opcode == PUSH_STRING_STACK
+
+    # Modules are prefetched by the module that imports them
+    second = prefetcher.take(os.path.join(str(modules), "lib", "second.raw"))
+    assert second is not None
+    assert second[0].opcode == PUSH_STACK
+    assert prefetcher.take(os.path.join(str(modules), "lib", "first.raw")) is None
+    prefetcher.close()
+
+
+@pytest.mark.parametrize("no_prefetch", [False, True])
+def test_run(run, modules, no_prefetch):
+    vm = run(str(modules / "main.raw"), no_prefetch=no_prefetch)
+    assert vm.stack.stack == [6]
+    assert vm.stats.imports == 2
+    assert (vm.prefetcher is None) == no_prefetch
+
+
+def test_changed(write_source, modules):
+    prefetcher = prefetch.Prefetcher()
+    prefetcher.prefetch(str(modules / "main.raw"), ["lib/second.raw"])
+    path = os.path.join(str(modules), "lib", "second.raw")
+    prefetcher.modules[os.path.normpath(path)].result()
+
+    write_source(
+        modules / "lib" / "second.raw", [PUSH_STACK, 10, DUP_TOP, STORE_MEMORY, 1]
+    )
+    assert prefetcher.take(path) is None
+    prefetcher.close()
+
+
+def test_errors_at_import(run, write_source, modules, capfd):
+    write_source(modules / "lib" / "second.raw", [PUSH_STACK])
+
+    with pytest.raises(SystemExit):
+        run(str(modules / "main.raw"))
+
+    # The error is printed once, by the import that reads the module again
+    _, err = capfd.readouterr()
+    assert err.count("missing an argument") == 1
+
+
+def test_parse_errors(modules):
+    # Parsing an empty module fails with an IndexError, which is left to the
+    # import to run into
+    (modules / "lib" / "second.raw").write_text("")
+    prefetcher = prefetch.Prefetcher()
+    prefetcher.prefetch(str(modules / "main.raw"), ["lib/second.raw"])
+    assert prefetcher.take(os.path.join(str(modules), "lib", "second.raw")) is None
+    prefetcher.close()
+
+
+def test_loading(modules):
+    # Loading a program, as the build tools do, doesn't start the threads
+    vm = VirtualMachine(str(modules / "main.raw"), Namespace(step=None))
+    vm.load_file(0, str(modules / "main.raw"))
+    assert vm.prefetcher is None
@@ -0,0 +1,76 @@
+"""
+Test features in binarypp.vm.recording
+"""
+
+import pytest
+
+from binarypp.types import Instruction
+from binarypp.vm.opcodes import *
+
+
+def program(path):
+    # Reads a line from stdin, a char and a word from the file, and writes
+    # them out in that order
+    return [
+        Instruction(PUSH_STACK, [10]),
+        Instruction(READ_FROM, [0]),
+        Instruction(WRITE_TO, [0]),
+        Instruction(PUSH_STRING_STACK, [ord(c) for c in path]),
+        Instruction(OPEN_FILE, [0]),
+        Instruction(STORE_MEMORY, [1]),
+        Instruction(READ_CHAR_FROM, [1]),
+        Instruction(WRITE_TO, [0]),
+        Instruction(PUSH_STACK, [32]),
+        Instruction(READ_FROM, [1]),
+        Instruction(WRITE_TO, [0]),
+    ]
+
+
+def test_replay(run, tmp_path):
+    data = tmp_path / "data.txt"
+    data.write_text("xhello world")
+    recording = str(tmp_path / "input.bppi")
+    stream = program(str(data))
+
+    output = run(list(stream), stdin="line\nrest", record=recording).output
+    assert output == "linexhello"
+
+    # Nothing is read but the recording
+    data.unlink()
+    output = run(list(stream), replay=recording).output
+    assert output == "linexhello"
+
+
+def test_replay_writes(run, tmp_path):
+    recording = str(tmp_path / "input.bppi")
+    run([], record=recording)
+
+    # Files opened to be written still are
+    path = [ord(c) for c in str(tmp_path / "out.txt")]
+    stream = [
+        Instruction(PUSH_STRING_STACK, path),
+        Instruction(OPEN_FILE, [0b0100]),
+        Instruction(STORE_MEMORY, [1]),
+        Instruction(PUSH_STRING_STACK, [ord("a")]),
+        Instruction(WRITE_TO, [1]),
+    ]
+    run(stream, replay=recording)
+    assert (tmp_path / "out.txt").read_text() == "a"
+
+
+def test_not_a_recording(run, tmp_path):
+    path = tmp_path / "input.bppi"
+    path.write_bytes(b"00000000")
+
+    with pytest.raises(SystemExit):
+        run([], replay=str(path))
+
+
+def test_replay_ends(run, tmp_path):
+    # The replay has less input than the run reads
+    recording = str(tmp_path / "input.bppi")
+    stream = [Instruction(PUSH_STACK, [10]), Instruction(READ_FROM, [0])]
+    run(list(stream), stdin="ab", record=recording)
+
+    stream += [Instruction(WRITE_TO, [0])] + stream + [Instruction(WRITE_TO, [0])]
+    assert run(stream, replay=recording).output == "ab"
@@ -0,0 +1,99 @@
+"""
+Test features in binarypp.repl
+"""
+
+import io
+from argparse import Namespace
+
+import pytest
+
+import binarypp.repl as repl
+from binarypp.vm.opcodes import *
+
+
+def session(monkeypatch, lines, **flags):
+    output = io.StringIO()
+    monkeypatch.setattr("binarypp.vm.vm.stdout", output)
+
+    typed = iter(lines)
+
+    def read(prompt):
+        line = next(typed, None)
+        if line is None:
+            raise EOFError
+        return line
+
+    monkeypatch.setattr("builtins.input", read)
+    shell = repl.Repl(Namespace(step=None, **flags))
+    shell.run()
+    return shell, output.getvalue()
+
+
+def test_encode():
+    assert repl.encode("00000100 00110000") == [PUSH_STACK, 48]
+    assert repl.encode("push_stack 0x30") == [PUSH_STACK, 48]
+    assert repl.encode('PUSH_STRING_STACK "Hi"') == [PUSH_STRING_STACK, 72, 105, 0]
+
+    with pytest.raises(SystemExit):
+        repl.encode("PUSH_STACK 256")
+    with pytest.raises(SystemExit):
+        repl.encode("JUMP_MARKER 1 1")
+
+
+def test_keeps_state(monkeypatch):
+    shell, output = session(
+        monkeypatch,
+        [
+            "PUSH_STACK 5",
+            "STORE_MEMORY 1",
+            "LOAD_MEMORY 0",  # Fails, and the session goes on
+            "LOAD_MEMORY 1",
+            "PUSH_STACK 48",
+            "BINARY_ADD",
+            "WRITE_TO 0",
+            "PUSH_STACK 0",
+        ],
+    )
+
+    assert output == "5"
+    assert shell.vm.stack.stack == [0]
+    assert shell.vm.frames[0].memory[1] == 5
+
+
+def test_error_drops_line(monkeypatch):
+    # POP_STACK fails on the empty stack, and the PUSH_STACK after it is dropped
+    shell, _ = session(monkeypatch, ["00000001 00000100 01000001", "PUSH_STACK 1"])
+    assert shell.vm.stack.stack == [1]
+
+
+def test_closes(monkeypatch, tmp_path):
+    # The recording is written when the session ends
+    recording = tmp_path / "input.bppi"
+    session(monkeypatch, ["PUSH_STACK 1"], record=str(recording))
+    assert recording.exists()
+
+
+def test_forward_marker(monkeypatch):
+    # The jump waits for the marker to be typed in
+    _, output = session(
+        monkeypatch,
+        [
+            "GOTO_MARKER 1",
+            "PUSH_STACK 97",
+            "WRITE_TO 0",
+            "MAKE_MARKER 1",
+            "PUSH_STACK 1",
+            "FORWARD_ARGS",
+            "PUSH_STACK",
+            "PUSH_STACK 48",
+            "BINARY_ADD",
+            "WRITE_TO 0",
+        ],
+    )
+
+    assert output == "1"
+
+
+def test_quit(monkeypatch):
+    shell, _ = session(monkeypatch, ["PUSH_STACK 1", ":quit", "PUSH_STACK 2"])
+    assert shell.vm.stack.stack == [1]
@@ -0,0 +1,179 @@
+"""
+Test features in binarypp.server
+"""
+
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+import pytest
+
+from binarypp.vm.opcodes import *
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "fork"), reason="The daemon needs fork and Unix sockets"
+)
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    path = str(tmp_path / "binarypp.sock")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "binarypp", "--serve", "--socket", path],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            if os.path.exists(path):
+                break
+            time.sleep(0.05)
+        yield path
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def client(path, program, data=""):
+    return subprocess.run(
+        [sys.executable, "-m", "binarypp", "--client", "--socket", path, program],
+        input=data,
+        capture_output=True,
+        text=True,
+        timeout=30,
+    )
+
+
+def test_requests(daemon):
+    hello = os.path.join(EXAMPLES, "hello_world.raw")
+    cat = os.path.join(EXAMPLES, "cat.raw")
+
+    # The second run uses the parsed program
+    for _ in range(2):
+        result = client(daemon, hello)
+        assert result.returncode == 0
+        assert result.stdout == "Hello, world!\n"
+
+    result = client(daemon, cat, "hello there\n")
+    assert result.returncode == 0
+    assert result.stdout.startswith("hello there")
+
+
+def test_errors(daemon, tmp_path):
+    program = tmp_path / "error.raw"
+    program.write_text("10010100 00000000")  # Not a whole instruction
+
+    result = client(daemon, str(program))
+    assert result.returncode == 1
+    assert result.stderr
+
+
+def bad_request(path, data, fds=(0, 1, 2)):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        socket.send_fds(sock, [data], list(fds))
+        sock.shutdown(socket.SHUT_WR)
+        return sock.recv(4)
+
+
+def test_bad_requests(daemon):
+    def framed(data):
+        return struct.pack("<I", len(data)) + data
+
+    # Each is answered with an error status, and the daemon keeps serving
+    assert bad_request(daemon, framed(b"{not json")) == struct.pack("<i", 1)
+    assert bad_request(daemon, framed(b'{"cwd": "/"}')) == struct.pack("<i", 1)
+    assert bad_request(daemon, framed(b"[]"), fds=[0]) == struct.pack("<i", 1)
+    # The client goes away in the middle of the request
+    assert bad_request(daemon, struct.pack("<I", 100) + b"{") == struct.pack("<i", 1)
+    request = json.dumps({"cwd": "/", "file": "x.raw", "flags": {}}).encode()
+    assert bad_request(daemon, framed(request)[:-2]) == struct.pack("<i", 1)
+
+    result = client(daemon, os.path.join(EXAMPLES, "hello_world.raw"))
+    assert result.returncode == 0
+    assert result.stdout == "Hello, world!\n"
+
+
+def test_cache(tmp_path):
+    import binarypp.server as server
+
+    first = tmp_path / "first.raw"
+    second = tmp_path / "second.raw"
+    first.write_text("00000000 00000100 00000001")
+    second.write_text("00000000 00000100 00000010")
+
+    daemon = server.Server(str(tmp_path / "binarypp.sock"), cache_size=1)
+    stream = daemon.program(str(first))
+    assert daemon.program(str(first)) is stream
+
+    # The least recently used program is dropped
+    daemon.program(str(second))
+    assert list(daemon.programs) == [str(second)]
+
+    # A changed file replaces its old version
+    second.write_text("00000000 00000100 00000011 00000100 00000011")
+    assert daemon.program(str(second))[0].opargs == [3]
+    assert len(daemon.programs) == 1
+
+
+def test_no_server(tmp_path):
+    result = client(str(tmp_path / "missing.sock"), os.path.join(EXAMPLES, "cat.raw"))
+    assert result.returncode == 1
+    assert "--serve" in result.stderr
+
+
+def test_client_killed(daemon, write_source, tmp_path):
+    # Echoes two lines
+    echo = [PUSH_STACK, 10, READ_FROM, 0, WRITE_TO, 0] * 2
+    program = write_source(tmp_path / "echo.raw", echo)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "binarypp", "--client", "--socket", daemon, program],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    process.stdin.write(b"first\n")
+    process.stdin.flush()
+    assert process.stdout.read(5) == b"first"
+
+    # The run ends after its client is gone, and can't report its status
+    process.kill()
+    process.wait(timeout=10)
+    process.stdin.write(b"second\n")
+    process.stdin.close()
+    assert process.stdout.read(6) == b"second"
+    process.stdout.close()
+
+    result = client(daemon, os.path.join(EXAMPLES, "hello_world.raw"))
+    assert result.returncode == 0
+    assert result.stdout == "Hello, world!\n"
+
+
+def test_default_socket(tmp_path, monkeypatch):
+    import binarypp.client as client
+
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    path = client.default_socket()
+    assert path == str(tmp_path / "binarypp" / "binarypp.sock")
+    assert os.stat(tmp_path / "binarypp").st_mode & 0o777 == 0o700
+
+    # A directory others can get into isn't used
+    os.chmod(tmp_path / "binarypp", 0o755)
+    with pytest.raises(SystemExit):
+        client.default_socket()
+
+
+def test_socket_owner(tmp_path, monkeypatch):
+    import binarypp.client as client
+
+    path = tmp_path / "binarypp.sock"
+    path.touch()
+    client.check_owner(str(path))
+
+    monkeypatch.setattr("os.getuid", lambda: os.stat(path).st_uid + 1)
+    with pytest.raises(SystemExit):
+        client.check_owner(str(path))
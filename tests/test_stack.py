@@ -2,7 +2,9 @@
 Test features in binarypp.vm.stack
 """
 
-from binarypp.vm.stack import Stack
+import pytest
+
+from binarypp.vm.stack import LimitedStack, Stack
 
 
 class TestStack:
@@ -18,3 +20,32 @@ class TestStack:
 
     def test_pop(self):
         assert self.stack.pop() == 1
+
+
+def test_typed():
+    stack = Stack("q")
+    stack.push(1)
+    stack.push(2)
+    assert stack.stack.tolist() == [1, 2]
+
+    # Values that don't fit the type turn the stack into a list
+    stack.push(2**64)
+    assert stack.stack == [1, 2, 2**64]
+    assert stack.pop() == 2**64
+    stack.push("Hello, world!")
+    assert stack.stack == [1, 2, "Hello, world!"]
+
+    # Booleans stay booleans
+    stack = Stack("q")
+    stack.push(True)
+    assert stack.pop() is True
+
+
+def test_limited_typed():
+    stack = LimitedStack(2, "q")
+    stack.push(1)
+    stack.push(1.5)
+    assert stack.stack == [1, 1.5]
+
+    with pytest.raises(SystemExit):
+        stack.push(2)
@@ -0,0 +1,79 @@
+"""
+Test what starting binarypp imports
+"""
+
+import os
+import subprocess
+import sys
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+# Modules only some options need
+OPTIONAL = {
+    "json",
+    "socket",
+    "concurrent.futures",
+    "binarypp.objfile",
+    "binarypp.vm.fixedwidth",
+    "binarypp.vm.ir",
+    "binarypp.vm.lazy",
+    "binarypp.vm.prefetch",
+    "binarypp.vm.recording",
+    "binarypp.vm.traces",
+    "binarypp.linker",
+    "binarypp.build",
+    "binarypp.client",
+    "binarypp.server",
+    "binarypp.repl",
+    "binarypp.tracelog",
+    "binarypp.disassembler",
+    "binarypp.conformance",
+}
+
+# Microseconds the modules of binarypp may take to import. They took about
+# 16,000 when this was set, and the rest is room for slower machines.
+BUDGET = 30_000
+
+
+def imports(*args):
+    """
+    Returns the modules imported by a run of Python and how long each took
+    on its own.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, _, name = line[len("import time:") :].split("|")
+        if own.strip().isdigit():
+            times[name.strip()] = int(own)
+    return times
+
+
+def test_run_imports():
+    times = imports("-m", "binarypp", os.path.join(EXAMPLES, "hello_world.raw"))
+
+    assert "binarypp.vm.vm" in times
+    assert not OPTIONAL & set(times)
+    assert sum(t for name, t in times.items() if name.startswith("binarypp")) < BUDGET
+
+
+def test_cli_imports():
+    # The VM is only imported once a program runs
+    times = imports("-c", "import binarypp.cli, binarypp.vm.opcodes")
+
+    assert "binarypp.vm.vm" not in times
+    assert not OPTIONAL & set(times)
+
+
+def test_loop_imports():
+    # The JIT's tracing is only imported once a loop gets hot
+    times = imports("-m", "binarypp", os.path.join(EXAMPLES, "rule110.raw"))
+    assert "binarypp.vm.traces" in times
@@ -0,0 +1,79 @@
+"""
+Test features in binarypp.vm.stats
+"""
+
+import json
+import os
+
+from binarypp.types import Instruction
+from binarypp.vm.opcodes import *
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+# Writes "a" three times
+LOOP = [
+    Instruction(MAKE_MARKER, [1]),
+    Instruction(PUSH_STACK, [97]),
+    Instruction(WRITE_TO, [0]),
+    Instruction(LOAD_MEMORY, [1]),
+    Instruction(PUSH_STACK, [1]),
+    Instruction(BINARY_ADD),
+    Instruction(DUP_TOP),
+    Instruction(STORE_MEMORY, [1]),
+    Instruction(PUSH_STACK, [3]),
+    Instruction(LESS_THAN),
+    Instruction(IF_RUN_NEXT, [1]),
+    Instruction(GOTO_MARKER, [1]),
+]
+
+
+def test_counters(run):
+    stats = run(list(LOOP), no_jit=True, stats=True).stats
+
+    assert stats.instructions == 3 * 11
+    # Two GOTO_MARKERs and the IF_RUN_NEXT skipping the last one
+    assert stats.jumps == 3
+    assert stats.max_stack_depth == 2
+    assert stats.bytes_written == 3
+    assert stats.memory == {"test_file.bin": 2}
+    assert stats.times["execution"] > 0
+
+
+def test_jit(run):
+    stream = [
+        Instruction(MAKE_MARKER, [1]),
+        Instruction(LOAD_MEMORY, [1]),
+        Instruction(PUSH_STACK, [1]),
+        Instruction(BINARY_ADD),
+        Instruction(DUP_TOP),
+        Instruction(STORE_MEMORY, [1]),
+        Instruction(PUSH_STACK, [1000]),
+        Instruction(LESS_THAN),
+        Instruction(IF_RUN_NEXT, [1]),
+        Instruction(GOTO_MARKER, [1]),
+    ]
+    interpreted = run(list(stream), no_jit=True, stats=True).stats
+    compiled = run(list(stream), jit_threshold=10, stats=True).stats
+
+    # Compiled loops count what they ran, like the interpreter does
+    assert compiled.instructions == interpreted.instructions
+    assert compiled.jumps == interpreted.jumps
+
+
+def test_jit_exits(run):
+    # Rule 110's loops are entered many times and left halfway through
+    path = os.path.join(EXAMPLES, "rule110.raw")
+    interpreted = run(path, no_jit=True, stats=True)
+    compiled = run(path, stats=True)
+
+    assert compiled.jit.traces
+    assert compiled.stats.instructions == interpreted.stats.instructions
+    assert compiled.stats.jumps == interpreted.stats.jumps
+
+
+def test_json(run):
+    stats = json.loads(run(list(LOOP), stats=True).stats.to_json())
+
+    assert stats["instructions"] == 33
+    assert stats["instructions_per_second"] > 0
+    assert set(stats["seconds"]) == {"parse", "markers", "execution"}
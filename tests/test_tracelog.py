@@ -0,0 +1,70 @@
+"""
+Test features in binarypp.tracelog
+"""
+
+from argparse import Namespace
+
+import pytest
+
+import binarypp.tracelog as tracelog
+from binarypp.types import Instruction
+from binarypp.vm import VirtualMachine
+from binarypp.vm.opcodes import *
+
+
+def trace(tmp_path, stream, name="trace.bppt", **flags):
+    path = str(tmp_path / name)
+    vm = VirtualMachine("test_file.bin", Namespace(step=None, trace=path, **flags))
+    vm.main_loop(stream)
+    return path, list(tracelog.read(path))
+
+
+@pytest.mark.parametrize("name", ["trace.bppt", "trace.bppt.gz"])
+def test_records(tmp_path, name, count_to):
+    path, records = trace(tmp_path, count_to(3), name, stats=True)
+    vm = VirtualMachine("test_file.bin", Namespace(step=None, stats=True))
+    vm.main_loop(count_to(3))
+
+    assert len(records) == vm.stats.instructions
+    assert [record[1] for record in records[:3]] == [0, 1, 2]
+    assert [record[3] for record in records[:3]] == [0, 1, 1]
+    assert records[3][2:4] == (BINARY_ADD, -1)
+    assert records[-1][1:] == (12, BINARY_ADD, -1, -1)
+
+    # The loader resolves the marker and the condition to jumps
+    jumps = {record[1:] for record in records if record[4] != -1}
+    assert jumps == {(9, JUMP_MARKER, 0, 1), (8, POP_JUMP_IF_FALSE, -1, 10)}
+
+
+def test_summary(tmp_path, count_to):
+    _, records = trace(tmp_path, count_to(5))
+    summary = tracelog.Summary()
+    for record in records:
+        summary.add(record)
+
+    assert summary.records == len(records)
+    assert summary.instructions[0, 1, LOAD_MEMORY] == 5
+    assert summary.loops() == [((0, 9, 1), 4)]
+    assert "Loop iterations:\n             4  0:1 -> 9" in summary.report(10)
+
+
+def test_divergence(tmp_path, count_to):
+    _, three = trace(tmp_path, count_to(3), "three.bppt")
+    _, four = trace(tmp_path, count_to(4), "four.bppt")
+
+    assert tracelog.divergence(iter(three), iter(three)) == "The runs are the same"
+    assert tracelog.divergence(iter(three), iter(four)) == (
+        "The runs diverge after instruction 26 0:8 POP_JUMP_IF_FALSE: "
+        "jump to 10 and no jump"
+    )
+    assert tracelog.divergence(iter(three[:5]), iter(three)) == (
+        "The first run ends after 5 instructions"
+    )
+
+
+def test_not_a_trace(tmp_path):
+    path = tmp_path / "trace.bppt"
+    path.write_bytes(b"00000000")
+
+    with pytest.raises(SystemExit):
+        list(tracelog.read(str(path)))
@@ -30,4 +30,17 @@ def test_fuzzy_search():
     assert utils.fuzzy_search("dog", ["frog", "hog", "top"]) == "hog"
     assert utils.fuzzy_search("hi", ["hill", "pill", "sill"]) == "hill"
     assert utils.fuzzy_search("elephant", ["elegant", "extra", "egg"]) == "elegant"
-    
+
+
+def test_levenshtein_limit():
+    assert utils.levenshtein_distance("hello", "world", 4) == 4
+    assert utils.levenshtein_distance("hello", "world", 2) == 3
+    assert utils.levenshtein_distance("a", "abcdef", 1) == 2
+    assert utils.levenshtein_distance("", "abc") == 3
+
+
+def test_fuzzy_search_many():
+    files = [f"program_{number}.raw" for number in range(20000)]
+    assert utils.fuzzy_search("program_1234.rwa", files) == "program_1234.raw"
+    assert utils.fuzzy_search("same.raw", ["other.raw", "same.raw"]) == "same.raw"
+    assert utils.fuzzy_search("any", []) is None
@@ -2,8 +2,11 @@
 Test features in binarypp.vm.stack
 """
 
+import io
 from argparse import Namespace
 
+import pytest
+
 from binarypp.types import Instruction, Marker
 from binarypp.vm import VirtualMachine
 from binarypp.vm.opcodes import *
@@ -25,9 +28,9 @@ class TestVM:
 
     def test_initialize_markers(self):
         self.vm.initialize_markers(0)
-        assert isinstance(self.vm.frames[0].memory[1], Marker)
-        assert self.vm.frames[0].memory[1].frame == 0
-        assert self.vm.frames[0].memory[1].inst == 1
+        assert isinstance(self.vm.frames[0].markers[1], Marker)
+        assert self.vm.frames[0].markers[1].frame == 0
+        assert self.vm.frames[0].markers[1].inst == 1
 
     def test_next_instruction(self):
         inst = self.vm.next_instruction()
@@ -62,6 +65,253 @@ class TestVM:
         assert self.vm.stack.stack == [101, 115, 116, 116]
         assert self.vm.frames[0].memory.memory == [0]
 
+    def test_relative_jumps(self):
+        self.vm = VirtualMachine("test_file.bin", Namespace(step=None))
+        self.vm.main_loop(
+            [
+                Instruction(LOAD_MEMORY, [1]),
+                Instruction(PUSH_STACK, [1]),
+                Instruction(BINARY_ADD, []),
+                Instruction(DUP_TOP, []),
+                Instruction(STORE_MEMORY, [1]),
+                Instruction(PUSH_STACK, [3]),
+                Instruction(LESS_THAN, []),
+                Instruction(IF_RUN_NEXT, [1]),
+                Instruction(GO_BACK, [8]),
+                Instruction(SKIP_NEXT, [1]),
+                Instruction(PUSH_STACK, [99]),
+                Instruction(PUSH_STACK, [1]),
+            ]
+        )
+
+        assert self.vm.frames[0].memory[1] == 3
+        assert self.vm.stack.stack == [1]
+
+    def test_forwarded_args(self):
+        self.vm = VirtualMachine("test_file.bin", Namespace(step=None))
+        self.vm.main_loop(
+            [
+                # MEMORY[MEMORY[1] + 4] = 9 for MEMORY[1] in 1..3
+                Instruction(MAKE_MARKER, [1]),
+                Instruction(LOAD_MEMORY, [1]),
+                Instruction(PUSH_STACK, [1]),
+                Instruction(BINARY_ADD, []),
+                Instruction(DUP_TOP, []),
+                Instruction(STORE_MEMORY, [1]),
+                Instruction(PUSH_STACK, [9]),
+                Instruction(LOAD_MEMORY, [1]),
+                Instruction(PUSH_STACK, [4]),
+                Instruction(BINARY_ADD, []),
+                Instruction(FORWARD_ARGS, []),
+                Instruction(STORE_MEMORY, []),
+                Instruction(PUSH_STACK, [3]),
+                Instruction(LESS_THAN, []),
+                Instruction(PUSH_STACK, [1]),
+                Instruction(FORWARD_ARGS, []),
+                Instruction(IF_RUN_NEXT, []),
+                Instruction(GOTO_MARKER, [1]),
+                # Read one back
+                Instruction(PUSH_STACK, [6]),
+                Instruction(FORWARD_ARGS, []),
+                Instruction(LOAD_MEMORY, []),
+            ]
+        )
+
+        assert self.vm.frames[0].memory.memory == [0, 3, 0, 0, 0, 9, 9, 9]
+        assert self.vm.stack.stack == [9]
+
+    def test_memory_regions(self, monkeypatch):
+        output = io.StringIO()
+        monkeypatch.setattr("binarypp.vm.vm.stdout", output)
+
+        self.vm = VirtualMachine("test_file.bin", Namespace(step=None))
+        self.vm.main_loop(
+            [
+                # MEMORY[1..3] = "a", MEMORY[4..6] = MEMORY[1..3]
+                Instruction(PUSH_STACK, [1]),
+                Instruction(PUSH_STACK, [3]),
+                Instruction(PUSH_STACK, [97]),
+                Instruction(MEMORY_FILL, []),
+                Instruction(PUSH_STACK, [4]),
+                Instruction(PUSH_STACK, [1]),
+                Instruction(PUSH_STACK, [3]),
+                Instruction(MEMORY_COPY, []),
+                Instruction(PUSH_STACK, [1]),
+                Instruction(PUSH_STACK, [4]),
+                Instruction(PUSH_STACK, [3]),
+                Instruction(MEMORY_COMPARE, []),
+                Instruction(PUSH_STACK, [2]),
+                Instruction(PUSH_STACK, [4]),
+                Instruction(PUSH_STACK, [0]),
+                Instruction(FORWARD_ARGS, []),
+                Instruction(WRITE_REGION_TO, []),
+            ]
+        )
+
+        assert self.vm.frames[0].memory.memory == [0, 97, 97, 97, 97, 97, 97]
+        assert self.vm.stack.stack == [True]
+        assert output.getvalue() == "aaaa"
+
+    def test_limits(self, tmp_path):
+        loop = [
+            Instruction(MAKE_MARKER, [1]),
+            Instruction(PUSH_STACK, [1]),
+            Instruction(GOTO_MARKER, [1]),
+        ]
+        vm = VirtualMachine("test_file.bin", Namespace(step=None, max_stack=100))
+        with pytest.raises(SystemExit):
+            vm.main_loop(list(loop))
+        assert len(vm.stack.stack) == 100
+
+        vm = VirtualMachine(
+            "test_file.bin", Namespace(step=None, max_instructions=1000)
+        )
+        with pytest.raises(SystemExit):
+            vm.main_loop(list(loop))
+        assert vm.stats.instructions == 1001
+
+        vm = VirtualMachine("test_file.bin", Namespace(step=None, max_memory=10))
+        with pytest.raises(SystemExit):
+            vm.main_loop(
+                [
+                    Instruction(PUSH_STACK, [1]),
+                    Instruction(STORE_MEMORY, [9]),
+                    Instruction(PUSH_STACK, [1]),
+                    Instruction(STORE_MEMORY, [10]),
+                ]
+            )
+        assert vm.frames[0].memory.size == 10
+
+        # Memory is only reserved up to the limit
+        vm = VirtualMachine("test_file.bin", Namespace(step=None, max_memory=10))
+        vm.load_stream(0, [Instruction(LOAD_MEMORY, [12])])
+        assert vm.frames[0].memory.size == 1
+
+        path = [ord(c) for c in str(tmp_path / "file.txt")]
+        vm = VirtualMachine("test_file.bin", Namespace(step=None, max_files=1))
+        with pytest.raises(SystemExit):
+            vm.main_loop(
+                [
+                    Instruction(PUSH_STRING_STACK, path),
+                    Instruction(OPEN_FILE, [0b0100]),
+                    Instruction(PUSH_STRING_STACK, path),
+                    Instruction(OPEN_FILE, [0b0100]),
+                ]
+            )
+        assert len(vm.files.handles) == 1
+
+    def test_files(self, tmp_path):
+        path = [ord(c) for c in str(tmp_path / "file.txt")]
+        self.vm = VirtualMachine("test_file.bin", Namespace(step=None))
+        self.vm.main_loop(
+            [
+                Instruction(PUSH_STRING_STACK, path),
+                Instruction(OPEN_FILE, [0b0100]),
+                Instruction(STORE_MEMORY, [1]),
+                Instruction(PUSH_STRING_STACK, [ord("a")]),
+                Instruction(WRITE_TO, [1]),
+            ]
+        )
+
+        # OPEN_FILE gives a handle, whose file is closed at the end
+        assert self.vm.frames[0].memory[1] == 1
+        assert self.vm.files.open_files == {}
+        assert (tmp_path / "file.txt").read_text() == "a"
+
+    def test_static_memory(self):
+        stream = [
+            Instruction(PUSH_STACK, [5]),
+            Instruction(STORE_MEMORY, [3]),
+            Instruction(LOAD_MEMORY, [3]),
+            Instruction(PUSH_STACK, [7]),
+            Instruction(FORWARD_ARGS),
+            Instruction(LOAD_MEMORY),
+        ]
+        vm = VirtualMachine("test_file.bin", Namespace(step=None))
+        vm.main_loop(stream)
+        assert vm.frames[0].memory.memory == [0, 0, 0, 5, 0, 0, 0, 0]
+        assert vm.stack.stack == [5, 0]
+
+        # Stores that don't fit typed memory still turn it into a list
+        vm = VirtualMachine("test_file.bin", Namespace(step=None, int_width=8))
+        vm.main_loop(
+            [Instruction(PUSH_STRING_STACK, [65]), Instruction(STORE_MEMORY, [2])]
+        )
+        assert vm.frames[0].memory.memory[2].data == [65]
+
+        vm = VirtualMachine("test_file.bin", Namespace(step=None))
+        with pytest.raises(SystemExit):
+            vm.main_loop([Instruction(LOAD_MEMORY, [0])])
+
+    def test_marker_redefined(self):
+        self.vm = VirtualMachine("test_file.bin", Namespace(step=None))
+        self.vm.main_loop(
+            [
+                Instruction(PUSH_STACK, [1]),
+                Instruction(STORE_MEMORY, [2]),
+                Instruction(MAKE_MARKER, [1]),
+                Instruction(LOAD_MEMORY, [2]),
+                Instruction(PUSH_STACK, [1]),
+                Instruction(BINARY_ADD, []),
+                Instruction(DUP_TOP, []),
+                Instruction(STORE_MEMORY, [2]),
+                Instruction(PUSH_STACK, [3]),
+                Instruction(LESS_THAN, []),
+                Instruction(IF_RUN_NEXT, [1]),
+                Instruction(GOTO_MARKER, [1]),
+                # Move marker 1 here through a forwarded address
+                Instruction(PUSH_STACK, [1]),
+                Instruction(FORWARD_ARGS, []),
+                Instruction(MAKE_MARKER, []),
+                Instruction(LOAD_MEMORY, [2]),
+                Instruction(PUSH_STACK, [1]),
+                Instruction(BINARY_ADD, []),
+                Instruction(DUP_TOP, []),
+                Instruction(STORE_MEMORY, [2]),
+                Instruction(PUSH_STACK, [5]),
+                Instruction(LESS_THAN, []),
+                Instruction(IF_RUN_NEXT, [1]),
+                Instruction(GOTO_MARKER, [1]),
+            ]
+        )
+
+        frame = self.vm.frames[0]
+        assert frame.memory[2] == 5
+        assert frame.markers[1].inst == 14
+        assert frame.jump_sites == {}
+        assert frame.stream[11].opcode == GOTO_MARKER
+
+    def test_goto_module(self, tmp_path):
+        # SKIP_NEXT 3, MAKE_MARKER 1, PUSH_STACK 7, GOTO_MARKER 0
+        (tmp_path / "module.raw").write_text(
+            "00000000 10100001 00000011 00001110 00000001 "
+            "00000100 00000111 00001111 00000000"
+        )
+
+        self.vm = VirtualMachine(str(tmp_path / "main.raw"), Namespace(step=None))
+        self.vm.main_loop(
+            [
+                Instruction(PUSH_STRING_STACK, [ord(c) for c in "module.raw"]),
+                Instruction(IMPORT_MODULE, [1]),
+                Instruction(MAKE_MARKER, [1]),
+                Instruction(GOTO_MODULE, [1, 1]),
+                Instruction(LOAD_MEMORY, [2]),
+                Instruction(PUSH_STACK, [1]),
+                Instruction(BINARY_ADD, []),
+                Instruction(DUP_TOP, []),
+                Instruction(STORE_MEMORY, [2]),
+                Instruction(PUSH_STACK, [2]),
+                Instruction(LESS_THAN, []),
+                Instruction(IF_RUN_NEXT, [1]),
+                Instruction(GOTO_MARKER, [1]),
+            ]
+        )
+
+        assert self.vm.stack.stack == [7, 7]
+        assert self.vm.frames[1].markers[1].frame == 1
+        assert self.vm.frames[0].stream[3].opcode == JUMP_MODULE
+        assert self.vm.frames[0].stream[3].opargs == [1, 1, 1]
+
 
 # class oldTestVM:
 #     def setup_class(self):